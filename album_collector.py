@@ -0,0 +1,84 @@
+"""
+Album Collector
+Groups the messages of a media album so they can be forwarded together
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ALBUM_WINDOW = 0.6  # seconds without a new part before an album is complete
+MAX_ALBUM_SIZE = 10  # Telegram's limit
+
+class AlbumCollector:
+    """Buffers album parts keyed on (chat_id, grouped_id).
+
+    An album is handed to the callback once no new part has arrived for
+    the collection window, or as soon as it reaches Telegram's size limit.
+    """
+
+    def __init__(self, on_album: Callable[[List], Awaitable], window: float = ALBUM_WINDOW):
+        self.on_album = on_album
+        self.window = window
+        self.pending: Dict[Tuple[int, int], List] = {}
+        self.timers: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        self.album_tasks: Dict[asyncio.Task, int] = {}  # album being forwarded -> its chat
+
+    def add(self, event):
+        """Buffer one album part"""
+        key = (event.chat_id, event.message.grouped_id)
+        parts = self.pending.setdefault(key, [])
+        parts.append(event)
+
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        if len(parts) >= MAX_ALBUM_SIZE:
+            self._flush(key)
+        else:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def _flush(self, key: Tuple[int, int]):
+        """Hand a complete album to the callback"""
+        self.timers.pop(key, None)
+        events = self.pending.pop(key, None)
+        if not events:
+            return
+
+        events.sort(key=lambda event: event.message.id)
+        task = asyncio.create_task(self._deliver(events))
+        self.album_tasks[task] = key[0]
+        task.add_done_callback(lambda done: self.album_tasks.pop(done, None))
+
+    async def _deliver(self, events: List):
+        """Run the callback for one album"""
+        try:
+            await self.on_album(events)
+        except Exception as e:
+            logger.error(f"Error processing album {events[0].message.grouped_id}: {e}")
+
+    async def flush_chat(self, chat_id: int):
+        """Hand over a chat's buffered albums now and wait until they are forwarded"""
+        for key in [key for key in self.pending if key[0] == chat_id]:
+            timer = self.timers.get(key)
+            if timer is not None:
+                timer.cancel()
+            self._flush(key)
+
+        tasks = [task for task, task_chat in self.album_tasks.items() if task_chat == chat_id]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def flush_all(self):
+        """Hand over every buffered album now and wait for them"""
+        for key in list(self.pending):
+            timer = self.timers.get(key)
+            if timer is not None:
+                timer.cancel()
+            self._flush(key)
+
+        if self.album_tasks:
+            await asyncio.gather(*self.album_tasks, return_exceptions=True)
@@ -60,6 +60,7 @@ async def main():
 
         # Start forwarding engine    
         await userbot.forwarding_engine.start()    
+        await userbot.forwarding_engine.replay_pending_deliveries()    
 
         # Register message handlers    
         userbot._register_handlers()    
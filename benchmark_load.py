@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Load Benchmark
+Drives the real userbot handlers with a fake client and reports throughput, latency and memory
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from bot_manager import TelegramUserbot
+from fake_client import FakeTelegramClient
+
+SOURCE_BASE = 1000000000  # bare channel ids, marked as -100<id>
+DESTINATION_BASE = 2000000000
+UNLIMITED_RATES = {
+    'account_rate': 1e9,
+    'account_burst': 10 ** 9,
+    'destination_rate': 1e9,
+    'destination_burst': 10 ** 9,
+    'max_concurrent_sends': 1000,
+}
+
+def marked(bare_id: int) -> int:
+    """Marked channel id"""
+    return int(f"-100{bare_id}")
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def random_word(rng: random.Random, length: int) -> str:
+    """Make a lowercase word of the given length"""
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+async def run_scenario(scenario: Dict) -> Dict:
+    """Run one scenario in this process and measure it"""
+    rng = random.Random(scenario['seed'])
+    os.chdir(tempfile.mkdtemp(prefix='userbot-bench-'))
+
+    sources = [marked(SOURCE_BASE + i) for i in range(scenario['sources'])]
+    client = FakeTelegramClient(
+        latency=scenario['latency'],
+        jitter=scenario['jitter'],
+        flood_rate=scenario['flood_rate'],
+        flood_seconds=scenario['flood_seconds'],
+        seed=scenario['seed']
+    )
+    userbot = TelegramUserbot(0, '', client=client)
+    await userbot.config_manager.set_setting('metrics_port', 0)
+    # Every benchmark edit is distinct, so push them at once instead of timing the debounce window
+    await userbot.config_manager.set_setting('edit_debounce_window', 0)
+    if not scenario['rate_limits']:
+        for key, value in UNLIMITED_RATES.items():
+            await userbot.config_manager.set_setting(key, value)
+    await userbot.start()
+
+    # Each rule reads one source and writes to its own destinations
+    copies_per_source = {source: 0 for source in sources}
+    for i in range(scenario['rules']):
+        source = sources[i % len(sources)]
+        destinations = [
+            marked(DESTINATION_BASE + i * scenario['destinations'] + j) for j in range(scenario['destinations'])
+        ]
+        await userbot.forwarding_engine.add_forwarding_rule(f"rule{i}", [source], destinations)
+        copies_per_source[source] += len(destinations)
+
+    originals = []
+    for i in range(scenario['replacements']):
+        original = f"@{random_word(rng, 6)}"
+        originals.append(original)
+        await userbot.replacement_engine.add_replacement_rule(f"simple{i}", original, f"@{random_word(rng, 6)}")
+
+    def make_text(n: int) -> str:
+        # The m<n>| marker ties copies back to their source message
+        words = [random_word(rng, rng.randint(3, 9)) for _ in range(scenario['words'])]
+        for _ in range(min(3, len(originals))):
+            words[rng.randrange(len(words))] = rng.choice(originals)
+        return f"m{n}| " + ' '.join(words)
+
+    texts = [make_text(n) for n in range(scenario['messages'])]
+    expected_copies = 0
+    emitted_at = {}
+    posted = []
+
+    start = time.perf_counter()
+    interval = 1 / scenario['rate'] if scenario['rate'] else 0
+    for n, text in enumerate(texts):
+        source = sources[n % len(sources)]
+        emitted_at[n] = time.perf_counter()
+        posted.append(client.emit_new_message(source, text))
+        expected_copies += copies_per_source[source]
+        if interval:
+            await asyncio.sleep(interval)
+        elif n % 100 == 99:
+            await asyncio.sleep(0)
+
+    deadline = time.perf_counter() + scenario['timeout']
+    while time.perf_counter() < deadline:
+        await client.wait_idle()
+        if sum(1 for record in client.sent if record.kind != 'edit') >= expected_copies:
+            break
+        await asyncio.sleep(0.01)
+
+    finished = {}
+    copies = 0
+    for record in client.sent:
+        if record.kind == 'edit' or not record.text or not record.text.startswith('m'):
+            continue
+        copies += 1
+        n = int(record.text[1:record.text.index('|')])
+        finished[n] = max(finished.get(n, 0.0), record.time)
+
+    latencies = [finished[n] - emitted_at[n] for n in finished]
+    elapsed = (max(finished.values()) if finished else time.perf_counter()) - start
+
+    # Edits of a sample of the posted messages, mirrored onto every copy
+    edit_count = int(len(posted) * scenario['edit_ratio'])
+    edits_before = sum(1 for record in client.sent if record.kind == 'edit')
+    edit_start = time.perf_counter()
+    for message in posted[:edit_count]:
+        client.emit_edit(message, message.message + ' (edited)')
+    expected_edits = sum(copies_per_source[message.chat_id] for message in posted[:edit_count])
+    while time.perf_counter() < deadline:
+        await client.wait_idle()
+        if sum(1 for record in client.sent if record.kind == 'edit') - edits_before >= expected_edits:
+            break
+        await asyncio.sleep(0.01)
+    edits_done = sum(1 for record in client.sent if record.kind == 'edit') - edits_before
+    edit_elapsed = time.perf_counter() - edit_start
+
+    dispatcher_stats = userbot.dispatcher.get_stats()
+    await userbot.stop()
+
+    return dict(
+        scenario,
+        messages_forwarded=len(finished),
+        copies_sent=copies,
+        copies_expected=expected_copies,
+        messages_per_second=round(len(finished) / elapsed, 1) if elapsed > 0 else 0.0,
+        copies_per_second=round(copies / elapsed, 1) if elapsed > 0 else 0.0,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+        max_ms=round(max(latencies, default=0.0) * 1000, 2),
+        edits_per_second=round(edits_done / edit_elapsed, 1) if edits_done and edit_elapsed > 0 else 0.0,
+        edits_sent=edits_done,
+        flood_waits=client.floods,
+        handler_avg_ms=dispatcher_stats['forwardable']['avg_ms'],
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+def run_isolated(scenario: Dict) -> Dict:
+    """Run a scenario in a fresh interpreter so memory and metrics don't carry over"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-one', json.dumps(scenario)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Scenario {scenario} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def check_regressions(results: List[Dict], baseline_file: str, tolerance: float) -> List[str]:
+    """Compare results with a saved run; returns a line per regression"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    keys = ('rules', 'sources', 'destinations', 'replacements')
+    previous = {tuple(run[key] for key in keys): run for run in baseline}
+    regressions = []
+    for run in results:
+        before = previous.get(tuple(run[key] for key in keys))
+        if before is None:
+            continue
+        name = ', '.join(f"{key}={run[key]}" for key in keys)
+        if run['messages_per_second'] < before['messages_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['messages_per_second']} -> {run['messages_per_second']} msg/s")
+        if run['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {before['p99_ms']} -> {run['p99_ms']} ms")
+        if run['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: memory {before['peak_rss_mb']} -> {run['peak_rss_mb']} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--sources', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--destinations', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--replacements', type=int, nargs='+', default=[0, 50])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=0, help='messages per second; 0 posts them all at once')
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds per fake API call')
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='share of calls that get a FloodWait')
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--edit-ratio', type=float, default=0.1)
+    parser.add_argument('--rate-limits', action='store_true', help='keep the default outbound rate limits')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(asyncio.run(run_scenario(json.loads(args.run_one)))))
+        return
+
+    results = []
+    for rules, sources, destinations, replacements in itertools.product(
+            args.rules, args.sources, args.destinations, args.replacements):
+        if sources > rules:
+            continue  # extra sources would have no rule reading them
+        results.append(run_isolated({
+            'rules': rules,
+            'sources': sources,
+            'destinations': destinations,
+            'replacements': replacements,
+            'messages': args.messages,
+            'words': args.words,
+            'rate': args.rate,
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'flood_rate': args.flood_rate,
+            'flood_seconds': args.flood_seconds,
+            'edit_ratio': args.edit_ratio,
+            'rate_limits': args.rate_limits,
+            'timeout': args.timeout,
+            'seed': args.seed,
+        }))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'rules':>5} {'srcs':>5} {'dests':>5} {'repl':>5} {'msg/s':>9} {'copies/s':>9} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'edits/s':>8} {'rss MB':>7}")
+        for r in results:
+            print(f"{r['rules']:>5} {r['sources']:>5} {r['destinations']:>5} {r['replacements']:>5} "
+                  f"{r['messages_per_second']:>9} {r['copies_per_second']:>9} {r['p50_ms']:>8} {r['p99_ms']:>8} "
+                  f"{r['edits_per_second']:>8} {r['peak_rss_mb']:>7}")
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
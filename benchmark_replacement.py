@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Replacement Benchmark
+Compares the compiled replacement pipeline with the rule-by-rule path
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import string
+import tempfile
+import time
+
+from config_manager import ConfigManager
+from replacement_engine import ReplacementEngine
+
+def random_word(rng: random.Random, length: int) -> str:
+    """Make a lowercase word of the given length"""
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+async def build_engine(rng: random.Random, rule_count: int) -> ReplacementEngine:
+    """Create an engine with a realistic mix of rule types"""
+    config_dir = tempfile.mkdtemp()
+    engine = ReplacementEngine(ConfigManager(os.path.join(config_dir, 'bench_config.json')))
+
+    for i in range(rule_count):
+        kind = rng.random()
+        if kind < 0.7:
+            await engine.add_replacement_rule(f"simple{i}", f"@{random_word(rng, 6)}", f"@{random_word(rng, 6)}")
+        elif kind < 0.85:
+            await engine.add_replacement_rule(f"rule{i}_regex", f"(https?://{random_word(rng, 5)}\\.\\w+)", "https://example.org")
+        else:
+            parts = ', '.join(
+                f"url:t.me/{random_word(rng, 5)} -> t.me/{random_word(rng, 5)}" if j % 2 else
+                f"{random_word(rng, 5)} -> {random_word(rng, 5)}"
+                for j in range(4)
+            )
+            await engine.add_replacement_rule(f"aio{i}", "[[ALL_IN_ONE]]", parts)
+
+    return engine
+
+async def check_edge_cases():
+    """Compare both paths on rules that are easy to get wrong"""
+    config_dir = tempfile.mkdtemp()
+    engine = ReplacementEngine(ConfigManager(os.path.join(config_dir, 'edge_config.json')))
+    await engine.add_replacement_rule('empty', '[[ALL_IN_ONE]]', '"" -> x, foo -> bar')
+    await engine.add_replacement_rule('empty_url', '[[ALL_IN_ONE]]', 'url:->y, ab -> ba')
+    await engine.add_replacement_rule('overlap', '[[ALL_IN_ONE]]', 'aa -> a, a -> aa, ba -> ")')
+
+    for text in ('foo', 'aaa bab', 'foo ab aa', 'x'):
+        if await engine.process_text(text) != await engine.process_text_sequential(text):
+            raise SystemExit(f"Output mismatch on edge-case rules for: {text}")
+
+def build_texts(rng: random.Random, engine: ReplacementEngine, count: int, words: int):
+    """Create posts that contain some of the rules' originals"""
+    originals = [
+        rule['original'] for rule in engine.replacement_rules.values() if rule['type'] == 'simple'
+    ]
+    texts = []
+    for _ in range(count):
+        tokens = [random_word(rng, rng.randint(3, 9)) for _ in range(words)]
+        for _ in range(min(5, len(originals))):
+            tokens[rng.randrange(words)] = rng.choice(originals)
+        texts.append(' '.join(tokens))
+    return texts
+
+async def time_path(process, texts, rounds: int) -> float:
+    """Seconds per text for one processing path"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            await process(text)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--texts', type=int, default=200)
+    parser.add_argument('--words', type=int, default=150)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    await check_edge_cases()
+
+    for rule_count in args.rules:
+        rng = random.Random(args.seed)
+        engine = await build_engine(rng, rule_count)
+        texts = build_texts(rng, engine, args.texts, args.words)
+
+        for text in texts:
+            if await engine.process_text(text) != await engine.process_text_sequential(text):
+                raise SystemExit(f"Output mismatch with {rule_count} rules for: {text[:80]}")
+
+        async def compiled_path(text):
+            # Bypass the result cache so repeated rounds measure the pipeline
+            return engine.pipeline.apply(text)
+
+        sequential = await time_path(engine.process_text_sequential, texts, args.rounds)
+        compiled = await time_path(compiled_path, texts, args.rounds)
+        results.append({
+            'rules': rule_count,
+            'passes': engine.pipeline.step_count,
+            'sequential_us': round(sequential * 1e6, 1),
+            'compiled_us': round(compiled * 1e6, 1),
+            'speedup': round(sequential / compiled, 2),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'rules':>6} {'passes':>7} {'sequential us':>14} {'compiled us':>12} {'speedup':>8}")
+    for r in results:
+        print(f"{r['rules']:>6} {r['passes']:>7} {r['sequential_us']:>14} {r['compiled_us']:>12} {r['speedup']:>7}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
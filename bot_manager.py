@@ -3,69 +3,51 @@ Telegram Userbot Manager
 Handles Telegram client initialization and message processing
 """
 
-import asyncio
 import logging
-from telethon import TelegramClient, events
+import os
+from telethon import TelegramClient
 from telethon.tl.types import User, Channel, Chat
 
 from command_handler import CommandHandler
 from forwarding_engine import ForwardingEngine
-from replacement_engine import ReplacementEngine
 from config_manager import ConfigManager
+from update_dispatcher import UpdateDispatcher
+from metrics import MetricsServer, DEFAULT_METRICS_HOST, DEFAULT_METRICS_PORT
 
 logger = logging.getLogger(__name__)
 
 class TelegramUserbot:
-    def __init__(self, api_id, api_hash):
+    def __init__(self, api_id, api_hash, client=None):
         self.api_id = api_id
         self.api_hash = api_hash
-        self.client = TelegramClient('session', api_id, api_hash)
+        self.client = client or TelegramClient('session', api_id, api_hash)
 
         # Initialize components
-        self.config_manager = ConfigManager()
+        self.config_manager = ConfigManager(storage=os.environ.get('USERBOT_CONFIG_STORAGE', 'json'))
         self.forwarding_engine = ForwardingEngine(self.client, self.config_manager)
-        self.replacement_engine = ReplacementEngine(self.config_manager)
+        # Commands must change the rules the forwarding engine applies
+        self.replacement_engine = self.forwarding_engine.replacement_engine
+        self.replacement_engine.on_quarantine = self._notify_owner
         self.command_handler = CommandHandler(
             self.client,
             self.forwarding_engine,
             self.replacement_engine,
             self.config_manager
         )
+        self.metrics_server = MetricsServer()
+        self.dispatcher = UpdateDispatcher(
+            self.client,
+            self.command_handler,
+            self.forwarding_engine,
+            self.config_manager
+        )
 
         # Register event handlers
         self._register_handlers()
 
     def _register_handlers(self):
         """Register message event handlers"""
-
-        @self.client.on(events.NewMessage(pattern=r'^/'))
-        async def handle_command(event):
-            """Handle command messages"""
-            try:
-                await self.command_handler.handle_command(event)
-            except Exception as e:
-                logger.error(f"Command handling error: {e}")
-                await event.reply(f"❌ Error: {e}")
-
-        @self.client.on(events.NewMessage())
-        async def handle_message(event):
-            """Handle regular messages for forwarding"""
-            try:
-                if event.message.text and event.message.text.startswith('/'):
-                    return
-
-                await self.forwarding_engine.process_message(event)
-
-            except Exception as e:
-                logger.error(f"Message processing error: {e}")
-
-        @self.client.on(events.MessageEdited())
-        async def handle_edited_message(event):
-            """Handle edited messages"""
-            try:
-                await self.forwarding_engine.process_edited_message(event)
-            except Exception as e:
-                logger.error(f"Edited message processing error: {e}")
+        self.dispatcher.register(self.client)
 
     async def start(self):
         """Start the Telegram client"""
@@ -76,7 +58,10 @@ class TelegramUserbot:
             logger.info(f"✅ Logged in as: {me.username} ({me.id})")
 
             await self.config_manager.load_config()
+            await self._add_sender_accounts()
             await self.forwarding_engine.start()
+            await self.forwarding_engine.replay_pending_deliveries()
+            await self._start_metrics_server()
 
             return True
 
@@ -84,6 +69,38 @@ class TelegramUserbot:
             logger.error(f"❌ Failed to start userbot: {e}")
             raise
 
+    async def _start_metrics_server(self):
+        """Serve metrics locally unless metrics_port is set to 0"""
+        port = await self.config_manager.get_setting('metrics_port', DEFAULT_METRICS_PORT)
+        if not port:
+            return
+        try:
+            await self.metrics_server.start(
+                await self.config_manager.get_setting('metrics_host', DEFAULT_METRICS_HOST), port
+            )
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {port}: {e}")
+
+    async def _notify_owner(self, text: str):
+        """Send a notice to the owner's Saved Messages"""
+        await self.client.send_message('me', text)
+
+    async def _add_sender_accounts(self):
+        """Connect the extra sending accounts listed in the sender_sessions setting"""
+        client_pool = self.forwarding_engine.client_pool
+        for session in await self.config_manager.get_setting('sender_sessions', []):
+            if session in client_pool.accounts:
+                continue
+
+            client = TelegramClient(session, self.api_id, self.api_hash)
+            await client.connect()
+            if not await client.is_user_authorized():
+                logger.warning(f"Sender session {session} is not authorized, skipping it")
+                await client.disconnect()
+                continue
+
+            client_pool.add_sender(session, client)
+
     async def run_forever(self):
         """Keep the bot running"""
         try:
@@ -95,13 +112,15 @@ class TelegramUserbot:
             raise
         finally:
             await self.forwarding_engine.stop()
-            await self.config_manager.save_config()
+            await self.config_manager.flush()
 
     async def stop(self):
         """Stop the userbot"""
         try:
             await self.forwarding_engine.stop()
-            await self.config_manager.save_config()
+            await self.config_manager.flush()
+            await self.metrics_server.stop()
+            await self.forwarding_engine.client_pool.disconnect_senders()
             await self.client.disconnect()
             logger.info("✅ Userbot stopped successfully")
         except Exception as e:
@@ -0,0 +1,171 @@
+"""
+Client Pool
+Spreads outbound sends across several authorized accounts
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from telethon import utils
+
+from media_cache import MediaCache, DEFAULT_MAX_MEDIA
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+LISTENER = 'listener'
+
+class PooledAccount:
+    """One account that can send copies"""
+
+    def __init__(self, name: str, client, chats: Optional[Set[int]] = None):
+        self.name = name
+        self.client = client
+        self.chats = chats  # marked ids the account is in; None means not checked
+        self.rate_limiter = RateLimiter()
+        self.media_cache = MediaCache(client, fetch_on_miss=name != LISTENER)
+        self.in_flight = 0
+        self.sent = 0
+        self.failures = 0
+
+    def can_reach(self, chat_id: Optional[int]) -> bool:
+        """Check whether the account is a member of a chat"""
+        return chat_id is None or self.chats is None or chat_id in self.chats
+
+class ClientPool:
+    """Listener account plus optional sender accounts.
+
+    The listener receives updates and can always be used to send. Each
+    send goes to the least loaded account that is a member of the
+    destination, and of the source too when the copy needs its media. An
+    account that hits a FloodWait or fails is skipped for that send while
+    other candidates remain. The last candidate waits out FloodWaits
+    through its own rate limiter. Edits go to the account that sent the
+    copy, since no other account can edit it.
+    """
+
+    def __init__(self, listener):
+        self.accounts: Dict[str, PooledAccount] = {LISTENER: PooledAccount(LISTENER, listener)}
+        self.rate_settings: Dict[str, Any] = {}
+        self.failovers = 0
+        self.peer_cache = None  # PeerCache that learns each account's peers from its dialogs
+
+    @property
+    def listener(self) -> PooledAccount:
+        return self.accounts[LISTENER]
+
+    def set_listener(self, client):
+        """Use a different client as the listener"""
+        account = self.listener
+        account.client = client
+        account.media_cache.client = client
+
+    def add_sender(self, name: str, client):
+        """Add an authorized account that only sends"""
+        if name in self.accounts:
+            raise ValueError(f"Account '{name}' is already in the pool")
+
+        account = PooledAccount(name, client, chats=set())
+        account.rate_limiter = RateLimiter(**self.rate_settings)
+        self.accounts[name] = account
+        logger.info(f"Added sender account {name}")
+
+    def configure(self, rate_settings: Dict[str, Any], media_cache_max_entries: int = DEFAULT_MAX_MEDIA):
+        """Apply rate limits and cache size to every account, keeping active FloodWait pauses"""
+        self.rate_settings = dict(rate_settings)
+        for account in self.accounts.values():
+            account.rate_limiter.update(**self.rate_settings)
+            account.media_cache.max_entries = media_cache_max_entries
+
+    async def refresh_memberships(self):
+        """Learn which chats each sender account is a member of"""
+        for account in self.accounts.values():
+            if account.chats is None:
+                continue
+            try:
+                if self.peer_cache is not None:
+                    account.chats = await self.peer_cache.load_dialogs(account.name, account.client)
+                else:
+                    account.chats = {
+                        utils.get_peer_id(dialog.entity) async for dialog in account.client.iter_dialogs()
+                    }
+                logger.info(f"Account {account.name} is in {len(account.chats)} chats")
+            except Exception as e:
+                logger.error(f"Error loading chats of account {account.name}: {e}")
+
+    async def disconnect_senders(self):
+        """Disconnect every account except the listener"""
+        for account in list(self.accounts.values()):
+            if account.name == LISTENER:
+                continue
+            try:
+                await account.client.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting account {account.name}: {e}")
+            del self.accounts[account.name]
+
+    def candidates(self, destination: int, source: Optional[int] = None, skip: Set[str] = ()) -> List[PooledAccount]:
+        """Accounts that can send to destination, least loaded first"""
+        accounts = [
+            account for account in self.accounts.values()
+            if account.name not in skip and account.can_reach(destination) and account.can_reach(source)
+        ]
+        accounts.sort(key=lambda account: (
+            account.rate_limiter.paused_for(destination),
+            account.in_flight,
+            account.sent,
+        ))
+        return accounts
+
+    async def call(self, destination: int, func: Callable[..., Awaitable], *args,
+                   source: Optional[int] = None) -> Any:
+        """Run func(account, *args) for a send to destination; returns (account name, result)"""
+        tried = set()
+
+        while True:
+            accounts = self.candidates(destination, source, tried)
+            if not accounts:
+                raise ValueError(f"No account can send to {destination}")
+
+            account = accounts[0]
+            last = len(accounts) == 1
+            account.in_flight += 1
+            try:
+                if last:
+                    result = await account.rate_limiter.call(destination, func, account, *args)
+                else:
+                    result = await account.rate_limiter.try_call(destination, func, account, *args)
+                account.sent += 1
+                return account.name, result
+            except Exception as e:
+                account.failures += 1
+                if last:
+                    raise
+                tried.add(account.name)
+                self.failovers += 1
+                logger.warning(f"Account {account.name} failed sending to {destination} ({e}), failing over")
+            finally:
+                account.in_flight -= 1
+
+    async def call_as(self, name: Optional[str], destination: int, func: Callable[..., Awaitable], *args) -> Any:
+        """Run func(account, *args) with one specific account"""
+        account = self.accounts.get(name or LISTENER)
+        if account is None:
+            raise ValueError(f"Account '{name}' is not in the pool")
+        return await account.rate_limiter.call(destination, func, account, *args)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-account load and throttling statistics"""
+        return {
+            'failovers': self.failovers,
+            'accounts': {
+                name: dict(
+                    account.rate_limiter.get_stats(),
+                    sent=account.sent,
+                    failures=account.failures,
+                    in_flight=account.in_flight,
+                    chats=len(account.chats) if account.chats is not None else None,
+                )
+                for name, account in self.accounts.items()
+            },
+        }
@@ -1,200 +1,304 @@
-""" Command Handler Processes user commands for forwarding and replacement operations """
-
-import re import logging from telethon.tl.types import Channel, Chat, User from utils import parse_channel_ids, format_channel_list
-
-logger = logging.getLogger(name)
-
-class CommandHandler: def init(self, client, forwarding_engine, replacement_engine, config_manager): self.client = client self.forwarding_engine = forwarding_engine self.replacement_engine = replacement_engine self.config_manager = config_manager
-
-async def handle_command(self, event):
-    """Process incoming commands"""
-    text = event.message.text.strip()
-    
-    # Parse command
-    parts = text.split()
-    if not parts:
-        return
-    
-    command = parts[0].lower()
-    
-    try:
-        if command == '/forward':
-            await self._handle_forward_command(event, parts[1:])
-        elif command == '/replace':
-            await self._handle_replace_command(event, parts[1:])
-        elif command == '/getchannel':
-            await self._handle_getchannel_command(event)
+"""
+Command Handler
+Processes user commands for forwarding and replacement operations
+"""
+
+import re
+import logging
+from telethon.tl.types import Channel, Chat, User
+from utils import parse_channel_ids, format_channel_list
+
+logger = logging.getLogger(__name__)
+
+STATS_TOP_RULES = 10  # busiest rules listed by /forward stats; the rest are summed up
+
+class CommandHandler:
+    def __init__(self, client, forwarding_engine, replacement_engine, config_manager):
+        self.client = client
+        self.forwarding_engine = forwarding_engine
+        self.replacement_engine = replacement_engine
+        self.config_manager = config_manager
+
+    async def handle_command(self, event):
+        """Process incoming commands"""
+        text = event.message.text.strip()
+
+        # Parse command
+        parts = text.split()
+        if not parts:
+            return
+
+        command = parts[0].lower()
+
+        try:
+            if command == '/forward':
+                await self._handle_forward_command(event, parts[1:])
+            elif command == '/replace':
+                await self._handle_replace_command(event, parts[1:])
+            elif command == '/getchannel':
+                await self._handle_getchannel_command(event)
+            else:
+                await event.reply("❌ Unknown command. Use /forward, /replace, or /getchannel")
+
+        except Exception as e:
+            logger.error(f"Command error: {e}")
+            await event.reply(f"❌ Error: {e}")
+
+    # Forward Commands
+    async def _handle_forward_command(self, event, args):
+        """Handle forward commands"""
+        if not args:
+            await event.reply(
+                "📋 Forward Commands:\n"
+                "/forward add [LABEL] [SOURCE_ID] -> [DESTINATION_ID]\n"
+                "/forward remove [LABEL]\n"
+                "/forward start [LABEL]\n"
+                "/forward stop [LABEL]\n"
+                "/forward delay [LABEL] [SECONDS]\n"
+                "/forward max_time_edit [LABEL] [SECONDS]\n"
+                "/forward batch [LABEL] [SECONDS] [MAX_SIZE]\n"
+                "/forward dedup [LABEL] [SECONDS]\n"
+                "/forward restart\n"
+                "/forward task\n"
+                "/forward stats"
+            )
+            return
+
+        subcommand = args[0].lower()
+        if subcommand == 'add':
+            await self._handle_forward_add(event, args[1:])
+        elif subcommand == 'remove':
+            await self._handle_forward_remove(event, args[1:])
+        elif subcommand == 'start':
+            await self._handle_forward_start(event, args[1:])
+        elif subcommand == 'stop':
+            await self._handle_forward_stop(event, args[1:])
+        elif subcommand == 'delay':
+            await self._handle_forward_delay(event, args[1:])
+        elif subcommand == 'max_time_edit':
+            await self._handle_forward_max_time_edit(event, args[1:])
+        elif subcommand == 'batch':
+            await self._handle_forward_batch(event, args[1:])
+        elif subcommand == 'dedup':
+            await self._handle_forward_dedup(event, args[1:])
+        elif subcommand == 'restart':
+            await self._handle_forward_restart(event)
+        elif subcommand == 'task':
+            await self._handle_forward_task(event)
+        elif subcommand == 'stats':
+            await self._handle_forward_stats(event)
         else:
-            await event.reply("\u274c Unknown command. Use /forward, /replace, or /getchannel")
-    
-    except Exception as e:
-        logger.error(f"Command error: {e}")
-        await event.reply(f"\u274c Error: {e}")
-
-# Forward Commands
-async def _handle_forward_command(self, event, args):
-    """Handle forward commands"""
-    if not args:
-        await event.reply(
-            "\ud83d\udccb Forward Commands:\n"
-            "/forward add [LABEL] [SOURCE_ID] -> [DESTINATION_ID]\n"
-            "/forward remove [LABEL]\n"
-            "/forward start [LABEL]\n"
-            "/forward stop [LABEL]\n"
-            "/forward delay [LABEL] [SECONDS]\n"
-            "/forward max_time_edit [LABEL] [SECONDS]\n"
-            "/forward restart\n"
-            "/forward task"
-        )
-        return
-
-    subcommand = args[0].lower()
-    if subcommand == 'add':
-        await self._handle_forward_add(event, args[1:])
-    elif subcommand == 'remove':
-        await self._handle_forward_remove(event, args[1:])
-    elif subcommand == 'start':
-        await self._handle_forward_start(event, args[1:])
-    elif subcommand == 'stop':
-        await self._handle_forward_stop(event, args[1:])
-    elif subcommand == 'delay':
-        await self._handle_forward_delay(event, args[1:])
-    elif subcommand == 'max_time_edit':
-        await self._handle_forward_max_time_edit(event, args[1:])
-    elif subcommand == 'restart':
-        await self._handle_forward_restart(event)
-    elif subcommand == 'task':
-        await self._handle_forward_task(event)
-    else:
-        await event.reply("\u274c Unknown forward subcommand")
-
-async def _handle_forward_add(self, event, args):
-    if len(args) < 3 or '->' not in ' '.join(args):
-        await event.reply("\u274c Usage: /forward add [LABEL] [SOURCE_ID] -> [DESTINATION_ID]")
-        return
-
-    text = ' '.join(args)
-    parts = text.split('->')
-    left_part = parts[0].strip().split()
-    right_part = parts[1].strip()
-
-    label = left_part[0]
-    source_ids_str = ' '.join(left_part[1:])
-    try:
-        source_ids = parse_channel_ids(source_ids_str)
-        destination_ids = parse_channel_ids(right_part)
-        await self.forwarding_engine.add_forwarding_rule(label, source_ids, destination_ids)
-        await event.reply(f"\u2705 Added forwarding rule '{label}'\n"
-                          f"\ud83d\udce4 Sources: {', '.join(map(str, source_ids))}\n"
-                          f"\ud83d\udce5 Destinations: {', '.join(map(str, destination_ids))}")
-    except Exception as e:
-        await event.reply(f"\u274c Error adding forwarding rule: {e}")
-
-async def _handle_forward_remove(self, event, args):
-    if not args:
-        await event.reply("\u274c Usage: /forward remove [LABEL]")
-        return
-    label = args[0]
-    try:
-        await self.forwarding_engine.remove_forwarding_rule(label)
-        await event.reply(f"\u2705 Removed forwarding rule '{label}'")
-    except Exception as e:
-        await event.reply(f"\u274c Error removing forwarding rule: {e}")
-
-async def _handle_forward_start(self, event, args):
-    if not args:
-        await event.reply("\u274c Usage: /forward start [LABEL]")
-        return
-    label = args[0]
-    try:
-        await self.forwarding_engine.start_forwarding_rule(label)
-        await event.reply(f"\u25b6\ufe0f Started forwarding rule '{label}'")
-    except Exception as e:
-        await event.reply(f"\u274c Error starting forwarding rule: {e}")
-
-async def _handle_forward_stop(self, event, args):
-    if not args:
-        await event.reply("\u274c Usage: /forward stop [LABEL]")
-        return
-    label = args[0]
-    try:
-        await self.forwarding_engine.stop_forwarding_rule(label)
-        await event.reply(f"\u23f9\ufe0f Stopped forwarding rule '{label}'")
-    except Exception as e:
-        await event.reply(f"\u274c Error stopping forwarding rule: {e}")
-
-async def _handle_forward_delay(self, event, args):
-    if len(args) < 2:
-        await event.reply("\u274c Usage: /forward delay [LABEL] [SECONDS]")
-        return
-    label = args[0]
-    try:
-        delay = int(args[1])
-        await self.forwarding_engine.set_forwarding_delay(label, delay)
-        await event.reply(f"\u23f1\ufe0f Set delay for '{label}' to {delay} seconds")
-    except Exception as e:
-        await event.reply(f"\u274c Error setting delay: {e}")
-
-async def _handle_forward_max_time_edit(self, event, args):
-    if len(args) < 2:
-        await event.reply("\u274c Usage: /forward max_time_edit [LABEL] [SECONDS]")
-        return
-    label = args[0]
-    try:
-        max_time = int(args[1])
-        await self.forwarding_engine.set_max_edit_time(label, max_time)
-        await event.reply(f"\u23f0 Set max edit time for '{label}' to {max_time} seconds")
-    except Exception as e:
-        await event.reply(f"\u274c Error setting max edit time: {e}")
-
-async def _handle_forward_restart(self, event):
-    try:
-        await self.forwarding_engine.restart()
-        await event.reply("\ud83d\udd04 Forwarding engine restarted")
-    except Exception as e:
-        await event.reply(f"\u274c Error restarting: {e}")
-
-async def _handle_forward_task(self, event):
-    try:
-        tasks = await self.forwarding_engine.get_active_tasks()
-        if not tasks:
-            await event.reply("\ud83d\udccb No active forwarding tasks")
+            await event.reply("❌ Unknown forward subcommand")
+
+    async def _handle_forward_add(self, event, args):
+        if len(args) < 3 or '->' not in ' '.join(args):
+            await event.reply("❌ Usage: /forward add [LABEL] [SOURCE_ID] -> [DESTINATION_ID]")
             return
-        message = "\ud83d\udccb Active Forwarding Tasks:\n\n"
-        for task in tasks:
-            status = "\u25b6\ufe0f" if task['active'] else "\u23f8\ufe0f"
-            message += f"{status} {task['label']}\n"
-            message += f"   \ud83d\udce4 Sources: {', '.join(map(str, task['sources']))}\n"
-            message += f"   \ud83d\udce5 Destinations: {', '.join(map(str, task['destinations']))}\n"
-            message += f"   \u23f1\ufe0f Delay: {task['delay']}s\n"
-            message += f"   \u23f0 Max Edit: {task['max_edit_time']}s\n\n"
-        await event.reply(message)
-    except Exception as e:
-        await event.reply(f"\u274c Error getting tasks: {e}")
-
-# Replace Commands - OMITTED for BREVITY
-
-# GetChannel Command
-async def _handle_getchannel_command(self, event):
-    try:
-        channels = []
-        async for dialog in self.client.iter_dialogs():
-            entity = dialog.entity
-            if getattr(entity, 'broadcast', False) or getattr(entity, 'megagroup', False):
-                channels.append({
-                    'title': dialog.title,
-                    'id': entity.id,
-                    'username': getattr(entity, 'username', None)
-                })
-        if not channels:
-            await event.reply("\ud83d\udce2 No channels found")
+
+        text = ' '.join(args)
+        parts = text.split('->')
+        left_part = parts[0].strip().split()
+        right_part = parts[1].strip()
+
+        label = left_part[0]
+        source_ids_str = ' '.join(left_part[1:])
+        try:
+            source_ids = parse_channel_ids(source_ids_str)
+            destination_ids = parse_channel_ids(right_part)
+            await self.forwarding_engine.add_forwarding_rule(label, source_ids, destination_ids)
+            await event.reply(f"✅ Added forwarding rule '{label}'\n"
+                              f"📤 Sources: {', '.join(map(str, source_ids))}\n"
+                              f"📥 Destinations: {', '.join(map(str, destination_ids))}")
+        except Exception as e:
+            await event.reply(f"❌ Error adding forwarding rule: {e}")
+
+    async def _handle_forward_remove(self, event, args):
+        if not args:
+            await event.reply("❌ Usage: /forward remove [LABEL]")
             return
-        message = "Auto Forward Messages:\n\ud83d\udce2 YOUR CHANNEL LIST\n\n"
-        for i, ch in enumerate(channels, 1):
-            uname = f" (@{ch['username']})" if ch['username'] else ""
-            message += f"{i}. {ch['title']}{uname} -> (ID: {ch['id']})\n"
-        await event.reply(message)
-    except Exception as e:
-        logger.error(f"Error getting channels: {e}")
-        await event.reply(f"\u274c Error getting channels: {e}")
+        label = args[0]
+        try:
+            await self.forwarding_engine.remove_forwarding_rule(label)
+            await event.reply(f"✅ Removed forwarding rule '{label}'")
+        except Exception as e:
+            await event.reply(f"❌ Error removing forwarding rule: {e}")
+
+    async def _handle_forward_start(self, event, args):
+        if not args:
+            await event.reply("❌ Usage: /forward start [LABEL]")
+            return
+        label = args[0]
+        try:
+            await self.forwarding_engine.start_forwarding_rule(label)
+            await event.reply(f"▶️ Started forwarding rule '{label}'")
+        except Exception as e:
+            await event.reply(f"❌ Error starting forwarding rule: {e}")
+
+    async def _handle_forward_stop(self, event, args):
+        if not args:
+            await event.reply("❌ Usage: /forward stop [LABEL]")
+            return
+        label = args[0]
+        try:
+            await self.forwarding_engine.stop_forwarding_rule(label)
+            await event.reply(f"⏹️ Stopped forwarding rule '{label}'")
+        except Exception as e:
+            await event.reply(f"❌ Error stopping forwarding rule: {e}")
+
+    async def _handle_forward_delay(self, event, args):
+        if len(args) < 2:
+            await event.reply("❌ Usage: /forward delay [LABEL] [SECONDS]")
+            return
+        label = args[0]
+        try:
+            delay = int(args[1])
+            await self.forwarding_engine.set_forwarding_delay(label, delay)
+            await event.reply(f"⏱️ Set delay for '{label}' to {delay} seconds")
+        except Exception as e:
+            await event.reply(f"❌ Error setting delay: {e}")
+
+    async def _handle_forward_max_time_edit(self, event, args):
+        if len(args) < 2:
+            await event.reply("❌ Usage: /forward max_time_edit [LABEL] [SECONDS]")
+            return
+        label = args[0]
+        try:
+            max_time = int(args[1])
+            await self.forwarding_engine.set_max_edit_time(label, max_time)
+            await event.reply(f"⏰ Set max edit time for '{label}' to {max_time} seconds")
+        except Exception as e:
+            await event.reply(f"❌ Error setting max edit time: {e}")
+
+    async def _handle_forward_batch(self, event, args):
+        if len(args) < 2:
+            await event.reply("❌ Usage: /forward batch [LABEL] [SECONDS] [MAX_SIZE]")
+            return
+        label = args[0]
+        try:
+            window = float(args[1])
+            if len(args) > 2:
+                max_size = int(args[2])
+                await self.forwarding_engine.set_batching(label, window, max_size)
+            else:
+                await self.forwarding_engine.set_batching(label, window)
+            if window > 0:
+                await event.reply(f"📦 Batching forwards for '{label}' every {window} seconds")
+            else:
+                await event.reply(f"📦 Disabled batching for '{label}'")
+        except Exception as e:
+            await event.reply(f"❌ Error setting batching: {e}")
+
+    async def _handle_forward_dedup(self, event, args):
+        if len(args) < 2:
+            await event.reply("❌ Usage: /forward dedup [LABEL] [SECONDS]")
+            return
+        label = args[0]
+        try:
+            window = float(args[1])
+            await self.forwarding_engine.set_dedup_window(label, window)
+            if window > 0:
+                await event.reply(f"🧹 Dropping reposts seen by '{label}' within {window} seconds")
+            else:
+                await event.reply(f"🧹 Disabled repost filtering for '{label}'")
+        except Exception as e:
+            await event.reply(f"❌ Error setting dedup window: {e}")
+
+    async def _handle_forward_restart(self, event):
+        try:
+            await self.forwarding_engine.restart()
+            await event.reply("🔄 Forwarding engine restarted")
+        except Exception as e:
+            await event.reply(f"❌ Error restarting: {e}")
+
+    async def _handle_forward_task(self, event):
+        try:
+            tasks = await self.forwarding_engine.get_active_tasks()
+            if not tasks:
+                await event.reply("📋 No active forwarding tasks")
+                return
+            message = "📋 Active Forwarding Tasks:\n\n"
+            for task in tasks:
+                status = "▶️" if task['active'] else "⏸️"
+                message += f"{status} {task['label']}\n"
+                message += f"   📤 Sources: {', '.join(map(str, task['sources']))}\n"
+                message += f"   📥 Destinations: {', '.join(map(str, task['destinations']))}\n"
+                message += f"   ⏱️ Delay: {task['delay']}s\n"
+                message += f"   ⏰ Max Edit: {task['max_edit_time']}s\n"
+                if task['batch_window']:
+                    message += f"   📦 Batch: {task['batch_window']}s\n"
+                if task['dedup_window']:
+                    message += f"   🧹 Dedup: {task['dedup_window']}s\n"
+                message += "\n"
+            await event.reply(message)
+        except Exception as e:
+            await event.reply(f"❌ Error getting tasks: {e}")
+
+    async def _handle_forward_stats(self, event):
+        try:
+            stats = self.forwarding_engine.get_stats()
+            message = "📊 Forwarding Stats:\n\n"
+            message += f"📨 Received: {stats['received']:.0f}\n"
+            # One line per rule would pass Telegram's message size limit with many rules
+            rules = sorted(stats['rules'].items(), key=lambda item: item[1]['matched'], reverse=True)
+            for label, rule_stats in rules[:STATS_TOP_RULES]:
+                message += (f"   {label}: {rule_stats['matched']:.0f} matched, "
+                            f"{rule_stats['forwarded']:.0f} forwarded, {rule_stats['copies']:.0f} copies")
+                if rule_stats['duplicates']:
+                    message += f", {rule_stats['duplicates']:.0f} reposts skipped"
+                message += "\n"
+            rest = rules[STATS_TOP_RULES:]
+            if rest:
+                message += (f"   {len(rest)} more rules: "
+                            f"{sum(rule_stats['matched'] for _, rule_stats in rest):.0f} matched, "
+                            f"{sum(rule_stats['forwarded'] for _, rule_stats in rest):.0f} forwarded, "
+                            f"{sum(rule_stats['copies'] for _, rule_stats in rest):.0f} copies\n")
+
+            slowest = sorted(stats['send_seconds'].items(), key=lambda item: item[1], reverse=True)[:5]
+            if slowest:
+                message += "\n📤 Avg send time:\n"
+                for dest_id, seconds in slowest:
+                    message += f"   {dest_id}: {seconds * 1000:.0f}ms\n"
+            message += f"❌ Failed sends: {stats['send_failures']:.0f}\n"
+
+            flood_seconds = sum(
+                account['flood_wait_seconds'] for account in stats['client_pool']['accounts'].values()
+            )
+            replacement = stats['replacement']
+            edits = stats['edits']
+            message += (f"\n⏳ Delay queue: {stats['delay_queue_depth']}\n"
+                        f"✏️ Edits: {edits['pushed']:.0f} pushed, {edits['coalesced']:.0f} coalesced, "
+                        f"{edits['unchanged']:.0f} unchanged skipped\n"
+                        f"🗂️ Edit cache: {stats['edit_cache']['size']} entries\n"
+                        f"🌊 FloodWait: {flood_seconds}s\n"
+                        f"🔁 Replacement: {replacement['avg_seconds'] * 1000:.2f}ms avg, "
+                        f"{replacement['cache']['hits']} cache hits, "
+                        f"{replacement['offloaded_jobs']} offloaded\n")
+            await event.reply(message)
+        except Exception as e:
+            await event.reply(f"❌ Error getting stats: {e}")
+
+    # Replace Commands - OMITTED for BREVITY
 
+    # GetChannel Command
+    async def _handle_getchannel_command(self, event):
+        try:
+            channels = []
+            async for dialog in self.client.iter_dialogs():
+                entity = dialog.entity
+                if getattr(entity, 'broadcast', False) or getattr(entity, 'megagroup', False):
+                    channels.append({
+                        'title': dialog.title,
+                        'id': entity.id,
+                        'username': getattr(entity, 'username', None)
+                    })
+            if not channels:
+                await event.reply("📢 No channels found")
+                return
+            message = "Auto Forward Messages:\n📢 YOUR CHANNEL LIST\n\n"
+            for i, ch in enumerate(channels, 1):
+                uname = f" (@{ch['username']})" if ch['username'] else ""
+                message += f"{i}. {ch['title']}{uname} -> (ID: {ch['id']})\n"
+            await event.reply(message)
+        except Exception as e:
+            logger.error(f"Error getting channels: {e}")
+            await event.reply(f"❌ Error getting channels: {e}")
@@ -3,29 +3,72 @@ Configuration Manager
 Handles persistent storage of forwarding rules and settings
 """
 
+import asyncio
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
+from config_oplog import OpLogStore
+from metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
+CONFIG_SAVE_REQUESTS = REGISTRY.counter('userbot_config_save_requests_total', 'Configuration changes requested')
+CONFIG_WRITES = REGISTRY.counter('userbot_config_writes_total', 'Configuration writes to disk')
+CONFIG_WRITE_ERRORS = REGISTRY.counter('userbot_config_write_errors_total', 'Failed configuration writes')
+CONFIG_WRITE_SECONDS = REGISTRY.histogram('userbot_config_write_seconds', 'Time to write the configuration')
+
+SAVE_DEBOUNCE = 0.5  # seconds to wait for more changes before writing
+COMPACT_EVERY = 1000  # log records between snapshots
+
 class ConfigManager:
-    def __init__(self, config_file='userbot_config.json'):
+    def __init__(self, config_file='userbot_config.json', storage='json'):
+        if storage not in ('json', 'oplog'):
+            raise ValueError(f"Unknown config storage '{storage}'")
+
         self.config_file = config_file
+        self.storage = storage
+        self.oplog = OpLogStore(config_file) if storage == 'oplog' else None
+        self.seq = 0
+        self.pending_records = []
+        self.records_since_compaction = 0
+        self.compaction_task = None
         self.config = {
             'forwarding_rules': {},
             'replacement_rules': {},
             'settings': {}
         }
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='config-writer')
+        self.dirty = False
+        self.save_task = None
+        self.write_lock = asyncio.Lock()
+        self.stats = {
+            'save_requests': 0,
+            'writes': 0,
+            'write_errors': 0,
+            'last_write_ms': 0.0,
+            'max_write_ms': 0.0,
+            'max_loop_block_ms': 0.0,
+            'compactions': 0,
+        }
     
     async def load_config(self):
         """Load configuration from file"""
         try:
-            if os.path.exists(self.config_file):
+            if self.oplog is not None and self.oplog.exists():
+                loop = asyncio.get_running_loop()
+                self.config, self.seq = await loop.run_in_executor(self.executor, self.oplog.load)
+                logger.info(f"Configuration loaded from log (seq {self.seq})")
+            elif os.path.exists(self.config_file):
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     self.config = json.load(f)
                 logger.info("Configuration loaded successfully")
+                if self.oplog is not None:
+                    # First start with log storage: snapshot the JSON config
+                    self._start_compaction()
             else:
                 logger.info("No configuration file found, using defaults")
         except Exception as e:
@@ -38,13 +81,121 @@ class ConfigManager:
             }
     
     async def save_config(self):
-        """Save configuration to file"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-            logger.info("Configuration saved successfully")
-        except Exception as e:
-            logger.error(f"Error saving configuration: {e}")
+        """Save configuration to file; bursts of changes are written once"""
+        self.dirty = True
+        self.stats['save_requests'] += 1
+        CONFIG_SAVE_REQUESTS.inc()
+        if self.save_task is None or self.save_task.done():
+            self.save_task = asyncio.create_task(self._save_later())
+
+    async def flush(self):
+        """Write any pending changes now and wait for the write"""
+        if self.save_task is not None and not self.save_task.done():
+            self.save_task.cancel()
+        await self._write()
+
+    async def _save_later(self):
+        """Write once no more changes have come in for the debounce period"""
+        await asyncio.sleep(SAVE_DEBOUNCE)
+        await self._write()
+
+    async def _write(self):
+        """Snapshot the configuration and write it on the worker thread"""
+        async with self.write_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+
+            started = time.perf_counter()
+            if self.oplog is not None:
+                lines, self.pending_records = self.pending_records, []
+                write, data = self.oplog.append, lines
+            else:
+                write, data = self._write_file, self._snapshot()
+            self.stats['max_loop_block_ms'] = max(
+                self.stats['max_loop_block_ms'], round((time.perf_counter() - started) * 1000, 3)
+            )
+
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, write, data)
+            except Exception as e:
+                if self.oplog is not None:
+                    self.pending_records = lines + self.pending_records
+                self.dirty = True
+                self.stats['write_errors'] += 1
+                CONFIG_WRITE_ERRORS.inc()
+                logger.error(f"Error saving configuration: {e}")
+                return
+
+            if self.oplog is not None:
+                self.records_since_compaction += len(lines)
+                if self.records_since_compaction >= COMPACT_EVERY:
+                    self._start_compaction()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats['writes'] += 1
+            CONFIG_WRITES.inc()
+            CONFIG_WRITE_SECONDS.observe(elapsed_ms / 1000)
+            self.stats['last_write_ms'] = round(elapsed_ms, 3)
+            self.stats['max_write_ms'] = max(self.stats['max_write_ms'], round(elapsed_ms, 3))
+            logger.debug(f"Configuration saved in {elapsed_ms:.1f}ms")
+
+    async def _record(self, op: str, section: str, key: str = None, value: Any = None):
+        """Persist one change: a log record, or a full save with JSON storage"""
+        if self.oplog is not None:
+            self.seq += 1
+            # Encode now; the caller may keep mutating the value
+            self.pending_records.append(OpLogStore.encode(self.seq, op, section, key, value))
+        await self.save_config()
+
+    def _start_compaction(self):
+        """Compact the log into a snapshot in the background"""
+        if self.compaction_task is None or self.compaction_task.done():
+            self.compaction_task = asyncio.create_task(self._compact())
+
+    async def _compact(self):
+        """Write a snapshot of the current configuration and trim the log"""
+        async with self.write_lock:
+            # Covers every record so far, including ones not yet appended;
+            # those are skipped on replay since their seq is not newer
+            snapshot, seq = self._snapshot(), self.seq
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, self.oplog.compact, snapshot, seq)
+            except Exception as e:
+                logger.error(f"Error compacting configuration log: {e}")
+                return
+
+            self.records_since_compaction = 0
+            self.stats['compactions'] += 1
+            logger.info(f"Compacted configuration log at seq {seq}")
+
+    def _snapshot(self) -> Dict:
+        """Copy the configuration so it can be serialized off the event loop"""
+        # Rules are changed by assigning their fields, never by mutating
+        # nested values in place, so copying two levels deep is enough
+        return {
+            section: {
+                key: dict(value) if isinstance(value, dict) else value
+                for key, value in entries.items()
+            } if isinstance(entries, dict) else entries
+            for section, entries in self.config.items()
+        }
+
+    def _write_file(self, snapshot: Dict):
+        """Atomically replace the config file (worker thread)"""
+        data = json.dumps(snapshot, indent=2, ensure_ascii=False)
+        temp_file = f"{self.config_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.config_file)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get persistence statistics"""
+        return dict(self.stats, pending=self.dirty)
     
     async def get_forwarding_rules(self) -> Dict:
         """Get all forwarding rules"""
@@ -56,13 +207,13 @@ class ConfigManager:
             self.config['forwarding_rules'] = {}
         
         self.config['forwarding_rules'][label] = rule
-        await self.save_config()
+        await self._record('put', 'forwarding_rules', label, rule)
     
     async def remove_forwarding_rule(self, label: str):
         """Remove a forwarding rule"""
         if 'forwarding_rules' in self.config and label in self.config['forwarding_rules']:
             del self.config['forwarding_rules'][label]
-            await self.save_config()
+            await self._record('delete', 'forwarding_rules', label)
     
     async def get_replacement_rules(self) -> Dict:
         """Get all replacement rules"""
@@ -74,18 +225,18 @@ class ConfigManager:
             self.config['replacement_rules'] = {}
         
         self.config['replacement_rules'][label] = rule
-        await self.save_config()
+        await self._record('put', 'replacement_rules', label, rule)
     
     async def remove_replacement_rule(self, label: str):
         """Remove a replacement rule"""
         if 'replacement_rules' in self.config and label in self.config['replacement_rules']:
             del self.config['replacement_rules'][label]
-            await self.save_config()
+            await self._record('delete', 'replacement_rules', label)
     
     async def clear_replacement_rules(self):
         """Clear all replacement rules"""
         self.config['replacement_rules'] = {}
-        await self.save_config()
+        await self._record('clear', 'replacement_rules')
     
     async def get_setting(self, key: str, default: Any = None) -> Any:
         """Get a setting value"""
@@ -97,4 +248,4 @@ class ConfigManager:
             self.config['settings'] = {}
         
         self.config['settings'][key] = value
-        await self.save_config()
+        await self._record('put', 'settings', key, value)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Config Operation Log
+Append-only storage for the configuration, compacted into snapshots
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+def empty_config() -> Dict:
+    """Get an empty configuration"""
+    return {
+        'forwarding_rules': {},
+        'replacement_rules': {},
+        'settings': {}
+    }
+
+def apply_record(config: Dict, record: Dict):
+    """Apply one log record to a configuration"""
+    op = record['op']
+    section = config.setdefault(record['section'], {})
+
+    if op == 'put':
+        section[record['key']] = record['value']
+    elif op == 'delete':
+        section.pop(record['key'], None)
+    elif op == 'clear':
+        section.clear()
+    else:
+        raise ValueError(f"Unknown config log operation '{op}'")
+
+class OpLogStore:
+    """Snapshot file plus a JSON-lines log of the changes made since.
+
+    Every record carries a sequence number and the snapshot stores the last
+    one it includes, so records appended while a compaction is running are
+    kept and replayed on load.
+    """
+
+    def __init__(self, base_path: str):
+        self.snapshot_file = f"{base_path}.snapshot.json"
+        self.log_file = f"{base_path}.log"
+
+    def exists(self) -> bool:
+        """Check whether any log storage is on disk"""
+        return os.path.exists(self.snapshot_file) or os.path.exists(self.log_file)
+
+    def load(self) -> Tuple[Dict, int]:
+        """Replay snapshot plus log tail; returns (config, last seq)"""
+        config = empty_config()
+        seq = 0
+
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            config.update(snapshot['config'])
+            seq = snapshot['seq']
+
+        if os.path.exists(self.log_file):
+            self._drop_torn_tail()
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave the last line half written
+                        logger.warning(f"Skipping unreadable config log line {line_number}")
+                        continue
+                    if record['seq'] > seq:
+                        apply_record(config, record)
+                        seq = record['seq']
+
+        return config, seq
+
+    def _drop_torn_tail(self):
+        """Cut a half-written last line so new records start on a line of their own"""
+        with open(self.log_file, 'rb+') as f:
+            data = f.read()
+            if not data or data.endswith(b'\n'):
+                return
+            keep = data.rfind(b'\n') + 1
+            logger.warning(f"Dropping {len(data) - keep} bytes of a half-written config log line")
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, lines: List[str]):
+        """Durably append encoded records"""
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, config: Dict, seq: int):
+        """Write a snapshot up to seq and drop the log records it covers"""
+        self._write_atomic(self.snapshot_file, json.dumps({'seq': seq, 'config': config}, ensure_ascii=False))
+
+        tail = []
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if json.loads(line)['seq'] > seq:
+                            tail.append(line)
+                    except ValueError:
+                        continue
+        self._write_atomic(self.log_file, ''.join(tail))
+
+    @staticmethod
+    def encode(seq: int, op: str, section: str, key: str = None, value: Any = None) -> str:
+        """Encode one record as a log line"""
+        record = {'seq': seq, 'op': op, 'section': section}
+        if key is not None:
+            record['key'] = key
+        if op == 'put':
+            record['value'] = value
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+    @staticmethod
+    def _write_atomic(path: str, data: str):
+        """Replace a file through a synced temp file"""
+        temp_file = f"{path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+
+def json_to_oplog(json_file: str, base_path: str):
+    """Convert a JSON config file into a log snapshot"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    store = OpLogStore(base_path)
+    store.compact(config, 0)
+    # The snapshot now holds everything; start the log empty
+    OpLogStore._write_atomic(store.log_file, '')
+
+def oplog_to_json(base_path: str, json_file: str):
+    """Convert log storage back into a single JSON config file"""
+    config, _ = OpLogStore(base_path).load()
+    OpLogStore._write_atomic(json_file, json.dumps(config, indent=2, ensure_ascii=False))
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert userbot configuration between JSON and log storage")
+    parser.add_argument('direction', choices=['to-oplog', 'to-json'])
+    parser.add_argument('config_file', nargs='?', default='userbot_config.json',
+                        help='JSON config path; log files are stored next to it')
+    args = parser.parse_args()
+
+    if args.direction == 'to-oplog':
+        json_to_oplog(args.config_file, args.config_file)
+        print(f"✅ Wrote {args.config_file}.snapshot.json and {args.config_file}.log")
+    else:
+        oplog_to_json(args.config_file, args.config_file)
+        print(f"✅ Wrote {args.config_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Dedup Window
+Recognizes content reposted within a time window, in bounded memory
+"""
+
+import hashlib
+import logging
+import re
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FINGERPRINTS = 50000  # per rule
+
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint(messages: List) -> Optional[int]:
+    """64-bit fingerprint of the normalized text and media ids of a message or album.
+
+    Case and whitespace differences don't count. Messages with neither text
+    nor media get no fingerprint and are never treated as duplicates.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    empty = True
+    for message in messages:
+        text = _WHITESPACE.sub(' ', (message.text or getattr(message, 'caption', None) or '')).strip().casefold()
+        media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+        media_id = getattr(media, 'id', None)
+        if text or media_id is not None:
+            empty = False
+        digest.update(f"{text}\x00{media_id}\x01".encode())
+    return None if empty else int.from_bytes(digest.digest(), 'big')
+
+class DedupWindow:
+    """Fingerprints seen in roughly the last window seconds.
+
+    Two generations of fingerprint sets: new ones go into the current set,
+    and when it is window seconds old (or holds half of max_entries) the
+    previous set is dropped and the current one takes its place. A
+    fingerprint is therefore remembered for between window and twice
+    window seconds unless the size cap rotates it out sooner.
+    """
+
+    def __init__(self, window: float, max_entries: int = DEFAULT_MAX_FINGERPRINTS):
+        self.window = window
+        self.max_entries = max_entries
+        self.current = set()
+        self.previous = set()
+        self.started_at = time.monotonic()
+        self.suppressed = 0
+
+    def _rotate_if_due(self, now: float):
+        """Start a new generation when the current one is full or old enough"""
+        if now - self.started_at >= self.window or len(self.current) >= self.max_entries // 2:
+            # Nothing seen for two windows: the previous set has expired too
+            self.previous = self.current if now - self.started_at < 2 * self.window else set()
+            self.current = set()
+            self.started_at = now
+
+    def seen(self, key: int) -> bool:
+        """Check a fingerprint and remember it; True if it was seen within the window"""
+        self._rotate_if_due(time.monotonic())
+        if key in self.current or key in self.previous:
+            self.suppressed += 1
+            return True
+        self.current.add(key)
+        return False
+
+    def __len__(self) -> int:
+        return len(self.current) + len(self.previous)
+
+    def get_stats(self) -> Dict:
+        """Get window statistics"""
+        return {
+            'window': self.window,
+            'size': len(self),
+            'suppressed': self.suppressed,
+        }
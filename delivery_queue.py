@@ -0,0 +1,226 @@
+"""
+Delivery Queue
+Durable record of accepted deliveries so they are retried after a crash or restart,
+and of the last message accepted from each source chat
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_DELIVERY_ATTEMPTS = 3  # replays before a delivery is given up
+
+# (source_chat, source_msg, message_ids, label, dest_chat, due_at)
+# message_ids lists every message of an album, comma-separated
+DeliveryJob = Tuple[int, int, str, str, int, float]
+
+DELIVERIES_QUEUED = REGISTRY.counter('userbot_deliveries_queued_total', 'Deliveries written to the durable queue')
+DELIVERIES_COMPLETED = REGISTRY.counter('userbot_deliveries_completed_total', 'Deliveries marked done in the durable queue')
+DELIVERIES_FAILED = REGISTRY.counter('userbot_deliveries_failed_total', 'Deliveries given up on after a failed send')
+DELIVERY_COMMIT_SECONDS = REGISTRY.histogram('userbot_delivery_commit_seconds', 'Time to commit one group of deliveries')
+
+class DeliveryQueue:
+    """SQLite (WAL) table of deliveries that have not been sent yet.
+
+    put() returns once its jobs are committed. Jobs that arrive while a
+    commit is running wait for the next one, so every transaction (and
+    fsync) carries all the jobs accepted in the meantime. Done markers are
+    written in the same transactions and nobody waits for them: losing one
+    only means the delivery is sent again on the next start.
+
+    A send that fails while the userbot is running is given up on and
+    counted rather than left pending: replaying it on the next start would
+    deliver it after newer messages to the same destination. Replays only
+    cover deliveries cut short by a crash or shutdown.
+
+    Each source chat's newest accepted message id is kept alongside, so
+    messages posted while the userbot was offline can be caught up on.
+    """
+
+    def __init__(self, db_file: str = 'delivery_queue.db'):
+        self.db_file = db_file
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='delivery-queue')
+        self.pending: List[DeliveryJob] = []
+        self.completed: List[Tuple[int, int, str, int]] = []
+        self.positions: Dict[int, int] = {}  # source chat -> newest accepted id, not written yet
+        self.commit_future: Optional[asyncio.Future] = None  # resolved when pending is committed
+        self.commits = 0
+        self._writer = None
+
+    async def open(self):
+        """Open the database, creating the schema if needed"""
+        if self.conn is None:
+            await self._run(self._open)
+
+    def _open(self):
+        """Connect and create the schema (worker thread)"""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Accepted deliveries must survive power loss, not just a crash
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " source_chat INTEGER NOT NULL,"
+            " source_msg INTEGER NOT NULL,"
+            " message_ids TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " dest_chat INTEGER NOT NULL,"
+            " due_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS source_positions ("
+            " source_chat INTEGER PRIMARY KEY,"
+            " last_msg INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deliveries_job ON deliveries (source_chat, source_msg, label, dest_chat)"
+        )
+        conn.commit()
+        self.conn = conn
+
+    async def close(self):
+        """Write outstanding jobs and done markers, then close the database"""
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+        if self.pending or self.completed or self.positions:
+            await self._write_loop()
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+
+    async def _run(self, func, *args):
+        """Run a blocking database call on the worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def put(self, jobs: List[DeliveryJob]):
+        """Persist jobs; returns once they are committed"""
+        if not jobs or self.conn is None:
+            return
+
+        self.pending.extend(jobs)
+        if self.commit_future is None:
+            self.commit_future = asyncio.get_running_loop().create_future()
+        committed = self.commit_future
+        self._wake_writer()
+        await asyncio.shield(committed)
+
+    def complete(self, source_chat: int, source_msg: int, label: str, dest_chats: List[int]):
+        """Mark deliveries as sent"""
+        if self.conn is None:
+            return
+        self.completed.extend((source_chat, source_msg, label, dest_chat) for dest_chat in dest_chats)
+        self._wake_writer()
+
+    def fail(self, source_chat: int, source_msg: int, label: str, dest_chats: List[int]):
+        """Give up on deliveries whose send failed, so they are not replayed"""
+        DELIVERIES_FAILED.inc(amount=len(dest_chats))
+        self.complete(source_chat, source_msg, label, dest_chats)
+
+    def advance(self, source_chat: int, message_id: int):
+        """Record a source message as accepted; written with the next commit"""
+        if message_id > self.positions.get(source_chat, 0):
+            self.positions[source_chat] = message_id
+
+    def _wake_writer(self):
+        """Make sure a commit loop is running"""
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        """Commit everything queued, one transaction at a time"""
+        while self.pending or self.completed or self.positions:
+            jobs, self.pending = self.pending, []
+            completed, self.completed = self.completed, []
+            positions, self.positions = self.positions, {}
+            committed, self.commit_future = self.commit_future, None
+
+            start = time.perf_counter()
+            try:
+                await self._run(self._write, jobs, completed, positions)
+            except Exception as e:
+                logger.error(f"Error writing delivery queue: {e}")
+                if committed is not None:
+                    committed.set_exception(e)
+                    committed.exception()  # retrieved by every waiter, don't warn if there are none
+                continue
+
+            self.commits += 1
+            DELIVERY_COMMIT_SECONDS.observe(time.perf_counter() - start)
+            DELIVERIES_QUEUED.inc(amount=len(jobs))
+            DELIVERIES_COMPLETED.inc(amount=len(completed))
+            if committed is not None:
+                committed.set_result(None)
+
+    def _write(self, jobs: List[DeliveryJob], completed: List[Tuple[int, int, str, int]],
+               positions: Dict[int, int]):
+        """Insert new jobs, delete finished ones and move source positions in one transaction (worker thread)"""
+        with self.conn:
+            if jobs:
+                self.conn.executemany(
+                    "INSERT INTO deliveries (source_chat, source_msg, message_ids, label, dest_chat, due_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    jobs
+                )
+            if completed:
+                self.conn.executemany(
+                    "DELETE FROM deliveries WHERE source_chat = ? AND source_msg = ? AND label = ? AND dest_chat = ?",
+                    completed
+                )
+            if positions:
+                self.conn.executemany(
+                    "INSERT INTO source_positions (source_chat, last_msg) VALUES (?, ?)"
+                    " ON CONFLICT (source_chat) DO UPDATE SET last_msg = max(last_msg, excluded.last_msg)",
+                    positions.items()
+                )
+
+    async def load_pending(self) -> List[DeliveryJob]:
+        """Get every unsent job, counting this as another attempt at each"""
+        if self.conn is None:
+            return []
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+        return await self._run(self._load_pending)
+
+    def _load_pending(self) -> List[DeliveryJob]:
+        """Bump attempts, drop exhausted jobs and read the rest (worker thread)"""
+        with self.conn:
+            dropped = self.conn.execute(
+                "DELETE FROM deliveries WHERE attempts >= ?", (MAX_DELIVERY_ATTEMPTS,)
+            ).rowcount
+            if dropped:
+                logger.warning(f"Gave up on {dropped} deliveries after {MAX_DELIVERY_ATTEMPTS} attempts")
+            self.conn.execute("UPDATE deliveries SET attempts = attempts + 1")
+            return self.conn.execute(
+                "SELECT source_chat, source_msg, message_ids, label, dest_chat, due_at"
+                " FROM deliveries ORDER BY rowid"
+            ).fetchall()
+
+    async def load_positions(self) -> Dict[int, int]:
+        """Get the newest accepted message id of every source chat"""
+        if self.conn is None:
+            return {}
+        return dict(await self._run(self._select_positions))
+
+    def _select_positions(self) -> List[Tuple[int, int]]:
+        """Read every source position (worker thread)"""
+        return self.conn.execute("SELECT source_chat, last_msg FROM source_positions").fetchall()
+
+    def get_stats(self) -> Dict:
+        """Get write counts for the queue"""
+        return {
+            'queued': DELIVERIES_QUEUED.get(),
+            'completed': DELIVERIES_COMPLETED.get(),
+            'failed': DELIVERIES_FAILED.get(),
+            'commits': self.commits,
+            'avg_commit_ms': round(DELIVERY_COMMIT_SECONDS.average() * 1000, 3),
+        }
@@ -0,0 +1,162 @@
+"""
+Delivery Scheduler
+Owns delayed deliveries so event handlers never sleep
+"""
+
+import asyncio
+import heapq
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class DeliveryScheduler:
+    """Timer heap of delayed deliveries, grouped by rule.
+
+    Every delivery queued under the same key shares that key's delay, so each
+    key keeps a FIFO of (enqueued_at, item) and only the head of each FIFO
+    sits in the heap. Changing a key's delay just re-keys its head, which
+    makes the new delay apply to deliveries that are already waiting.
+    """
+
+    def __init__(self, deliver: Callable[[Hashable, Any], Awaitable]):
+        self.deliver = deliver
+        self.queues: Dict[Hashable, deque] = {}
+        self.delays: Dict[Hashable, float] = {}
+        self.heap = []  # (due, seq, key); stale entries are skipped
+        self.due_times: Dict[Hashable, float] = {}  # key -> due of its valid heap entry
+        self.delivery_tasks = set()
+        self.unstarted: Dict[Hashable, int] = {}  # key -> deliveries handed out but not running yet
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._runner = None
+
+    @property
+    def pending_count(self) -> int:
+        """Number of deliveries waiting to be sent"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def has_pending(self, key: Hashable) -> bool:
+        """Check whether a key has deliveries that have not started sending.
+
+        Anything sent for the key right away would overtake them, so callers
+        queue it behind them instead, even with no delay.
+        """
+        return bool(self.queues.get(key)) or self.unstarted.get(key, 0) > 0
+
+    def start(self):
+        """Start dispatching due deliveries"""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop dispatching; queued deliveries are kept for the next start"""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def drain(self, timeout: float) -> int:
+        """Wait up to timeout for deliveries already being sent, then cancel the rest; returns how many were cancelled"""
+        if not self.delivery_tasks:
+            return 0
+        _, unfinished = await asyncio.wait(set(self.delivery_tasks), timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        # Tasks cancelled before they ran never took themselves off
+        self.unstarted.clear()
+        return len(unfinished)
+
+    def schedule(self, key: Hashable, delay: float, item: Any, enqueued_at: Optional[float] = None):
+        """Queue an item to be delivered after the key's delay.
+
+        enqueued_at is the loop time the item was accepted, for items that
+        started waiting earlier (e.g. in a previous run); it defaults to now.
+        """
+        now = asyncio.get_running_loop().time()
+        enqueued_at = now if enqueued_at is None else min(enqueued_at, now)
+        self.delays[key] = delay
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+
+        # Keep the FIFO in acceptance order; an older item goes before newer ones
+        position = len(queue)
+        while position and queue[position - 1][0] > enqueued_at:
+            position -= 1
+        queue.insert(position, (enqueued_at, item))
+        if position == 0:
+            self._push(key, enqueued_at + delay)
+
+    def set_delay(self, key: Hashable, delay: float):
+        """Change a key's delay, including for deliveries already queued"""
+        self.delays[key] = delay
+        queue = self.queues.get(key)
+        if queue:
+            self._push(key, queue[0][0] + delay)
+
+    def cancel(self, key: Hashable) -> int:
+        """Drop all queued deliveries for a key"""
+        queue = self.queues.pop(key, None)
+        self.delays.pop(key, None)
+        self.due_times.pop(key, None)
+        return len(queue) if queue else 0
+
+    def _push(self, key: Hashable, due: float):
+        """Make due the only valid heap entry for key"""
+        self.due_times[key] = due
+        self._seq += 1
+        heapq.heappush(self.heap, (due, self._seq, key))
+        if self.heap[0][2] == key:
+            self._wakeup.set()
+
+    async def _run(self):
+        """Sleep until the earliest due delivery, then dispatch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            self._dispatch_due(loop.time())
+
+            timeout = self.heap[0][0] - loop.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch_due(self, now: float):
+        """Hand every delivery whose time has come to the deliver callback"""
+        while self.heap and self.heap[0][0] <= now:
+            due, _, key = heapq.heappop(self.heap)
+            if self.due_times.get(key) != due:
+                continue  # superseded by a later push or cancel
+
+            del self.due_times[key]
+            queue = self.queues[key]
+            delay = self.delays[key]
+            while queue and queue[0][0] + delay <= now:
+                _, item = queue.popleft()
+                self.unstarted[key] = self.unstarted.get(key, 0) + 1
+                task = asyncio.create_task(self._deliver(key, item))
+                self.delivery_tasks.add(task)
+                task.add_done_callback(self.delivery_tasks.discard)
+
+            if queue:
+                self._push(key, queue[0][0] + delay)
+            else:
+                del self.queues[key]
+
+    async def _deliver(self, key: Hashable, item: Any):
+        """Run the deliver callback for one item"""
+        self.unstarted[key] -= 1
+        if not self.unstarted[key]:
+            del self.unstarted[key]
+        try:
+            await self.deliver(key, item)
+        except Exception as e:
+            logger.error(f"Error delivering delayed item for {key}: {e}")
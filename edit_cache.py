@@ -0,0 +1,144 @@
+"""
+Edit Cache
+Bounded tracking of forwarded copies so source edits can be mirrored
+"""
+
+import heapq
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 50000
+
+class EditCacheEntry:
+    """Forwarded copies of one source message, grouped by the rule that sent them"""
+
+    __slots__ = ('timestamps', 'deadline', 'forwarded', 'sent_hashes')
+
+    def __init__(self, deadline: float):
+        self.timestamps: Dict[str, float] = {}  # label -> when that rule forwarded the message
+        self.deadline = deadline  # latest deadline of any rule
+        self.forwarded: Dict[str, List[Tuple[int, int, str]]] = {}  # label -> [(chat_id, message_id, account), ...]
+        self.sent_hashes: Dict[Tuple[int, int], int] = {}  # (chat_id, message_id) -> hash of the text it shows
+
+    def add_copies(self, label: str, timestamp: float, forwarded: List[Tuple[int, int, str]]):
+        """Track copies sent by a rule, keeping the time it first forwarded the message"""
+        self.timestamps[label] = min(timestamp, self.timestamps.get(label, timestamp))
+        self.forwarded.setdefault(label, []).extend(forwarded)
+
+    def drop_rule(self, label: str):
+        """Stop tracking the copies sent by a rule"""
+        self.timestamps.pop(label, None)
+        self.forwarded.pop(label, None)
+
+    def record_text(self, chat_id: int, message_id: int, text: str):
+        """Remember the text a copy now shows"""
+        self.sent_hashes[(chat_id, message_id)] = hash(text)
+
+    def shows(self, chat_id: int, message_id: int, text: str) -> bool:
+        """Check whether a copy already shows this text"""
+        return self.sent_hashes.get((chat_id, message_id)) == hash(text)
+
+class EditCache:
+    """LRU map of (source_chat, source_msg) -> EditCacheEntry.
+
+    Entries expire through a deadline heap that sweep() drains, and the
+    least recently used entry is evicted whenever max_entries is exceeded.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Tuple[int, int], EditCacheEntry]' = OrderedDict()
+        self.deadlines = []  # (deadline, key); stale pairs are skipped
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: Tuple[int, int]):
+        return key in self.entries
+
+    def add(self, key: Tuple[int, int], label: str, max_edit_time: float, forwarded: List[Tuple[int, int, str]],
+            timestamp: Optional[float] = None, text: Optional[str] = None):
+        """Record forwarded copies of a source message, and the text they were sent with if known"""
+        now = timestamp if timestamp is not None else time.time()
+        deadline = now + max_edit_time
+        entry = self.entries.get(key)
+        existing = entry is not None
+
+        if not existing:
+            entry = EditCacheEntry(deadline)
+            self.entries[key] = entry
+        else:
+            self.entries.move_to_end(key)
+        # Each rule keeps its own label and send time, so its max_edit_time applies to its copies only
+        entry.add_copies(label, now, forwarded)
+
+        if text is not None:
+            for chat_id, message_id, _ in forwarded:
+                entry.record_text(chat_id, message_id, text)
+
+        if existing:
+            if deadline <= entry.deadline:
+                return
+            entry.deadline = deadline
+
+        heapq.heappush(self.deadlines, (deadline, key))
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        if len(self.deadlines) > 2 * len(self.entries) + 1024:
+            self._compact_deadlines()
+
+    def get(self, key: Tuple[int, int]) -> Optional[EditCacheEntry]:
+        """Look up a source message, marking it recently used"""
+        entry = self.entries.get(key)
+        if entry is None or entry.deadline < time.time():
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def discard(self, key: Tuple[int, int]):
+        """Forget a source message"""
+        self.entries.pop(key, None)
+
+    def sweep(self) -> int:
+        """Drop every entry whose deadline has passed"""
+        now = time.time()
+        removed = 0
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, key = heapq.heappop(self.deadlines)
+            entry = self.entries.get(key)
+            if entry is not None and entry.deadline == deadline:
+                del self.entries[key]
+                removed += 1
+
+        self.expirations += removed
+        return removed
+
+    def _compact_deadlines(self):
+        """Rebuild the deadline heap without stale pairs"""
+        self.deadlines = [(entry.deadline, key) for key, entry in self.entries.items()]
+        heapq.heapify(self.deadlines)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        return {
+            'size': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,96 @@
+"""
+Edit Debouncer
+Coalesces bursts of edits to one source message into a single update
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EDIT_DEBOUNCE_WINDOW = 1.0  # seconds without a newer edit before one is pushed
+MAX_EDIT_HOLD = 10.0  # seconds an edit can be held while newer ones keep arriving
+
+EDITS_COALESCED = REGISTRY.counter('userbot_edits_coalesced_total', 'Edits replaced by a newer edit before being pushed')
+
+class EditDebouncer:
+    """Holds the latest edit of each (chat_id, message_id) for a short window.
+
+    A newer edit of the same message replaces the held one and restarts the
+    window, so a burst of edits turns into one push of the last version. An
+    edit is never held longer than max_hold, and pushes of the same message
+    run one after another so an older version can't land last.
+    """
+
+    def __init__(self, on_edit: Callable[..., Awaitable], window: float = EDIT_DEBOUNCE_WINDOW,
+                 max_hold: float = MAX_EDIT_HOLD):
+        self.on_edit = on_edit
+        self.window = window
+        self.max_hold = max_hold
+        self.pending: Dict[Tuple[int, int], object] = {}
+        self.first_seen: Dict[Tuple[int, int], float] = {}
+        self.timers: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        self.pushes: Dict[Tuple[int, int], asyncio.Task] = {}  # latest push of each message
+
+    def add(self, event):
+        """Hold an edit, replacing any held edit of the same message"""
+        key = (event.chat_id, event.message.id)
+        loop = asyncio.get_running_loop()
+        if key in self.pending:
+            EDITS_COALESCED.inc()
+        else:
+            self.first_seen[key] = loop.time()
+        self.pending[key] = event
+
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        delay = min(self.window, self.first_seen[key] + self.max_hold - loop.time())
+        if delay <= 0:
+            self._flush(key)
+        else:
+            self.timers[key] = loop.call_later(delay, self._flush, key)
+
+    def _flush(self, key: Tuple[int, int]):
+        """Push the held edit of a message"""
+        self.timers.pop(key, None)
+        self.first_seen.pop(key, None)
+        event = self.pending.pop(key, None)
+        if event is None:
+            return
+
+        task = asyncio.create_task(self._deliver(key, event, self.pushes.get(key)))
+        self.pushes[key] = task
+        task.add_done_callback(lambda done: self.pushes.pop(key, None) if self.pushes.get(key) is done else None)
+
+    async def _deliver(self, key: Tuple[int, int], event, previous):
+        """Run the callback once the previous push of the same message is done"""
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await self.on_edit(event)
+        except Exception as e:
+            logger.error(f"Error pushing edit of {key}: {e}")
+
+    async def flush_all(self):
+        """Push every held edit now and wait for them"""
+        for key in list(self.pending):
+            timer = self.timers.get(key)
+            if timer is not None:
+                timer.cancel()
+            self._flush(key)
+
+        if self.pushes:
+            await asyncio.gather(*self.pushes.values(), return_exceptions=True)
+
+    def get_stats(self) -> Dict:
+        """Get debouncer statistics"""
+        return {
+            'window': self.window,
+            'held': len(self.pending),
+            'coalesced': EDITS_COALESCED.get(),
+        }
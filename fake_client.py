@@ -0,0 +1,269 @@
+"""
+Fake Telegram Client
+In-memory stand-in for TelegramClient used to load-test the real handlers
+"""
+
+import asyncio
+import datetime
+import itertools
+import logging
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telethon import events, utils
+from telethon._updates import EntityCache
+from telethon.errors import FloodWaitError
+from telethon.tl.custom import Message
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser, PeerChannel, PeerChat, PeerUser
+
+logger = logging.getLogger(__name__)
+
+def _peer(chat_id: int):
+    """Peer object for a marked chat id"""
+    real_id, peer_type = utils.resolve_id(chat_id)
+    return peer_type(real_id)
+
+def _input_peer(chat_id: int):
+    """Input peer for a marked chat id, with a made-up access hash"""
+    real_id, peer_type = utils.resolve_id(chat_id)
+    if peer_type is PeerUser:
+        return InputPeerUser(real_id, real_id * 7)
+    if peer_type is PeerChat:
+        return InputPeerChat(real_id)
+    return InputPeerChannel(real_id, real_id * 7)
+
+class SentRecord:
+    """One outbound call the fake client answered"""
+
+    __slots__ = ('time', 'kind', 'chat_id', 'message_id', 'text', 'source')
+
+    def __init__(self, kind: str, chat_id: int, message_id: int, text: Optional[str],
+                 source: Optional[Tuple[int, int]] = None):
+        self.time = time.perf_counter()
+        self.kind = kind
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.source = source  # (chat_id, message_id) of a forwarded message
+
+class FakeTelegramClient:
+    """Answers the client calls the userbot makes, without a network.
+
+    Every outbound call waits latency (+ up to jitter) seconds and, with
+    probability flood_rate, raises a FloodWaitError of flood_seconds.
+    emit_new_message() and emit_edit() build real Telethon events and run
+    them through the registered event builders' filters and handlers,
+    each update in its own task like the real client does.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0,
+                 flood_seconds: int = 1, self_id: int = 777000001, dialogs: List[int] = (), seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.parse_mode = None
+        self._self_id = self_id
+        self._mb_entity_cache = EntityCache()
+        self.dialogs = list(dialogs)  # marked chat ids the account is in
+        self.unresolvable = set()  # marked chat ids get_input_entity fails for
+        self.entity_lookups = 0
+        self.handlers: List[Tuple[Callable, events.common.EventBuilder]] = []
+        self.messages: Dict[Tuple[int, int], Message] = {}
+        self.message_ids = itertools.count(1)
+        self.sent: List[SentRecord] = []
+        self.floods = 0
+        self.update_tasks = set()
+        self.disconnected = None
+
+    # Connection
+
+    async def start(self, *args, **kwargs):
+        return self
+
+    async def connect(self):
+        pass
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def disconnect(self):
+        if self.disconnected is not None and not self.disconnected.done():
+            self.disconnected.set_result(None)
+
+    async def run_until_disconnected(self):
+        self.disconnected = asyncio.get_running_loop().create_future()
+        await self.disconnected
+
+    async def get_me(self, input_peer: bool = False):
+        if input_peer:
+            return InputPeerUser(self._self_id, 0)
+        return SimpleNamespace(id=self._self_id, username='fake', first_name='Fake', phone=None)
+
+    # Event handlers
+
+    def add_event_handler(self, callback: Callable, event: events.common.EventBuilder = None):
+        self.handlers.append((callback, event or events.Raw()))
+
+    def on(self, event: events.common.EventBuilder):
+        def decorator(callback):
+            self.add_event_handler(callback, event)
+            return callback
+        return decorator
+
+    def new_message(self, chat_id: int, text: str, out: bool = False, sender_id: Optional[int] = None,
+                    media=None, grouped_id: Optional[int] = None, store: bool = True) -> Message:
+        """Create a message in a chat as if it had just been posted"""
+        peer = _peer(chat_id)
+        message = Message(
+            id=next(self.message_ids),
+            peer_id=peer,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            message=text,
+            out=out,
+            from_id=PeerUser(sender_id) if sender_id is not None else None,
+            post=isinstance(peer, PeerChannel) and sender_id is None,
+            media=media,
+            grouped_id=grouped_id,
+        )
+        message._finish_init(self, {}, None)
+        if store:
+            self.messages[(message.chat_id, message.id)] = message
+        return message
+
+    def emit_new_message(self, chat_id: int, text: str, **kwargs) -> Message:
+        """Post a message and dispatch its NewMessage update"""
+        message = self.new_message(chat_id, text, **kwargs)
+        self._dispatch(events.NewMessage.Event(message))
+        return message
+
+    def emit_edit(self, message: Message, text: str) -> Message:
+        """Edit a message and dispatch its MessageEdited update"""
+        message.message = text
+        message._text = None
+        message.edit_date = datetime.datetime.now(datetime.timezone.utc)
+        self._dispatch(events.MessageEdited.Event(message))
+        return message
+
+    def _dispatch(self, event):
+        """Handle one update in its own task"""
+        task = asyncio.create_task(self._run_handlers(event))
+        self.update_tasks.add(task)
+        task.add_done_callback(self.update_tasks.discard)
+
+    async def _run_handlers(self, event):
+        """Run every handler whose builder accepts the event"""
+        event._set_client(self)
+        for callback, builder in self.handlers:
+            if type(event) is not builder.Event:
+                continue
+            if not builder.resolved:
+                await builder.resolve(self)
+            if not builder.filter(event):
+                continue
+            try:
+                await callback(event)
+            except events.StopPropagation:
+                break
+            except Exception as e:
+                logger.error(f"Unhandled error in event handler: {e}")
+
+    async def wait_idle(self):
+        """Wait for every dispatched update's handlers to return"""
+        while self.update_tasks:
+            await asyncio.gather(*list(self.update_tasks), return_exceptions=True)
+
+    # Outbound calls
+
+    async def _call(self):
+        """Simulate the network round trip of one request"""
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    def _outgoing(self, kind: str, entity, text: Optional[str], source: Optional[Tuple[int, int]] = None,
+                  media=None) -> Message:
+        """Create a message the account sent"""
+        chat_id = self._chat_id(entity)
+        # Copies aren't kept, so memory figures reflect the userbot itself
+        message = self.new_message(chat_id, text or '', out=True, media=media, store=False)
+        self.sent.append(SentRecord(kind, chat_id, message.id, text, source))
+        return message
+
+    def _chat_id(self, entity) -> int:
+        """Marked id of an entity argument"""
+        if entity == 'me':
+            return self._self_id
+        if isinstance(entity, int):
+            return entity
+        return utils.get_peer_id(entity)
+
+    async def send_message(self, entity, message: str = '', file=None, **kwargs) -> Message:
+        await self._call()
+        return self._outgoing('send', entity, message, media=file)
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        await self._call()
+        files = file if isinstance(file, list) else [file]
+        captions = caption if isinstance(caption, list) else [caption] + [None] * (len(files) - 1)
+        sent = [self._outgoing('file', entity, text, media=media) for media, text in zip(files, captions)]
+        return sent if isinstance(file, list) else sent[0]
+
+    async def forward_messages(self, entity, messages, from_peer=None, **kwargs):
+        await self._call()
+        single = not isinstance(messages, list)
+        items = [messages] if single else messages
+        sent = []
+        for item in items:
+            if isinstance(item, int):
+                source = (self._chat_id(from_peer), item)
+                original = self.messages.get(source)
+            else:
+                source = (item.chat_id, item.id)
+                original = item
+            text = original.message if original is not None else None
+            media = original.media if original is not None else None
+            sent.append(self._outgoing('forward', entity, text, source, media))
+        return sent[0] if single else sent
+
+    async def edit_message(self, entity, message=None, text=None, **kwargs) -> Message:
+        await self._call()
+        chat_id = self._chat_id(entity)
+        message_id = message if isinstance(message, int) else message.id
+        self.sent.append(SentRecord('edit', chat_id, message_id, text))
+        return self.new_message(chat_id, text, out=True, store=False)
+
+    async def get_messages(self, entity, ids=None, **kwargs):
+        chat_id = self._chat_id(entity)
+        if isinstance(ids, list):
+            return [self.messages.get((chat_id, message_id)) for message_id in ids]
+        return self.messages.get((chat_id, ids))
+
+    async def iter_messages(self, entity, limit: Optional[int] = None, offset_date=None, min_id: int = 0,
+                            reverse: bool = False, **kwargs):
+        chat_id = self._chat_id(entity)
+        found = [
+            message for (chat, message_id), message in self.messages.items()
+            if chat == chat_id and message_id > min_id
+            and (offset_date is None or (message.date > offset_date if reverse else message.date < offset_date))
+        ]
+        found.sort(key=lambda message: message.id, reverse=not reverse)
+        for message in found[:limit]:
+            yield message
+
+    async def get_input_entity(self, peer):
+        self.entity_lookups += 1
+        chat_id = self._chat_id(peer)
+        if chat_id in self.unresolvable:
+            raise ValueError(f"Could not find the input entity for {peer}")
+        return _input_peer(chat_id)
+
+    async def iter_dialogs(self, **kwargs):
+        for chat_id in self.dialogs:
+            yield SimpleNamespace(entity=_input_peer(chat_id), id=chat_id, title=f"Chat {chat_id}")
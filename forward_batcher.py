@@ -0,0 +1,94 @@
+"""
+Forward Batcher
+Collects bursts of unmodified forwards into multi-id forward_messages calls
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 100  # ids Telegram accepts in one forward
+
+class ForwardBatch:
+    """Messages from one source waiting to be forwarded by one rule"""
+
+    __slots__ = ('rule', 'destinations', 'events', 'slots', 'timer')
+
+    def __init__(self, rule: Dict):
+        self.rule = rule
+        self.destinations = list(rule['destinations'])
+        self.events = []
+        self.slots = []  # destination slots reserved by each message
+        self.timer = None
+
+class ForwardBatcher:
+    """Per (rule label, source chat) batches.
+
+    A batch is handed to the callback once the rule's batch_window has
+    passed since its first message, once it reaches batch_size, or when
+    flush() is called because a message that can't be batched arrived.
+    flush_destination() sends the batches holding slots on a destination
+    that another send is about to queue behind.
+    """
+
+    def __init__(self, on_batch: Callable[[Dict, List, List], Awaitable]):
+        self.on_batch = on_batch
+        self.batches: Dict[Tuple[str, int], ForwardBatch] = {}
+        self.by_destination: Dict[int, Set[Tuple[str, int]]] = {}  # dest id -> batches holding slots on it
+        self.batch_tasks = set()
+
+    def add(self, rule: Dict, event, slots: List):
+        """Add a message and the destination slots it reserved"""
+        key = (rule['label'], event.chat_id)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = ForwardBatch(rule)
+            for dest_id in batch.destinations:
+                self.by_destination.setdefault(dest_id, set()).add(key)
+            batch.timer = asyncio.get_running_loop().call_later(rule['batch_window'], self.flush, *key)
+
+        batch.events.append(event)
+        batch.slots.append(slots)
+
+        if len(batch.events) >= min(rule.get('batch_size', MAX_BATCH_SIZE), MAX_BATCH_SIZE):
+            self.flush(*key)
+
+    def flush(self, label: str, source_id: int):
+        """Send a pending batch now"""
+        batch = self.batches.pop((label, source_id), None)
+        if batch is None:
+            return
+
+        batch.timer.cancel()
+        for dest_id in batch.destinations:
+            keys = self.by_destination.get(dest_id)
+            if keys is not None:
+                keys.discard((label, source_id))
+                if not keys:
+                    del self.by_destination[dest_id]
+        task = asyncio.create_task(self._deliver(batch))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    def flush_destination(self, dest_id: int, keep: Optional[Tuple[str, int]] = None):
+        """Send every pending batch holding slots on a destination, except the batch keep"""
+        for key in list(self.by_destination.get(dest_id, ())):
+            if key != keep:
+                self.flush(*key)
+
+    async def _deliver(self, batch: ForwardBatch):
+        """Run the callback for one batch"""
+        try:
+            await self.on_batch(batch.rule, batch.events, batch.slots)
+        except Exception as e:
+            logger.error(f"Error forwarding batch for rule {batch.rule['label']}: {e}")
+
+    async def flush_all(self):
+        """Send every pending batch and wait for them"""
+        for key in list(self.batches):
+            self.flush(*key)
+
+        if self.batch_tasks:
+            await asyncio.gather(*self.batch_tasks, return_exceptions=True)
@@ -1,252 +1,1143 @@
-""" Forwarding Engine Handles message forwarding logic and rules management """
-
-import asyncio import logging import time from typing import Dict, List, Set from replacement_engine import ReplacementEngine
-
-logger = logging.getLogger(name)
-
-class ForwardingEngine: def init(self, client, config_manager): self.client = client self.config_manager = config_manager self.replacement_engine = ReplacementEngine(config_manager) self.forwarding_rules = {} self.message_cache = {}  # For tracking messages for editing self.active_tasks = set() self.running = False
-
-async def start(self):
-    """Start the forwarding engine"""
-    self.running = True
-    self.forwarding_rules = await self.config_manager.get_forwarding_rules()
-    logger.info("Forwarding engine started")
-
-async def stop(self):
-    """Stop the forwarding engine"""
-    self.running = False
-    logger.info("Forwarding engine stopped")
-
-async def restart(self):
-    """Restart the forwarding engine"""
-    await self.stop()
-    await self.start()
-
-async def add_forwarding_rule(self, label: str, source_ids: List[int], destination_ids: List[int]):
-    """Add a new forwarding rule"""
-    rule = {
-        'label': label,
-        'sources': source_ids,
-        'destinations': destination_ids,
-        'active': True,
-        'delay': 0,
-        'max_edit_time': 300,  # 5 minutes default
-        'created_at': time.time()
-    }
-
-    self.forwarding_rules[label] = rule
-    await self.config_manager.save_forwarding_rule(label, rule)
-    logger.info(f"Added forwarding rule: {label}")
-
-async def remove_forwarding_rule(self, label: str):
-    """Remove a forwarding rule"""
-    if label not in self.forwarding_rules:
-        raise ValueError(f"Forwarding rule '{label}' not found")
-
-    del self.forwarding_rules[label]
-    await self.config_manager.remove_forwarding_rule(label)
-    logger.info(f"Removed forwarding rule: {label}")
-
-async def start_forwarding_rule(self, label: str):
-    """Start a forwarding rule"""
-    if label not in self.forwarding_rules:
-        raise ValueError(f"Forwarding rule '{label}' not found")
-
-    self.forwarding_rules[label]['active'] = True
-    await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
-    logger.info(f"Started forwarding rule: {label}")
-
-async def stop_forwarding_rule(self, label: str):
-    """Stop a forwarding rule"""
-    if label not in self.forwarding_rules:
-        raise ValueError(f"Forwarding rule '{label}' not found")
-
-    self.forwarding_rules[label]['active'] = False
-    await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
-    logger.info(f"Stopped forwarding rule: {label}")
-
-async def set_forwarding_delay(self, label: str, delay: int):
-    """Set delay for a forwarding rule"""
-    if label not in self.forwarding_rules:
-        raise ValueError(f"Forwarding rule '{label}' not found")
-
-    self.forwarding_rules[label]['delay'] = delay
-    await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
-    logger.info(f"Set delay for {label}: {delay}s")
-
-async def set_max_edit_time(self, label: str, max_time: int):
-    """Set max edit time for a forwarding rule"""
-    if label not in self.forwarding_rules:
-        raise ValueError(f"Forwarding rule '{label}' not found")
-
-    self.forwarding_rules[label]['max_edit_time'] = max_time
-    await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
-    logger.info(f"Set max edit time for {label}: {max_time}s")
-
-async def get_active_tasks(self):
-    """Get list of active forwarding tasks"""
-    return [
-        {
-            'label': rule['label'],
-            'sources': rule['sources'],
-            'destinations': rule['destinations'],
-            'active': rule['active'],
-            'delay': rule['delay'],
-            'max_edit_time': rule['max_edit_time']
+"""
+Forwarding Engine
+Handles message forwarding logic and rules management
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from telethon import events
+from telethon.errors import FileReferenceExpiredError
+from replacement_engine import ReplacementEngine, REPLACEMENT_SECONDS
+from delivery_scheduler import DeliveryScheduler
+from rate_limiter import RATE_LIMIT_DEFAULTS
+from edit_cache import EditCache, DEFAULT_MAX_ENTRIES
+from mapping_store import MappingStore
+from delivery_queue import DeliveryQueue
+from dedup_window import DedupWindow, fingerprint
+from peer_cache import PeerCache
+from edit_debouncer import EditDebouncer, EDIT_DEBOUNCE_WINDOW
+from album_collector import AlbumCollector
+from forward_batcher import ForwardBatcher, MAX_BATCH_SIZE
+from media_cache import DEFAULT_MAX_MEDIA
+from client_pool import ClientPool, LISTENER
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EDIT_CACHE_SWEEP_INTERVAL = 60  # seconds
+CATCHUP_MAX_AGE = 3600  # seconds; older missed messages are not forwarded, 0 disables catch-up
+CATCHUP_CONCURRENCY = 2  # source chats caught up at once
+CATCHUP_BATCH_SIZE = 100  # messages per iter_messages call
+PEER_RESOLVE_CONCURRENCY = 8  # chats resolved at once
+SHUTDOWN_DRAIN_TIMEOUT = 10  # seconds to let delayed sends finish before the stores close
+
+MESSAGES_RECEIVED = REGISTRY.counter('userbot_messages_received_total', 'Messages from source chats seen by the engine')
+MESSAGES_MATCHED = REGISTRY.counter('userbot_messages_matched_total', 'Messages or albums matched by a rule', ('rule',))
+MESSAGES_FORWARDED = REGISTRY.counter('userbot_messages_forwarded_total', 'Messages with at least one copy sent', ('rule',))
+COPIES_SENT = REGISTRY.counter('userbot_copies_sent_total', 'Copies sent to destinations', ('rule',))
+SEND_SECONDS = REGISTRY.histogram('userbot_send_seconds', 'Time to send one copy, including rate limiting', ('destination',))
+SEND_FAILURES = REGISTRY.counter('userbot_send_failures_total', 'Copies that could not be sent', ('destination',))
+DUPLICATES_SUPPRESSED = REGISTRY.counter('userbot_duplicates_suppressed_total', 'Messages dropped as reposts', ('rule',))
+COPY_EDITS = REGISTRY.counter('userbot_copy_edits_total', 'Edits made to forwarded copies')
+EDITS_UNCHANGED = REGISTRY.counter('userbot_edits_unchanged_total', 'Copy edits skipped because the text would not change')
+CATCHUP_MESSAGES = REGISTRY.counter('userbot_catchup_messages_total', 'Missed messages forwarded by catch-up')
+
+class ForwardingEngine:
+    def __init__(self, client, config_manager, client_pool: ClientPool = None):
+        self.client = client
+        self.client_pool = client_pool or ClientPool(client)
+        self.peer_cache = PeerCache()  # Input peers with access hashes, per account
+        self.client_pool.peer_cache = self.peer_cache
+        self.marked_ids = {}  # chat id as written in a rule -> marked id it resolved to
+        self.config_manager = config_manager
+        self.replacement_engine = ReplacementEngine(config_manager)
+        self.forwarding_rules = {}
+        self.routing_index = {}  # chat id -> active rules reading from it
+        self.routing_labels = {}  # chat id -> labels of the rules in routing_index[chat id]
+        self.message_cache = EditCache()  # For tracking messages for editing
+        self.mapping_store = MappingStore()  # Survives restarts, backs message_cache
+        self.delivery_queue = DeliveryQueue()  # Deliveries not sent yet, replayed after a restart
+        self.source_positions = {}  # source chat -> newest accepted message id
+        self.live_first_ids = {}  # source chat -> first message id seen live since start
+        self.catch_up_task = None
+        self.held_live = {}  # source chat being caught up on -> live events waiting behind it
+        self.dedup_windows = {}  # label -> DedupWindow, for rules with a dedup window
+        self.active_tasks = set()
+        self.cache_sweeper = None
+        self.destination_tails = {}  # dest id -> future of the last send queued for it
+        self.delivery_scheduler = DeliveryScheduler(self._deliver_delayed)
+        self.album_collector = AlbumCollector(self._process_album)
+        self.edit_debouncer = EditDebouncer(self._apply_edit)
+        self.forward_batcher = ForwardBatcher(self._forward_batch)
+        self.running = False
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Expose component state that is read when metrics are scraped"""
+        REGISTRY.collector(
+            'userbot_delay_queue_depth', 'gauge', 'Deliveries waiting for their rule delay',
+            lambda: [('userbot_delay_queue_depth', {}, self.delivery_scheduler.pending_count)]
+        )
+        REGISTRY.collector(
+            'userbot_edit_cache_entries', 'gauge', 'Source messages tracked for edits',
+            lambda: [('userbot_edit_cache_entries', {}, len(self.message_cache))]
+        )
+        REGISTRY.collector(
+            'userbot_flood_wait_seconds_total', 'counter', 'FloodWait seconds requested by Telegram',
+            lambda: [
+                ('userbot_flood_wait_seconds_total', {'account': name}, account.rate_limiter.flood_wait_seconds)
+                for name, account in self.client_pool.accounts.items()
+            ]
+        )
+        REGISTRY.collector(
+            'userbot_flood_waits_total', 'counter', 'FloodWait errors received',
+            lambda: [
+                ('userbot_flood_waits_total', {'account': name}, account.rate_limiter.flood_waits)
+                for name, account in self.client_pool.accounts.items()
+            ]
+        )
+
+    async def start(self):
+        """Start the forwarding engine"""
+        self.running = True
+        self.client_pool.set_listener(self.client)
+        self.client_pool.configure(
+            {
+                key: await self.config_manager.get_setting(key, default)
+                for key, default in RATE_LIMIT_DEFAULTS.items()
+            },
+            await self.config_manager.get_setting('media_cache_max_entries', DEFAULT_MAX_MEDIA)
+        )
+        await self.peer_cache.open()
+        await self.client_pool.refresh_memberships()
+        self.message_cache.max_entries = await self.config_manager.get_setting(
+            'edit_cache_max_entries', DEFAULT_MAX_ENTRIES
+        )
+        self.edit_debouncer.window = await self.config_manager.get_setting(
+            'edit_debounce_window', EDIT_DEBOUNCE_WINDOW
+        )
+        await self.mapping_store.open()
+        await self.delivery_queue.open()
+        await self.replacement_engine.start()
+        self.forwarding_rules = await self.config_manager.get_forwarding_rules()
+        self._rebuild_routing_index()
+        for label, rule in self.forwarding_rules.items():
+            self._set_dedup_window(label, rule.get('dedup_window', 0))
+        await self._warm_peers()
+        self.delivery_scheduler.start()
+        if self.cache_sweeper is None or self.cache_sweeper.done():
+            self.cache_sweeper = asyncio.create_task(self._sweep_edit_cache())
+
+        for chat_id, message_id in (await self.delivery_queue.load_positions()).items():
+            self.source_positions[chat_id] = max(message_id, self.source_positions.get(chat_id, 0))
+        self.live_first_ids = {}
+        # Chats forwarded from before may have a gap; their live messages wait
+        # until catch-up has forwarded the older ones
+        self.held_live = {
+            chat_id: deque() for chat_id in self.source_positions if chat_id in self.routing_index
+        }
+        if self.catch_up_task is None or self.catch_up_task.done():
+            self.catch_up_task = asyncio.create_task(self._catch_up())
+        logger.info("Forwarding engine started")
+
+    async def stop(self):
+        """Stop the forwarding engine"""
+        if self.catch_up_task is not None:
+            self.catch_up_task.cancel()
+            self.catch_up_task = None
+        # Held messages were never accepted, so the next start catches up on them
+        self.held_live = {}
+        await self.album_collector.flush_all()
+        await self.forward_batcher.flush_all()
+        await self.edit_debouncer.flush_all()
+        self.running = False
+        await self.delivery_scheduler.stop()
+        # Sends still running must settle before the delivery queue closes
+        cancelled = await self.delivery_scheduler.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        if cancelled:
+            logger.warning(f"Cancelled {cancelled} delayed deliveries at shutdown; they are replayed on the next start")
+        if self.cache_sweeper is not None:
+            self.cache_sweeper.cancel()
+            self.cache_sweeper = None
+        await self.mapping_store.close()
+        await self.delivery_queue.close()
+        await self.peer_cache.close()
+        await self.replacement_engine.stop()
+        logger.info("Forwarding engine stopped")
+
+    async def restart(self):
+        """Restart the forwarding engine"""
+        await self.stop()
+        await self.start()
+
+    async def add_forwarding_rule(self, label: str, source_ids: List[int], destination_ids: List[int]):
+        """Add a new forwarding rule"""
+        # Fail now rather than on every message
+        unresolved = await self._resolve_chats(set(source_ids) | set(destination_ids))
+        if unresolved:
+            raise ValueError(f"Cannot resolve chats: {', '.join(map(str, sorted(unresolved)))}")
+
+        rule = {
+            'label': label,
+            'sources': source_ids,
+            'destinations': destination_ids,
+            'active': True,
+            'delay': 0,
+            'max_edit_time': 300,  # 5 minutes default
+            'batch_window': 0,  # seconds; 0 disables batching
+            'batch_size': MAX_BATCH_SIZE,
+            'dedup_window': 0,  # seconds; 0 forwards reposts too
+            'created_at': time.time()
+        }
+
+        if label in self.forwarding_rules:
+            self._unindex_rule(self.forwarding_rules[label])
+
+        self.forwarding_rules[label] = rule
+        self._index_rule(rule)
+        self.dedup_windows.pop(label, None)
+        await self.config_manager.save_forwarding_rule(label, rule)
+        logger.info(f"Added forwarding rule: {label}")
+
+    async def remove_forwarding_rule(self, label: str):
+        """Remove a forwarding rule"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+
+        self._unindex_rule(self.forwarding_rules[label])
+        del self.forwarding_rules[label]
+        self.delivery_scheduler.cancel(label)
+        self.dedup_windows.pop(label, None)
+        await self.config_manager.remove_forwarding_rule(label)
+        logger.info(f"Removed forwarding rule: {label}")
+
+    async def start_forwarding_rule(self, label: str):
+        """Start a forwarding rule"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+
+        self.forwarding_rules[label]['active'] = True
+        self._index_rule(self.forwarding_rules[label])
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Started forwarding rule: {label}")
+
+    async def stop_forwarding_rule(self, label: str):
+        """Stop a forwarding rule"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+
+        self.forwarding_rules[label]['active'] = False
+        self._unindex_rule(self.forwarding_rules[label])
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Stopped forwarding rule: {label}")
+
+    async def set_forwarding_delay(self, label: str, delay: int):
+        """Set delay for a forwarding rule"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+
+        self.forwarding_rules[label]['delay'] = delay
+        self.delivery_scheduler.set_delay(label, delay)
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Set delay for {label}: {delay}s")
+
+    async def set_max_edit_time(self, label: str, max_time: int):
+        """Set max edit time for a forwarding rule"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+
+        self.forwarding_rules[label]['max_edit_time'] = max_time
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Set max edit time for {label}: {max_time}s")
+
+    async def set_batching(self, label: str, window: float, max_size: int = MAX_BATCH_SIZE):
+        """Set the micro-batching window and size cap for a forwarding rule.
+
+        A pending batch is sent before its window is up when another rule
+        or a message that can't be batched sends to one of its destinations.
+        """
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+        if window < 0 or not 1 <= max_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"Batch window must be >= 0 and size between 1 and {MAX_BATCH_SIZE}")
+
+        self.forwarding_rules[label]['batch_window'] = window
+        self.forwarding_rules[label]['batch_size'] = max_size
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Set batching for {label}: {window}s, up to {max_size} messages")
+
+    async def set_dedup_window(self, label: str, window: float):
+        """Set how long a rule drops reposts of content it already forwarded"""
+        if label not in self.forwarding_rules:
+            raise ValueError(f"Forwarding rule '{label}' not found")
+        if window < 0:
+            raise ValueError("Dedup window must be >= 0")
+
+        self.forwarding_rules[label]['dedup_window'] = window
+        self._set_dedup_window(label, window)
+        await self.config_manager.save_forwarding_rule(label, self.forwarding_rules[label])
+        logger.info(f"Set dedup window for {label}: {window}s")
+
+    def _set_dedup_window(self, label: str, window: float):
+        """Create, resize or drop a rule's dedup window"""
+        if not window:
+            self.dedup_windows.pop(label, None)
+        elif label in self.dedup_windows:
+            self.dedup_windows[label].window = window
+        else:
+            self.dedup_windows[label] = DedupWindow(window)
+
+    async def get_active_tasks(self):
+        """Get list of active forwarding tasks"""
+        return [
+            {
+                'label': rule['label'],
+                'sources': rule['sources'],
+                'destinations': rule['destinations'],
+                'active': rule['active'],
+                'delay': rule['delay'],
+                'max_edit_time': rule['max_edit_time'],
+                'batch_window': rule.get('batch_window', 0),
+                'dedup_window': rule.get('dedup_window', 0)
+            }
+            for rule in self.forwarding_rules.values()
+        ]
+
+    @staticmethod
+    def _source_keys(rule_source: int) -> Set[int]:
+        """Get every chat id a rule source matches (handles both formats)"""
+        keys = {rule_source}
+        source_str = str(rule_source)
+        if source_str.startswith('-100'):
+            if len(source_str) > 4:
+                bare_id = int(source_str[4:])
+                keys.add(bare_id)
+                keys.add(-bare_id)
+        else:
+            keys.add(int(f"-100{abs(rule_source)}"))
+        return keys
+
+    @staticmethod
+    def _marked_id(chat_id: int) -> int:
+        """Marked form of a rule chat id; bare negative ids are channels"""
+        if chat_id < 0 and not str(chat_id).startswith('-100'):
+            return int(f"-100{abs(chat_id)}")
+        return chat_id
+
+    async def _resolve_chat(self, chat_id: int) -> int:
+        """Resolve a rule chat id for the listener; returns the marked id it resolved to"""
+        candidates = [self._marked_id(chat_id)]
+        if chat_id > 0:
+            candidates.append(int(f"-100{chat_id}"))  # a bare channel id rather than a user
+        for candidate in candidates:
+            try:
+                await self.peer_cache.resolve(LISTENER, self.client, candidate)
+            except Exception as e:
+                logger.debug(f"Could not resolve {candidate}: {e}")
+                continue
+            self.marked_ids[chat_id] = candidate
+            return candidate
+        raise ValueError(f"Cannot resolve chat {chat_id}")
+
+    async def _resolve_chats(self, chat_ids) -> List[int]:
+        """Resolve chats concurrently; returns the ones that could not be resolved"""
+        limit = asyncio.Semaphore(PEER_RESOLVE_CONCURRENCY)
+
+        async def resolve(chat_id):
+            async with limit:
+                try:
+                    await self._resolve_chat(chat_id)
+                except ValueError:
+                    return chat_id
+
+        unresolved = [chat_id for chat_id in await asyncio.gather(*map(resolve, chat_ids)) if chat_id is not None]
+        if unresolved:
+            # Chats Telethon hasn't seen yet can be found in the dialog list
+            try:
+                await self.peer_cache.load_dialogs(LISTENER, self.client)
+            except Exception as e:
+                logger.error(f"Error loading dialogs: {e}")
+            unresolved = [chat_id for chat_id in await asyncio.gather(*map(resolve, unresolved)) if chat_id is not None]
+        for chat_id in unresolved:
+            self.marked_ids.setdefault(chat_id, self._marked_id(chat_id))
+        return unresolved
+
+    async def _warm_peers(self):
+        """Resolve every chat the rules use before the first message arrives"""
+        chat_ids = {
+            chat_id
+            for rule in self.forwarding_rules.values()
+            for chat_id in rule['sources'] + rule['destinations']
         }
-        for rule in self.forwarding_rules.values()
-    ]
-
-async def process_message(self, event):
-    """Process incoming message for forwarding"""
-    if not self.running:
-        logger.debug("Forwarding engine not running, skipping message")
-        return
-
-    source_id = event.chat_id
-    logger.info(f"Processing message from {source_id}")
-
-    # Find applicable forwarding rules
-    applicable_rules = []
-    for rule in self.forwarding_rules.values():
-        logger.debug(f"Checking rule {rule['label']}: active={rule['active']}, sources={rule['sources']}")
-        logger.debug(f"Source ID: {source_id}, Rule sources: {rule['sources']}")
-
-        # Check if source matches (handle both formats)
-        source_match = False
+        unresolved = await self._resolve_chats(chat_ids)
+        if unresolved:
+            logger.warning(f"Could not resolve chats {sorted(unresolved)}, sending to them by id")
+
+    def _input_peer(self, account, chat_id: int):
+        """Pre-resolved input peer of a chat for an account, or its marked id if there is none"""
+        chat_id = self.marked_ids.get(chat_id, chat_id)
+        return self.peer_cache.get(account.name, chat_id) or chat_id
+
+    def _index_rule(self, rule: Dict):
+        """Add an active rule to the routing index"""
+        if not rule['active']:
+            return
+
         for rule_source in rule['sources']:
-            if source_id == rule_source:
-                source_match = True
-                break
-            elif str(source_id).startswith('-100') and source_id == int(f"-100{abs(rule_source)}"):
-                source_match = True
-                break
-            elif str(rule_source).startswith('-100') and rule_source == int(f"-100{abs(source_id)}"):
-                source_match = True
-                break
+            for key in self._source_keys(rule_source):
+                labels = self.routing_labels.setdefault(key, set())
+                if rule['label'] not in labels:
+                    labels.add(rule['label'])
+                    self.routing_index.setdefault(key, []).append(rule)
+
+    def _unindex_rule(self, rule: Dict):
+        """Remove a rule from the routing index"""
+        for rule_source in rule['sources']:
+            for key in self._source_keys(rule_source):
+                rules = self.routing_index.get(key)
+                if not rules:
+                    continue
+                self.routing_index[key] = [r for r in rules if r is not rule]
+                self.routing_labels[key].discard(rule['label'])
+                if not self.routing_index[key]:
+                    del self.routing_index[key]
+                    del self.routing_labels[key]
+
+    def is_source_chat(self, chat_id: int) -> bool:
+        """Check whether any active rule reads from a chat"""
+        return chat_id in self.routing_index
+
+    def _rebuild_routing_index(self):
+        """Rebuild the routing index from all forwarding rules"""
+        self.routing_index = {}
+        self.routing_labels = {}
+        for rule in self.forwarding_rules.values():
+            self._index_rule(rule)
+
+    async def process_message(self, event, catch_up: bool = False):
+        """Process incoming message for forwarding"""
+        if not self.running:
+            logger.debug("Forwarding engine not running, skipping message")
+            return
+
+        source_id = event.chat_id
+        MESSAGES_RECEIVED.inc()
+        logger.info(f"Processing message from {source_id}")
+
+        # Find applicable forwarding rules
+        applicable_rules = self.routing_index.get(source_id)
+
+        if not applicable_rules:
+            logger.debug(f"No applicable rules found for source {source_id}")
+            return
+
+        if not catch_up:
+            # Catch-up stops where live updates took over
+            self.live_first_ids.setdefault(source_id, event.message.id)
+            held = self.held_live.get(source_id)
+            if held is not None:
+                # Older messages of this chat are still being caught up on
+                held.append(event)
+                return
+
+        await self._route_message(event)
+
+    async def _route_message(self, event):
+        """Forward a message, or collect it if it is part of an album"""
+        source_id = event.chat_id
+        applicable_rules = self.routing_index.get(source_id)
+        if not applicable_rules:
+            return
+
+        if getattr(event.message, 'grouped_id', None):
+            # Album parts arrive one by one; forward them together
+            self.album_collector.add(event)
+            return
 
-        if rule['active'] and source_match:
-            applicable_rules.append(rule)
-            logger.info(f"Found applicable rule: {rule['label']}")
+        # An album posted earlier must take its destination slots first
+        await self.album_collector.flush_chat(source_id)
+        await self._apply_rules(event, applicable_rules)
 
-    if not applicable_rules:
-        logger.warning(f"No applicable rules found for source {source_id}")
-        logger.info(f"Available rules: {[(rule['label'], rule['sources']) for rule in self.forwarding_rules.values()]}")
-        return
+    async def _process_album(self, events):
+        """Process a complete album for forwarding"""
+        if not self.running:
+            return
 
-    for rule in applicable_rules:
+        applicable_rules = self.routing_index.get(events[0].chat_id)
+        if applicable_rules:
+            await self._apply_rules(events, applicable_rules)
+
+    async def _apply_rules(self, item, rules):
+        """Forward a message or album with each rule, now or after its delay"""
+        # Copy so rule changes made while forwarding don't affect this message
+        rules = self._drop_duplicates(item, list(rules))
+        if not rules:
+            return
+        await self._persist_deliveries(item, rules)
+        for rule in rules:
+            try:
+                MESSAGES_MATCHED.inc(rule['label'])
+                logger.info(f"Processing rule {rule['label']}")
+                # With the delay just set to 0, messages still waiting under the
+                # old delay go first
+                if rule['delay'] > 0 or self.delivery_scheduler.has_pending(rule['label']):
+                    self.delivery_scheduler.schedule(rule['label'], rule['delay'], item)
+                else:
+                    await self._forward_item(item, rule)
+            except Exception as e:
+                logger.error(f"Error forwarding message with rule {rule['label']}: {e}")
+
+    def _drop_duplicates(self, item, rules):
+        """Leave out the rules that forwarded the same content within their dedup window"""
+        key = None
+        accepted = []
+        for rule in rules:
+            window = self.dedup_windows.get(rule['label'])
+            if window is not None:
+                if key is None:
+                    parts = item if isinstance(item, list) else [item]
+                    key = fingerprint([event.message for event in parts])
+                if key is not None and window.seen(key):
+                    DUPLICATES_SUPPRESSED.inc(rule['label'])
+                    logger.info(f"Skipping repost for rule {rule['label']}")
+                    continue
+            accepted.append(rule)
+        return accepted
+
+    @staticmethod
+    def _item_key(item):
+        """Get the source chat and message ids of a message event or album"""
+        parts = item if isinstance(item, list) else [item]
+        return parts[0].chat_id, [event.message.id for event in parts]
+
+    async def _persist_deliveries(self, item, rules):
+        """Write a delivery job per rule and destination before anything is sent"""
+        source_chat, message_ids = self._item_key(item)
+        ids = ','.join(str(message_id) for message_id in message_ids)
+        now = time.time()
+        newest = max(message_ids)
+        if newest > self.source_positions.get(source_chat, 0):
+            self.source_positions[source_chat] = newest
+        self.delivery_queue.advance(source_chat, newest)
         try:
-            logger.info(f"Processing rule {rule['label']}")
-            await self._forward_message(event, rule)
+            await self.delivery_queue.put([
+                (source_chat, message_ids[0], ids, rule['label'], dest_id, now + rule['delay'])
+                for rule in rules
+                for dest_id in rule['destinations']
+            ])
         except Exception as e:
-            logger.error(f"Error forwarding message with rule {rule['label']}: {e}")
+            logger.error(f"Could not persist deliveries for {source_chat}, sending anyway: {e}")
 
-async def _forward_message(self, event, rule):
-    """Forward a message according to a rule"""
-    try:
-        if rule['delay'] > 0:
-            await asyncio.sleep(rule['delay'])
+    def _settle_deliveries(self, source_chat: int, source_msg: int, rule, results):
+        """Mark the deliveries that went out as done, and give up on the ones that failed"""
+        sent = []
+        failed = []
+        for dest_id, result in zip(rule['destinations'], results):
+            (failed if result is None else sent).append(dest_id)
+        if sent:
+            self.delivery_queue.complete(source_chat, source_msg, rule['label'], sent)
+        if failed:
+            self.delivery_queue.fail(source_chat, source_msg, rule['label'], failed)
 
-        message = event.message
-        original_text = message.text or message.caption or ""
+    async def _forward_item(self, item, rule, first_id: Optional[int] = None):
+        """Forward a single message event or a list of album events.
 
-        processed_text = await self.replacement_engine.process_text(original_text)
+        first_id is the album's first message id as persisted, for replays
+        of albums whose first part has since been deleted.
+        """
+        if isinstance(item, list):
+            await self._forward_album(item, rule, first_id)
+        else:
+            await self._forward_message(item, rule)
 
-        message_key = f"{event.chat_id}_{message.id}"
-        self.message_cache[message_key] = {
-            'rule': rule,
-            'forwarded_messages': [],
-            'timestamp': time.time()
-        }
+    @staticmethod
+    def _message_text(message) -> str:
+        """Get a message's text or media caption"""
+        return message.text or getattr(message, 'caption', None) or ""
+
+    async def _forward_message(self, event, rule):
+        """Forward a message according to a rule"""
+        try:
+            # Claim a place in each destination's queue before anything can
+            # yield, so later messages never overtake this one
+            slots = self._reserve_destination_slots(rule['destinations'], (rule['label'], event.chat_id))
 
-        for dest_id in rule['destinations']:
             try:
-                actual_dest_id = dest_id
-                if not str(dest_id).startswith('-100') and dest_id < 0:
-                    actual_dest_id = int(f"-100{abs(dest_id)}")
+                message = event.message
+                original_text = self._message_text(message)
 
-                logger.info(f"Forwarding to destination: {actual_dest_id}")
+                processed_text = await self.replacement_engine.process_text(original_text)
 
-                if message.media:
-                    if processed_text != original_text:
-                        forwarded_msg = await self.client.send_message(
+                if message.media and processed_text == original_text and rule.get('batch_window', 0) > 0:
+                    # The batch now owns the reserved slots and releases them
+                    self.forward_batcher.add(rule, event, slots)
+                    slots = None
+                    return
+
+                # Anything batched earlier from this source has to go first
+                self.forward_batcher.flush(rule['label'], event.chat_id)
+
+                async def send(actual_dest_id):
+                    if message.media:
+                        if processed_text != original_text:
+                            return await self.client_pool.call(
+                                actual_dest_id,
+                                self._send_with_media,
+                                actual_dest_id,
+                                processed_text,
+                                [message],
+                                source=event.chat_id
+                            )
+                        return await self.client_pool.call(
                             actual_dest_id,
-                            processed_text,
-                            file=message.media
-                        )
-                    else:
-                        forwarded_msg = await self.client.forward_messages(
+                            self._forward_messages,
                             actual_dest_id,
-                            message
+                            [message],
+                            source=event.chat_id
                         )
-                else:
-                    forwarded_msg = await self.client.send_message(
+                    return await self.client_pool.call(
+                        actual_dest_id,
+                        self._send_text,
                         actual_dest_id,
                         processed_text or original_text
                     )
 
-                if isinstance(forwarded_msg, list):
-                    forwarded_msg = forwarded_msg[0]
+                results = await self._fan_out(event.chat_id, rule['destinations'], slots, send)
+                self._settle_deliveries(event.chat_id, message.id, rule, results)
 
-                self.message_cache[message_key]['forwarded_messages'].append({
-                    'chat_id': dest_id,
-                    'message_id': forwarded_msg.id
-                })
+                forwarded = []
+                for dest_id, sent in zip(rule['destinations'], results):
+                    if sent is None:
+                        continue
+                    account, forwarded_msg = sent
+                    if isinstance(forwarded_msg, list):
+                        forwarded_msg = forwarded_msg[0]
+                    if forwarded_msg is not None:
+                        forwarded.append((dest_id, forwarded_msg.id, account))
 
-                logger.info(f"Forwarded message from {event.chat_id} to {dest_id}")
+                self._record_forwarded(event.chat_id, message.id, rule, forwarded, processed_text or original_text)
+            finally:
+                if slots is not None:
+                    for dest_id, (previous, done) in zip(rule['destinations'], slots):
+                        self._release_destination_slot(dest_id, done)
 
-            except Exception as e:
-                logger.error(f"Error forwarding to {dest_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error in _forward_message: {e}")
 
-    except Exception as e:
-        logger.error(f"Error in _forward_message: {e}")
+    async def _forward_batch(self, rule, events, slots):
+        """Forward a batch of messages with one forward_messages call per destination"""
+        try:
+            messages = [event.message for event in events]
+            source_id = events[0].chat_id
 
-async def process_edited_message(self, event):
-    """Process edited message for updating forwarded messages"""
-    if not self.running:
-        return
+            async def send(actual_dest_id):
+                return await self.client_pool.call(
+                    actual_dest_id,
+                    self._forward_messages,
+                    actual_dest_id,
+                    messages,
+                    source=source_id
+                )
 
-    message_key = f"{event.chat_id}_{event.message.id}"
+            async def send_batch(index, dest_id):
+                # Sent once the first message's turn comes; the later
+                # messages' slots are released together with it
+                previous, done = slots[0][index]
+                try:
+                    return await self._send_to_destination(source_id, dest_id, previous, done, send)
+                finally:
+                    for member_slots in slots[1:]:
+                        self._release_destination_slot(dest_id, member_slots[index][1])
 
-    if message_key not in self.message_cache:
-        return
+            results = await asyncio.gather(*(
+                send_batch(index, dest_id) for index, dest_id in enumerate(rule['destinations'])
+            ))
 
-    cache_entry = self.message_cache[message_key]
-    rule = cache_entry['rule']
+            for position, message in enumerate(messages):
+                self._settle_deliveries(source_id, message.id, rule, results)
+                self._record_forwarded(
+                    source_id, message.id, rule, self._copies_at(rule, results, position), self._message_text(message)
+                )
 
-    if time.time() - cache_entry['timestamp'] > rule['max_edit_time']:
-        del self.message_cache[message_key]
-        return
+            logger.info(f"Forwarded batch of {len(messages)} messages with rule {rule['label']}")
 
-    try:
-        original_text = event.message.text or event.message.caption or ""
-        processed_text = await self.replacement_engine.process_text(original_text)
+        except Exception as e:
+            logger.error(f"Error in _forward_batch: {e}")
+
+        finally:
+            for member_slots in slots:
+                for dest_id, (previous, done) in zip(rule['destinations'], member_slots):
+                    self._release_destination_slot(dest_id, done)
+
+    async def _forward_album(self, events, rule, first_id: Optional[int] = None):
+        """Forward an album with one call per destination"""
+        try:
+            slots = self._reserve_destination_slots(rule['destinations'])
 
-        for forwarded_msg in cache_entry['forwarded_messages']:
             try:
-                await self.client.edit_message(
-                    forwarded_msg['chat_id'],
-                    forwarded_msg['message_id'],
-                    processed_text or original_text
+                messages = [event.message for event in events]
+                original_texts = [self._message_text(message) for message in messages]
+                processed_texts = [
+                    await self.replacement_engine.process_text(text) for text in original_texts
+                ]
+
+                source_id = events[0].chat_id
+
+                async def send(actual_dest_id):
+                    if processed_texts == original_texts:
+                        return await self.client_pool.call(
+                            actual_dest_id,
+                            self._forward_messages,
+                            actual_dest_id,
+                            messages,
+                            source=source_id
+                        )
+                    return await self.client_pool.call(
+                        actual_dest_id,
+                        self._send_with_media,
+                        actual_dest_id,
+                        processed_texts,
+                        messages,
+                        source=source_id
+                    )
+
+                results = await self._fan_out(source_id, rule['destinations'], slots, send)
+                self._settle_deliveries(source_id, first_id or messages[0].id, rule, results)
+
+                for index, message in enumerate(messages):
+                    self._record_forwarded(
+                        source_id, message.id, rule, self._copies_at(rule, results, index), processed_texts[index]
+                    )
+            finally:
+                for dest_id, (previous, done) in zip(rule['destinations'], slots):
+                    self._release_destination_slot(dest_id, done)
+
+        except Exception as e:
+            logger.error(f"Error in _forward_album: {e}")
+
+    @staticmethod
+    def _copies_at(rule, results, index: int) -> List:
+        """Get the (dest, message id, account) copies of the index-th message of a multi-message send"""
+        forwarded = []
+        for dest_id, sent in zip(rule['destinations'], results):
+            if sent is None:
+                continue
+            account, copies = sent
+            if copies and index < len(copies) and copies[index] is not None:
+                forwarded.append((dest_id, copies[index].id, account))
+        return forwarded
+
+    async def _send_text(self, account, dest_id, text):
+        """Send a text message from an account"""
+        return await account.client.send_message(self._input_peer(account, dest_id), text)
+
+    async def _forward_messages(self, account, dest_id, messages):
+        """Forward messages from an account; returns one copy per message"""
+        peer = self._input_peer(account, dest_id)
+        if account.name == LISTENER:
+            return await account.client.forward_messages(peer, messages)
+
+        # Message objects carry the listener's access hashes; other accounts
+        # forward by id from their own view of the source chat
+        return await account.client.forward_messages(
+            peer,
+            [message.id for message in messages],
+            from_peer=self._input_peer(account, messages[0].chat_id)
+        )
+
+    async def _send_with_media(self, account, dest_id, text, messages):
+        """Send new text with the messages' media, reusing resolved input media"""
+        media_cache = account.media_cache
+        try:
+            files = [await media_cache.resolve(message) for message in messages]
+        except Exception as e:
+            logger.debug(f"Sending media without the cache: {e}")
+            files = [message.media for message in messages]
+
+        try:
+            return await self._send_files(account, dest_id, text, files)
+        except FileReferenceExpiredError:
+            logger.info(f"File reference expired, refreshing media for {dest_id}")
+            files = [await media_cache.refresh(message) for message in messages]
+            return await self._send_files(account, dest_id, text, files)
+
+    async def _send_files(self, account, dest_id, text, files):
+        """Send one media message, or an album (a list of copies) when text is a list of captions"""
+        peer = self._input_peer(account, dest_id)
+        if len(files) == 1 and not isinstance(text, list):
+            return await account.client.send_message(peer, text, file=files[0])
+        return await account.client.send_file(peer, files, caption=text)
+
+    async def _edit_copy(self, account, chat_id, message_id, text):
+        """Edit a copy with the account that sent it"""
+        return await account.client.edit_message(self._input_peer(account, chat_id), message_id, text)
+
+    def _record_forwarded(self, source_chat: int, source_msg: int, rule, forwarded, text: str = None):
+        """Remember forwarded copies, and the text they show, so edits can be mirrored"""
+        if not forwarded:
+            return
+
+        MESSAGES_FORWARDED.inc(rule['label'])
+        COPIES_SENT.inc(rule['label'], amount=len(forwarded))
+        # Copies are kept under the marked id they were sent to, so edits hit the same rate limit buckets
+        forwarded = [
+            (self.marked_ids.get(chat_id, chat_id), message_id, account) for chat_id, message_id, account in forwarded
+        ]
+        self.message_cache.add((source_chat, source_msg), rule['label'], rule['max_edit_time'], forwarded, text=text)
+        now = time.time()
+        self.mapping_store.add([
+            (source_chat, source_msg, rule['label'], chat_id, message_id, now, account)
+            for chat_id, message_id, account in forwarded
+        ])
+
+    async def _deliver_delayed(self, label: str, item):
+        """Forward a message or album whose rule delay has passed"""
+        rule = self.forwarding_rules.get(label)
+        if rule is None or not rule['active']:
+            logger.debug(f"Dropping delayed message for inactive rule {label}")
+            return
+
+        first_id = None
+        if isinstance(item, tuple):
+            # A replayed delivery: only the destinations still owed a copy,
+            # and never held for batching
+            item, destinations, first_id = item
+            rule = dict(rule, destinations=destinations, batch_window=0)
+        await self._forward_item(item, rule, first_id)
+
+    async def replay_pending_deliveries(self) -> int:
+        """Send the deliveries that were accepted but not sent before the last shutdown"""
+        groups = {}  # (source_chat, message_ids, label) -> [due_at, destinations]
+        for source_chat, _, message_ids, label, dest_chat, due_at in await self.delivery_queue.load_pending():
+            group = groups.setdefault((source_chat, message_ids, label), [due_at, []])
+            group[1].append(dest_chat)
+
+        wanted = {}  # source chat -> message ids to fetch
+        for source_chat, message_ids, _ in groups:
+            wanted.setdefault(source_chat, set()).update(int(i) for i in message_ids.split(','))
+
+        fetched = {}
+        unreachable = set()
+        for source_chat, ids in wanted.items():
+            try:
+                messages = await self.client.get_messages(
+                    self._input_peer(self.client_pool.listener, source_chat), ids=sorted(ids)
                 )
             except Exception as e:
-                logger.error(f"Error editing forwarded message: {e}")
+                logger.error(f"Could not fetch messages of {source_chat} to replay: {e}")
+                unreachable.add(source_chat)
+                continue
+            for message in messages:
+                if message is not None:
+                    fetched[(source_chat, message.id)] = message
 
-        logger.info(f"Updated forwarded messages for edited message {message_key}")
+        replayed = 0
+        loop = asyncio.get_running_loop()
+        for (source_chat, message_ids, label), (due_at, destinations) in groups.items():
+            if source_chat in unreachable:
+                continue  # kept for the next start
+            ids = [int(i) for i in message_ids.split(',')]
+            rule = self.forwarding_rules.get(label)
+            found = [fetched[(source_chat, i)] for i in ids if (source_chat, i) in fetched]
+            if rule is None or not rule['active'] or not found:
+                # Nothing left to send: the rule is gone or the message was deleted
+                self.delivery_queue.complete(source_chat, ids[0], label, destinations)
+                continue
 
-    except Exception as e:
-        logger.error(f"Error processing edited message: {e}")
+            item = [events.NewMessage.Event(message) for message in found]
+            # Wait out what is left of the delay in the scheduler, as if the
+            # message had been accepted in this run; due_at is wall time
+            enqueued_at = loop.time() - (time.time() - (due_at - rule['delay']))
+            self.delivery_scheduler.schedule(
+                label, rule['delay'], (item if len(ids) > 1 else item[0], destinations, ids[0]), enqueued_at
+            )
+            replayed += len(destinations)
 
-async def cleanup_old_cache_entries(self):
-    """Clean up old cache entries"""
-    current_time = time.time()
-    keys_to_remove = []
+        if replayed:
+            logger.info(f"Replaying {replayed} deliveries left from the last run")
+        return replayed
 
-    for key, cache_entry in self.message_cache.items():
-        rule = cache_entry['rule']
-        if current_time - cache_entry['timestamp'] > rule['max_edit_time']:
-            keys_to_remove.append(key)
+    async def _catch_up(self):
+        """Forward what source chats posted while the userbot was offline"""
+        max_age = await self.config_manager.get_setting('catchup_max_age', CATCHUP_MAX_AGE)
+        concurrency = await self.config_manager.get_setting('catchup_concurrency', CATCHUP_CONCURRENCY)
+        # Chats never forwarded from before have no gap to fill
+        sources = list(self.held_live)
+        if not max_age or not sources:
+            for chat_id in sources:
+                await self._release_live(chat_id)
+            return
 
-    for key in keys_to_remove:
-        del self.message_cache[key]
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        limit = asyncio.Semaphore(max(1, concurrency))
+
+        async def catch_up(chat_id):
+            async with limit:
+                try:
+                    forwarded = await self._catch_up_source(chat_id, cutoff)
+                except Exception as e:
+                    logger.error(f"Error catching up on {chat_id}: {e}")
+                    forwarded = 0
+            await self._release_live(chat_id)
+            return forwarded
+
+        forwarded = sum(await asyncio.gather(*(catch_up(chat_id) for chat_id in sources)))
+        if forwarded:
+            logger.info(f"Caught up on {forwarded} messages missed while offline")
+
+    async def _release_live(self, chat_id: int):
+        """Forward the live messages held while a chat was caught up on, then stop holding"""
+        held = self.held_live.get(chat_id)
+        # Messages arriving meanwhile join the queue, so nothing overtakes it
+        while held:
+            event = held.popleft()
+            try:
+                await self._route_message(event)
+            except Exception as e:
+                logger.error(f"Error forwarding held message from {chat_id}: {e}")
+        self.held_live.pop(chat_id, None)
 
+    async def _catch_up_source(self, chat_id: int, cutoff: datetime) -> int:
+        """Forward one source chat's missed messages, oldest first"""
+        # Find the first message inside the backfill window without paging through older ones
+        peer = self._input_peer(self.client_pool.listener, chat_id)
+        first = [message async for message in self.client.iter_messages(
+            peer, offset_date=cutoff, reverse=True, limit=1
+        )]
+        if not first:
+            return 0
+
+        position = max(self.source_positions.get(chat_id, 0), first[0].id - 1)
+        forwarded = 0
+        while self.running:
+            batch = [message async for message in self.client.iter_messages(
+                peer, min_id=position, reverse=True, limit=CATCHUP_BATCH_SIZE
+            )]
+            for message in batch:
+                live_first_id = self.live_first_ids.get(chat_id)
+                if live_first_id is not None and message.id >= live_first_id:
+                    return forwarded  # live updates cover the rest
+                if getattr(message, 'action', None) or message.date < cutoff:
+                    continue  # service messages never arrive as NewMessage
+                # One message at a time, so live messages to the same
+                # destinations wait behind at most one per catch-up worker
+                await self.process_message(events.NewMessage.Event(message), catch_up=True)
+                CATCHUP_MESSAGES.inc()
+                forwarded += 1
+
+            if len(batch) < CATCHUP_BATCH_SIZE:
+                break
+            position = batch[-1].id
+        return forwarded
+
+    def _reserve_destination_slots(self, destinations: List[int], batch_key: Optional[Tuple[str, int]] = None) -> List:
+        """Queue a send behind the previous one for each destination.
+
+        Batches holding earlier slots on these destinations are sent now, so
+        this send doesn't wait out their window or land between their
+        messages; batch_key is the caller's own batch, which it may join.
+        """
+        loop = asyncio.get_running_loop()
+        slots = []
+        for dest_id in destinations:
+            if self.forward_batcher.by_destination:
+                self.forward_batcher.flush_destination(dest_id, batch_key)
+            previous = self.destination_tails.get(dest_id)
+            done = loop.create_future()
+            self.destination_tails[dest_id] = done
+            slots.append((previous, done))
+        return slots
+
+    def _release_destination_slot(self, dest_id: int, done):
+        """Let the next queued send for a destination go ahead"""
+        if not done.done():
+            done.set_result(None)
+        if self.destination_tails.get(dest_id) is done:
+            del self.destination_tails[dest_id]
+
+    async def _fan_out(self, source_id: int, destinations: List[int], slots: List, send) -> List:
+        """Run send for every destination at once; results follow destinations"""
+        return await asyncio.gather(*(
+            self._send_to_destination(source_id, dest_id, previous, done, send)
+            for dest_id, (previous, done) in zip(destinations, slots)
+        ))
+
+    async def _send_to_destination(self, source_id, dest_id, previous, done, send):
+        """Send to one destination, after earlier messages to it"""
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+
+            actual_dest_id = self.marked_ids.get(dest_id, dest_id)
+
+            logger.info(f"Forwarding to destination: {actual_dest_id}")
+
+            start = time.perf_counter()
+            forwarded_msg = await send(actual_dest_id)
+            SEND_SECONDS.observe(time.perf_counter() - start, dest_id)
+
+            logger.info(f"Forwarded message from {source_id} to {dest_id}")
+            return forwarded_msg
+
+        except Exception as e:
+            SEND_FAILURES.inc(dest_id)
+            logger.error(f"Error forwarding to {dest_id}: {e}")
+            return None
+
+        finally:
+            self._release_destination_slot(dest_id, done)
+
+    def get_stats(self) -> Dict:
+        """Get per-rule counts and the state of the engine's queues and caches"""
+        return {
+            'received': MESSAGES_RECEIVED.get(),
+            'rules': {
+                label: {
+                    'matched': MESSAGES_MATCHED.get(label),
+                    'forwarded': MESSAGES_FORWARDED.get(label),
+                    'copies': COPIES_SENT.get(label),
+                    'duplicates': DUPLICATES_SUPPRESSED.get(label),
+                }
+                for label in self.forwarding_rules
+            },
+            'send_seconds': {
+                labels[0]: SEND_SECONDS.average(*labels) for labels in SEND_SECONDS.series
+            },
+            'send_failures': sum(SEND_FAILURES.values.values()),
+            'delay_queue_depth': self.delivery_scheduler.pending_count,
+            'delivery_queue': self.delivery_queue.get_stats(),
+            'peer_cache': self.peer_cache.get_stats(),
+            'edits': dict(
+                self.edit_debouncer.get_stats(),
+                pushed=COPY_EDITS.get(),
+                unchanged=EDITS_UNCHANGED.get(),
+            ),
+            'catch_up': {
+                'running': self.catch_up_task is not None and not self.catch_up_task.done(),
+                'messages': CATCHUP_MESSAGES.get(),
+            },
+            'edit_cache': self.message_cache.get_stats(),
+            'client_pool': self.client_pool.get_stats(),
+            'replacement': dict(
+                self.replacement_engine.offloader.get_stats(),
+                avg_seconds=REPLACEMENT_SECONDS.average(),
+                cache=self.replacement_engine.text_cache.get_stats(),
+                quarantined=self.replacement_engine.quarantined,
+            ),
+        }
+
+    async def process_edited_message(self, event):
+        """Process edited message for updating forwarded messages"""
+        if not self.running:
+            return
+
+        if self.edit_debouncer.window > 0:
+            # Only the last of a burst of edits is pushed
+            self.edit_debouncer.add(event)
+        else:
+            await self._apply_edit(event)
+
+    async def _apply_edit(self, event):
+        """Mirror a source message's current text onto its forwarded copies"""
+        if not self.running:
+            return
+
+        message_key = (event.chat_id, event.message.id)
+
+        cache_entry = self.message_cache.get(message_key)
+        if cache_entry is None:
+            cache_entry = await self._load_edit_entry(message_key)
+        if cache_entry is None:
+            return
+
+        # Every rule that forwarded the message has its own edit window
+        now = time.time()
+        copies = []
+        for label in list(cache_entry.forwarded):
+            rule = self.forwarding_rules.get(label)
+            if rule is None or now - cache_entry.timestamps[label] > rule['max_edit_time']:
+                cache_entry.drop_rule(label)
+            else:
+                copies.extend(cache_entry.forwarded[label])
+
+        if not cache_entry.forwarded:
+            self.message_cache.discard(message_key)
+            return
+
+        try:
+            original_text = self._message_text(event.message)
+            processed_text = await self.replacement_engine.process_text(original_text)
+            text = processed_text or original_text
+
+            for chat_id, message_id, account in copies:
+                if cache_entry.shows(chat_id, message_id, text):
+                    EDITS_UNCHANGED.inc()
+                    continue
+                try:
+                    await self.client_pool.call_as(
+                        account,
+                        chat_id,
+                        self._edit_copy,
+                        chat_id,
+                        message_id,
+                        text
+                    )
+                    cache_entry.record_text(chat_id, message_id, text)
+                    COPY_EDITS.inc()
+                except Exception as e:
+                    logger.error(f"Error editing forwarded message: {e}")
+
+            logger.info(f"Updated forwarded messages for edited message {message_key}")
+
+        except Exception as e:
+            logger.error(f"Error processing edited message: {e}")
+
+    async def _load_edit_entry(self, message_key):
+        """Restore an edit cache entry from the mapping store"""
+        rows = await self.mapping_store.lookup(*message_key)
+        if not rows:
+            return None
+
+        by_label = {}
+        for _, _, label, dest_chat, dest_msg, forwarded_at, account in rows:
+            by_label.setdefault(label, []).append((dest_chat, dest_msg, account, forwarded_at))
+
+        now = time.time()
+        for label, copies in by_label.items():
+            rule = self.forwarding_rules.get(label)
+            timestamp = min(copy[3] for copy in copies)
+            if rule is None or now - timestamp > rule['max_edit_time']:
+                continue
+            self.message_cache.add(
+                message_key,
+                label,
+                rule['max_edit_time'],
+                [copy[:3] for copy in copies],
+                timestamp=timestamp
+            )
+        return self.message_cache.entries.get(message_key)
+
+    async def cleanup_old_cache_entries(self):
+        """Clean up old cache entries"""
+        removed = self.message_cache.sweep()
+        if removed:
+            logger.debug(f"Expired {removed} edit cache entries")
+
+        pruned = await self.mapping_store.prune({
+            label: rule['max_edit_time'] for label, rule in self.forwarding_rules.items()
+        })
+        if pruned:
+            logger.debug(f"Pruned {pruned} stored message mappings")
+
+    async def _sweep_edit_cache(self):
+        """Periodically expire old edit cache entries"""
+        while True:
+            await asyncio.sleep(EDIT_CACHE_SWEEP_INTERVAL)
+            try:
+                await self.cleanup_old_cache_entries()
+            except Exception as e:
+                logger.error(f"Error sweeping edit cache: {e}")
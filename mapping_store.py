@@ -0,0 +1,162 @@
+"""
+Mapping Store
+Persists source -> forwarded message mappings so edits survive restarts
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.5  # seconds
+FLUSH_BATCH_SIZE = 500
+
+# (source_chat, source_msg, label, dest_chat, dest_msg, created_at, account)
+MappingRow = Tuple[int, int, str, int, int, float, str]
+
+class MappingStore:
+    """SQLite (WAL) table of forwarded copies.
+
+    Writes are buffered and flushed in batches on a dedicated worker thread,
+    and lookups are point queries on (source_chat, source_msg), so nothing is
+    loaded into memory at startup.
+    """
+
+    def __init__(self, db_file: str = 'forwarded_messages.db'):
+        self.db_file = db_file
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mapping-store')
+        self.pending: List[MappingRow] = []
+        self.in_flight: List[List[MappingRow]] = []  # batches being written
+        self._flush_task = None
+        self._batch_tasks = set()
+
+    async def open(self):
+        """Open the database, creating the schema if needed"""
+        if self.conn is None:
+            await self._run(self._open)
+
+    def _open(self):
+        """Connect and create the schema (worker thread)"""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS mappings ("
+            " source_chat INTEGER NOT NULL,"
+            " source_msg INTEGER NOT NULL,"
+            " label TEXT NOT NULL,"
+            " dest_chat INTEGER NOT NULL,"
+            " dest_msg INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " account TEXT NOT NULL DEFAULT '')"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(mappings)")]
+        if 'account' not in columns:
+            # Databases from before the client pool; their copies were sent by the listener
+            conn.execute("ALTER TABLE mappings ADD COLUMN account TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_source ON mappings (source_chat, source_msg)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_label ON mappings (label, created_at)")
+        conn.commit()
+        self.conn = conn
+
+    async def close(self):
+        """Flush pending writes and close the database"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        await self.flush()
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+
+    async def _run(self, func, *args):
+        """Run a blocking database call on the worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def add(self, rows: List[MappingRow]):
+        """Queue mappings to be written in the next batch"""
+        self.pending.extend(rows)
+        if len(self.pending) >= FLUSH_BATCH_SIZE:
+            task = asyncio.create_task(self.flush())
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Flush after the batching interval"""
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """Write all queued mappings"""
+        if not self.pending or self.conn is None:
+            return
+
+        rows, self.pending = self.pending, []
+        self.in_flight.append(rows)
+        try:
+            await self._run(self._write_rows, rows)
+        except Exception as e:
+            logger.error(f"Error writing message mappings: {e}")
+        finally:
+            self.in_flight.remove(rows)
+
+    def _write_rows(self, rows: List[MappingRow]):
+        """Insert a batch in one transaction (worker thread)"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO mappings (source_chat, source_msg, label, dest_chat, dest_msg, created_at, account)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    async def lookup(self, source_chat: int, source_msg: int) -> List[MappingRow]:
+        """Get every stored copy of a source message"""
+        unflushed = [
+            row for batch in self.in_flight + [self.pending] for row in batch
+            if row[0] == source_chat and row[1] == source_msg
+        ]
+        if self.conn is None:
+            return unflushed
+
+        rows = await self._run(self._select, source_chat, source_msg)
+        return rows + [row for row in unflushed if row not in rows]
+
+    def _select(self, source_chat: int, source_msg: int) -> List[MappingRow]:
+        """Indexed lookup of one source message (worker thread)"""
+        return self.conn.execute(
+            "SELECT source_chat, source_msg, label, dest_chat, dest_msg, created_at, account"
+            " FROM mappings WHERE source_chat = ? AND source_msg = ?",
+            (source_chat, source_msg)
+        ).fetchall()
+
+    async def prune(self, max_edit_times: Dict[str, float]) -> int:
+        """Delete mappings older than their rule's max_edit_time"""
+        if self.conn is None:
+            return 0
+        return await self._run(self._prune, dict(max_edit_times))
+
+    def _prune(self, max_edit_times: Dict[str, float]) -> int:
+        """Delete expired and orphaned rows (worker thread)"""
+        now = time.time()
+        with self.conn:
+            stored_labels = [row[0] for row in self.conn.execute("SELECT DISTINCT label FROM mappings")]
+            removed = 0
+            for label in stored_labels:
+                if label in max_edit_times:
+                    cursor = self.conn.execute(
+                        "DELETE FROM mappings WHERE label = ? AND created_at < ?",
+                        (label, now - max_edit_times[label])
+                    )
+                else:
+                    cursor = self.conn.execute("DELETE FROM mappings WHERE label = ?", (label,))
+                removed += cursor.rowcount
+        return removed
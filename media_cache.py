@@ -0,0 +1,113 @@
+"""
+Media Cache
+Resolves source media to input media once and reuses it for every send
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from telethon import utils
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MEDIA = 2000
+
+class MediaCache:
+    """LRU map of ('photo'|'document', id) -> InputMedia.
+
+    Photos and documents already live on Telegram's servers, so sending the
+    resolved input media to each destination never uploads anything again.
+    File references expire; refresh() re-fetches the source message and
+    replaces the cached entry.
+
+    Input media is only valid for the account that resolved it. A cache
+    for an account other than the listener sets fetch_on_miss, so misses
+    fetch the message through its own client instead.
+    """
+
+    def __init__(self, client, max_entries: int = DEFAULT_MAX_MEDIA, fetch_on_miss: bool = False):
+        self.client = client
+        self.max_entries = max_entries
+        self.fetch_on_miss = fetch_on_miss
+        self.entries: 'OrderedDict[Tuple[str, int], Any]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def media_key(media) -> Optional[Tuple[str, int]]:
+        """Get the cache key for a photo or document, None for other media"""
+        if isinstance(media, MessageMediaPhoto) and media.photo is not None:
+            return 'photo', media.photo.id
+        if isinstance(media, MessageMediaDocument) and media.document is not None:
+            return 'document', media.document.id
+        return None
+
+    def get(self, media):
+        """Get input media to send; media that can't be cached is returned as is"""
+        key = self.media_key(media)
+        if key is None:
+            return media
+
+        input_media = self.entries.get(key)
+        if input_media is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return input_media
+
+        self.misses += 1
+        return self._store(key, media)
+
+    async def resolve(self, message):
+        """Get input media to send for a message, as seen by this cache's account"""
+        if not self.fetch_on_miss:
+            return self.get(message.media)
+
+        key = self.media_key(message.media)
+        if key is None:
+            return message.media
+
+        input_media = self.entries.get(key)
+        if input_media is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return input_media
+
+        self.misses += 1
+        return await self.refresh(message)
+
+    async def refresh(self, message):
+        """Re-fetch a message whose file reference expired and recache its media"""
+        self.refreshes += 1
+        fresh = await self.client.get_messages(message.chat_id, ids=message.id)
+        media = fresh.media if fresh is not None else message.media
+
+        key = self.media_key(media)
+        if key is None:
+            return media
+        return self._store(key, media)
+
+    def _store(self, key: Tuple[str, int], media):
+        """Resolve and cache input media, evicting the least recently used"""
+        input_media = utils.get_input_media(media)
+        self.entries[key] = input_media
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        return input_media
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,192 @@
+"""
+Metrics
+Counters and histograms exposed in the Prometheus text format
+"""
+
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_METRICS_PORT = 9464
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (name, labels, value) samples produced by a collector callback
+Sample = Tuple[str, Dict[str, str], float]
+
+def _escape(value) -> str:
+    """Escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    """Render a label set as {a="1",b="2"}"""
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+class Counter:
+    """Monotonic count per label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        """Add to the count for these label values"""
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues) -> float:
+        """Current count for these label values"""
+        return self.values.get(labelvalues, 0)
+
+    def expose(self) -> List[str]:
+        """Lines in the text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+class HistogramSeries:
+    """Bucket counts, sum and count of one label set"""
+
+    __slots__ = ('buckets', 'total', 'count')
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+class Histogram:
+    """Distribution of observed values per label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.bounds = tuple(buckets)
+        self.series: Dict[Tuple, HistogramSeries] = {}
+
+    def observe(self, value: float, *labelvalues):
+        """Record one value"""
+        series = self.series.get(labelvalues)
+        if series is None:
+            series = self.series[labelvalues] = HistogramSeries(len(self.bounds) + 1)
+        series.buckets[bisect_left(self.bounds, value)] += 1
+        series.total += value
+        series.count += 1
+
+    def average(self, *labelvalues) -> float:
+        """Mean observed value for these label values"""
+        series = self.series.get(labelvalues)
+        return series.total / series.count if series is not None and series.count else 0.0
+
+    def expose(self) -> List[str]:
+        """Lines in the text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        for labelvalues, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), series.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(names, labelvalues + (le,))} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {series.total}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+class MetricsRegistry:
+    """Every metric plus gauges that are read from components when scraped"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.collectors: Dict[str, Tuple[str, str, Callable[[], Iterable[Sample]]]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Get or create a counter"""
+        if name not in self.metrics:
+            self.metrics[name] = Counter(name, documentation, labelnames)
+        return self.metrics[name]
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, documentation, labelnames, buckets)
+        return self.metrics[name]
+
+    def collector(self, name: str, metric_type: str, documentation: str, collect: Callable[[], Iterable[Sample]]):
+        """Register a callback read on every scrape; replaces an earlier one of the same name"""
+        self.collectors[name] = (metric_type, documentation, collect)
+
+    def expose(self) -> str:
+        """Render every metric in the text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+
+        for name, (metric_type, documentation, collect) in self.collectors.items():
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.error(f"Error collecting metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+class MetricsServer:
+    """Minimal HTTP server answering GET /metrics"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.registry = registry
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = DEFAULT_METRICS_HOST, port: int = DEFAULT_METRICS_PORT):
+        """Start listening"""
+        self.server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        """Stop listening"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one request"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+                status, body = '200 OK', self.registry.expose().encode()
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Error serving metrics request: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,167 @@
+"""
+Peer Cache
+Input peers resolved once per account and kept across restarts
+"""
+
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerSelf, InputPeerUser
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.5  # seconds
+
+# (account, chat_id, kind, peer_id, access_hash)
+PeerRow = Tuple[str, int, str, int, int]
+
+def _to_row(account: str, chat_id: int, peer) -> Optional[PeerRow]:
+    """Storable form of an input peer; None for kinds that can't be stored"""
+    if isinstance(peer, InputPeerChannel):
+        return account, chat_id, 'channel', peer.channel_id, peer.access_hash
+    if isinstance(peer, InputPeerUser):
+        return account, chat_id, 'user', peer.user_id, peer.access_hash
+    if isinstance(peer, InputPeerChat):
+        return account, chat_id, 'chat', peer.chat_id, 0
+    if isinstance(peer, InputPeerSelf):
+        return account, chat_id, 'self', 0, 0
+    return None
+
+def _from_row(kind: str, peer_id: int, access_hash: int):
+    """Input peer from its stored form"""
+    if kind == 'channel':
+        return InputPeerChannel(peer_id, access_hash)
+    if kind == 'user':
+        return InputPeerUser(peer_id, access_hash)
+    if kind == 'chat':
+        return InputPeerChat(peer_id)
+    return InputPeerSelf()
+
+class PeerCache:
+    """Map of (account, marked chat id) -> input peer, stored in SQLite.
+
+    Sends and fetches pass these peers to Telethon, so it never has to look
+    a chat up by id. Access hashes differ per account, hence the account in
+    the key. Everything is loaded at open(); new peers are written in the
+    background.
+    """
+
+    def __init__(self, db_file: str = 'peer_cache.db'):
+        self.db_file = db_file
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='peer-cache')
+        self.peers: Dict[Tuple[str, int], object] = {}
+        self.pending: List[PeerRow] = []
+        self.resolved = 0  # lookups that needed Telegram
+        self._flush_task = None
+
+    async def open(self):
+        """Open the database and load every stored peer"""
+        if self.conn is None:
+            rows = await self._run(self._open)
+            for account, chat_id, kind, peer_id, access_hash in rows:
+                self.peers.setdefault((account, chat_id), _from_row(kind, peer_id, access_hash))
+            logger.info(f"Loaded {len(rows)} cached peers")
+
+    def _open(self) -> List[PeerRow]:
+        """Connect, create the schema and read all rows (worker thread)"""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS peers ("
+            " account TEXT NOT NULL,"
+            " chat_id INTEGER NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " peer_id INTEGER NOT NULL,"
+            " access_hash INTEGER NOT NULL,"
+            " PRIMARY KEY (account, chat_id))"
+        )
+        conn.commit()
+        self.conn = conn
+        return conn.execute("SELECT account, chat_id, kind, peer_id, access_hash FROM peers").fetchall()
+
+    async def close(self):
+        """Write pending peers and close the database"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+
+    async def _run(self, func, *args):
+        """Run a blocking database call on the worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def get(self, account: str, chat_id: int):
+        """Cached input peer of a chat for an account"""
+        return self.peers.get((account, chat_id))
+
+    def put(self, account: str, chat_id: int, peer):
+        """Cache an input peer and store it in the background"""
+        if self.peers.get((account, chat_id)) == peer:
+            return
+        self.peers[(account, chat_id)] = peer
+        row = _to_row(account, chat_id, peer)
+        if row is None:
+            return
+        self.pending.append(row)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def resolve(self, account: str, client, chat_id: int):
+        """Get a chat's input peer, asking Telegram only on a miss; raises if it can't be resolved"""
+        peer = self.peers.get((account, chat_id))
+        if peer is None:
+            peer = await client.get_input_entity(chat_id)
+            self.resolved += 1
+            self.put(account, chat_id, peer)
+        return peer
+
+    async def load_dialogs(self, account: str, client) -> Set[int]:
+        """Cache the input peer of every chat in an account's dialogs; returns their marked ids"""
+        chats = set()
+        async for dialog in client.iter_dialogs():
+            chat_id = utils.get_peer_id(dialog.entity)
+            chats.add(chat_id)
+            try:
+                self.put(account, chat_id, utils.get_input_peer(dialog.entity))
+            except TypeError:
+                continue
+        return chats
+
+    async def _flush_later(self):
+        """Flush after the batching interval"""
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        """Write all pending peers"""
+        if not self.pending or self.conn is None:
+            return
+
+        rows, self.pending = self.pending, []
+        try:
+            await self._run(self._write_rows, rows)
+        except Exception as e:
+            logger.error(f"Error writing cached peers: {e}")
+
+    def _write_rows(self, rows: List[PeerRow]):
+        """Upsert a batch in one transaction (worker thread)"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO peers (account, chat_id, kind, peer_id, access_hash) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        return {
+            'size': len(self.peers),
+            'resolved': self.resolved,
+        }
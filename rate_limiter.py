@@ -0,0 +1,163 @@
+"""
+Rate Limiter
+Paces outbound Telegram calls and honors FloodWait without dropping messages
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from telethon.errors import FloodWaitError, SlowModeWaitError
+
+logger = logging.getLogger(__name__)
+
+FLOOD_ERRORS = (FloodWaitError, SlowModeWaitError)
+
+RATE_LIMIT_DEFAULTS = {
+    'account_rate': 25.0,       # calls per second for the whole account
+    'account_burst': 30,
+    'destination_rate': 1.0,    # calls per second to a single chat
+    'destination_burst': 5,
+    'max_concurrent_sends': 10,
+    'max_flood_retries': 5,
+}
+
+class TokenBucket:
+    """Token bucket that can also be paused for a FloodWait"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled_seconds = 0.0
+        self._lock = asyncio.Lock()  # waiters are served in arrival order
+
+    def pause(self, seconds: float):
+        """Hold every caller of this bucket for the given time"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> float:
+        """Take one token, waiting if needed; returns the seconds waited"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.throttled_seconds += waited
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+
+                await asyncio.sleep(wait)
+                waited += wait
+
+class RateLimiter:
+    """Central limiter for one account's outbound calls.
+
+    Each call takes a token from its destination's bucket and from the
+    account bucket. A FloodWait pauses only the destination bucket that hit
+    it, and the call is retried once the wait is over.
+    """
+
+    def __init__(self, account_rate: float = RATE_LIMIT_DEFAULTS['account_rate'],
+                 account_burst: int = RATE_LIMIT_DEFAULTS['account_burst'],
+                 destination_rate: float = RATE_LIMIT_DEFAULTS['destination_rate'],
+                 destination_burst: int = RATE_LIMIT_DEFAULTS['destination_burst'],
+                 max_concurrent_sends: int = RATE_LIMIT_DEFAULTS['max_concurrent_sends'],
+                 max_flood_retries: int = RATE_LIMIT_DEFAULTS['max_flood_retries']):
+        self.account_bucket = TokenBucket(account_rate, account_burst)
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.destination_buckets: Dict[int, TokenBucket] = {}
+        self.max_flood_retries = max_flood_retries
+        self.max_concurrent_sends = max_concurrent_sends
+        self.semaphore = asyncio.Semaphore(max(1, int(max_concurrent_sends)))
+        self.throttled_seconds = 0.0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+
+    def update(self, account_rate: float = RATE_LIMIT_DEFAULTS['account_rate'],
+               account_burst: int = RATE_LIMIT_DEFAULTS['account_burst'],
+               destination_rate: float = RATE_LIMIT_DEFAULTS['destination_rate'],
+               destination_burst: int = RATE_LIMIT_DEFAULTS['destination_burst'],
+               max_concurrent_sends: int = RATE_LIMIT_DEFAULTS['max_concurrent_sends'],
+               max_flood_retries: int = RATE_LIMIT_DEFAULTS['max_flood_retries']):
+        """Change the limits in place, keeping FloodWait pauses and queued callers"""
+        for bucket, rate, capacity in [(self.account_bucket, account_rate, account_burst)] + [
+            (bucket, destination_rate, destination_burst) for bucket in self.destination_buckets.values()
+        ]:
+            bucket.rate = rate
+            bucket.capacity = capacity
+            bucket.tokens = min(bucket.tokens, capacity)
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.max_flood_retries = max_flood_retries
+        if max_concurrent_sends != self.max_concurrent_sends:
+            # Sends already inside the old semaphore finish under it
+            self.max_concurrent_sends = max_concurrent_sends
+            self.semaphore = asyncio.Semaphore(max(1, int(max_concurrent_sends)))
+
+    def _destination_bucket(self, destination: int) -> TokenBucket:
+        """Get or create the bucket for a destination"""
+        bucket = self.destination_buckets.get(destination)
+        if bucket is None:
+            bucket = TokenBucket(self.destination_rate, self.destination_burst)
+            self.destination_buckets[destination] = bucket
+        return bucket
+
+    async def call(self, destination: int, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Run an outbound call to destination under the rate limits"""
+        attempt = 0
+
+        while True:
+            try:
+                return await self.try_call(destination, func, *args, **kwargs)
+            except FLOOD_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_flood_retries:
+                    raise
+
+                logger.warning(f"FloodWait of {e.seconds}s on {destination}, retry {attempt}/{self.max_flood_retries}")
+
+    async def try_call(self, destination: int, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Run an outbound call once; a FloodWait pauses the destination and is raised"""
+        bucket = self._destination_bucket(destination)
+        waited = await bucket.acquire()
+        waited += await self.account_bucket.acquire()
+        self.throttled_seconds += waited
+
+        try:
+            async with self.semaphore:
+                return await func(*args, **kwargs)
+        except FLOOD_ERRORS as e:
+            self.flood_waits += 1
+            self.flood_wait_seconds += e.seconds
+            bucket.pause(e.seconds)
+            raise
+
+    def paused_for(self, destination: int) -> float:
+        """Seconds until a destination's FloodWait pause is over"""
+        bucket = self.destination_buckets.get(destination)
+        if bucket is None:
+            return 0.0
+        return max(0.0, bucket.paused_until - time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get throttling statistics"""
+        return {
+            'throttled_seconds': round(self.throttled_seconds, 3),
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'paused_destinations': sum(
+                1 for bucket in self.destination_buckets.values()
+                if bucket.paused_until > time.monotonic()
+            ),
+        }
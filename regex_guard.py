@@ -0,0 +1,87 @@
+"""
+Regex Guard
+Pre-flight check that rejects regex patterns with runaway matching times
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import re
+import time
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds one regex rule may take on one message. A rule over budget is
+# quarantined; it is interrupted at the budget only where a timer signal
+# can be used (Unix, on the main thread), and elsewhere it blocks until done
+REGEX_TIME_BUDGET = 0.1
+PREFLIGHT_TIMEOUT = 3.0  # seconds for the whole check before the pattern is rejected
+ADVERSARIAL_LENGTH = 4096  # longest text Telegram allows in a message
+
+def adversarial_inputs(pattern: str, length: int = ADVERSARIAL_LENGTH) -> List[str]:
+    """Build near-miss texts that make backtracking patterns blow up.
+
+    Long runs of the characters a pattern matches, ended by one it can't,
+    are what nested and overlapping quantifiers backtrack over.
+    """
+    chars = {c for c in pattern if c.isalnum() or c in ' -_./:@#'}
+    chars.update('a0 ')
+    tail = '\x00'
+
+    inputs = []
+    for c in sorted(chars):
+        inputs.append(c * length + tail)
+        inputs.append(c * 32 + tail)
+    for a, b in zip(sorted(chars), sorted(chars)[1:]):
+        inputs.append((a + b) * (length // 2) + tail)
+    return inputs
+
+def pattern_fingerprint(pattern: str, budget: float = REGEX_TIME_BUDGET) -> str:
+    """Key a pre-flight result by the pattern and the budget it was checked against"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{budget}\0{pattern}".encode('utf-8'))
+    return digest.hexdigest()
+
+def _measure(pattern: str, inputs: List[str], conn):
+    """Send back the slowest search time over inputs (child process)"""
+    compiled = re.compile(pattern, re.IGNORECASE)
+    worst = 0.0
+    for text in inputs:
+        start = time.perf_counter()
+        compiled.sub('', text)
+        worst = max(worst, time.perf_counter() - start)
+    conn.send(worst)
+    conn.close()
+
+async def preflight(pattern: str, budget: float = REGEX_TIME_BUDGET,
+                    timeout: float = PREFLIGHT_TIMEOUT) -> Optional[str]:
+    """Benchmark a pattern in a separate process; returns why it is rejected, or None"""
+    try:
+        re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        return f"invalid regex: {e}"
+
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(pattern, adversarial_inputs(pattern), sender), daemon=True)
+    process.start()
+    sender.close()
+
+    loop = asyncio.get_running_loop()
+    try:
+        if not await loop.run_in_executor(None, receiver.poll, timeout):
+            return f"took over {timeout}s on adversarial input"
+        worst = receiver.recv()
+    except EOFError:
+        return "crashed on adversarial input"
+    finally:
+        if process.is_alive():
+            process.terminate()
+        await loop.run_in_executor(None, process.join)
+        receiver.close()
+
+    if worst > budget:
+        return f"took {worst:.3f}s on adversarial input (budget {budget}s)"
+    return None
@@ -3,167 +3,318 @@ Replacement Engine
 Handles text replacement with regex and special pattern support
 """
 
+import asyncio
 import re
 import logging
-from typing import Dict, List
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from replacement_pipeline import ReplacementPipeline
+from text_cache import TextCache
+from text_offload import TextOffloader, DEFAULT_MIN_CHARS
+from regex_guard import pattern_fingerprint, preflight, REGEX_TIME_BUDGET
+from metrics import REGISTRY
 
-logger = logging.getLogger(name)
+logger = logging.getLogger(__name__)
+
+PREFLIGHT_CONCURRENCY = 4  # stored rules checked at once on start
+
+REPLACEMENT_SECONDS = REGISTRY.histogram('userbot_replacement_seconds', 'Time to run replacement rules on one text')
+REPLACEMENT_CACHE_HITS = REGISTRY.counter('userbot_replacement_cache_hits_total', 'Texts answered from the result cache')
+RULES_QUARANTINED = REGISTRY.counter('userbot_replacement_rules_quarantined_total', 'Regex rules disabled for overrunning the time budget')
 
 class ReplacementEngine:
-def init(self, config_manager):
-self.config_manager = config_manager
-self.replacement_rules = {}
-
-async def add_replacement_rule(self, label: str, original: str, replacement: str):  
-    """Add a replacement rule"""  
-    rule = {  
-        'label': label,  
-        'original': original,  
-        'replacement': replacement,  
-        'type': 'simple',  
-        'active': True  
-    }  
-      
-    # Detect rule type  
-    if label.endswith('_regex'):  
-        rule['type'] = 'regex'  
-        # Extract regex pattern from parentheses  
-        if original.startswith('(') and original.endswith(')'):  
-            rule['pattern'] = original[1:-1]  
-        else:  
-            rule['pattern'] = original  
-    elif '[[FULL_TEXT]]' in original:  
-        rule['type'] = 'full_text'  
-    elif '[[ALL_IN_ONE]]' in original:  
-        rule['type'] = 'all_in_one'  
-        rule['replacements'] = self._parse_all_in_one(replacement)  
-      
-    self.replacement_rules[label] = rule  
-    await self.config_manager.save_replacement_rule(label, rule)  
-    logger.info(f"Added replacement rule: {label}")  
-  
-async def remove_replacement_rule(self, label: str):  
-    """Remove a replacement rule"""  
-    if label not in self.replacement_rules:  
-        raise ValueError(f"Replacement rule '{label}' not found")  
-      
-    del self.replacement_rules[label]  
-    await self.config_manager.remove_replacement_rule(label)  
-    logger.info(f"Removed replacement rule: {label}")  
-  
-async def get_replacement_rules(self):  
-    """Get all replacement rules"""  
-    return [  
-        {  
-            'label': rule['label'],  
-            'type': rule['type'],  
-            'original': rule.get('original', ''),  
-            'pattern': rule.get('pattern', ''),  
-            'replacement': rule['replacement'],  
-            'active': rule['active']  
-        }  
-        for rule in self.replacement_rules.values()  
-    ]  
-  
-async def clear_replacement_rules(self):  
-    """Clear all replacement rules"""  
-    self.replacement_rules.clear()  
-    await self.config_manager.clear_replacement_rules()  
-    logger.info("Cleared all replacement rules")  
-  
-def _parse_all_in_one(self, replacement_text: str) -> List[Dict]:  
-    """Parse ALL_IN_ONE replacement format"""  
-    replacements = []  
-      
-    # Split by comma and parse each replacement  
-    parts = replacement_text.split(',')  
-    for part in parts:  
-        part = part.strip()  
-        if '->' in part:  
-            original, new = part.split('->', 1)  
-            original = original.strip(' "')  
-            new = new.strip(' "')  
-              
-            # Handle special formats  
-            if original.startswith('regex:'):  
-                replacements.append({  
-                    'type': 'regex',  
-                    'pattern': original[6:],  
-                    'replacement': new  
-                })  
-            elif original.startswith('url:'):  
-                replacements.append({  
-                    'type': 'url',  
-                    'tag': original[4:],  
-                    'replacement': new  
-                })  
-            else:  
-                replacements.append({  
-                    'type': 'simple',  
-                    'original': original,  
-                    'replacement': new  
-                })  
-      
-    return replacements  
-  
-async def process_text(self, text: str) -> str:  
-    """Process text through all active replacement rules"""  
-    if not text:  
-        return text  
-      
-    processed_text = text  
-      
-    for rule in self.replacement_rules.values():  
-        if not rule['active']:  
-            continue  
-          
-        try:  
-            processed_text = await self._apply_rule(processed_text, rule)  
-        except Exception as e:  
-            logger.error(f"Error applying replacement rule {rule['label']}: {e}")  
-      
-    return processed_text  
-  
-async def _apply_rule(self, text: str, rule: Dict) -> str:  
-    """Apply a single replacement rule"""  
-    rule_type = rule['type']  
-      
-    if rule_type == 'simple':  
-        # Simple string replacement  
-        return text.replace(rule['original'], rule['replacement'])  
-      
-    elif rule_type == 'regex':  
-        # Regex replacement  
-        pattern = rule['pattern']  
-        replacement = rule['replacement']  
-        return re.sub(pattern, replacement, text, flags=re.IGNORECASE)  
-      
-    elif rule_type == 'full_text':  
-        # Replace entire text  
-        return rule['replacement']  
-      
-    elif rule_type == 'all_in_one':  
-        # Apply multiple replacements  
-        result = text  
-        for replacement in rule['replacements']:  
-            result = await self._apply_single_replacement(result, replacement)  
-        return result  
-      
-    return text  
-  
-async def _apply_single_replacement(self, text: str, replacement: Dict) -> str:  
-    """Apply a single replacement from ALL_IN_ONE format"""  
-    rep_type = replacement['type']  
-      
-    if rep_type == 'simple':  
-        return text.replace(replacement['original'], replacement['replacement'])  
-      
-    elif rep_type == 'regex':  
-        return re.sub(replacement['pattern'], replacement['replacement'], text, flags=re.IGNORECASE)  
-      
-    elif rep_type == 'url':  
-        # Handle URL replacement (custom logic can be added here)  
-        return text.replace(replacement['tag'], replacement['replacement'])  
-      
-    return text
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+        self.replacement_rules = {}
+        self.pipeline = ReplacementPipeline([])
+        self.ruleset_version = 0
+        self.text_cache = TextCache()
+        self.offloader = TextOffloader()
+        self.regex_time_budget = REGEX_TIME_BUDGET
+        self.on_quarantine: Optional[Callable[[str], Awaitable]] = None  # notifies the owner
+        self.quarantined = 0
+        self.preflight_passed = set()  # fingerprints of patterns that passed the pre-flight check
+
+    def compile_rules(self):
+        """Recompile the replacement pipeline after rules change"""
+        self.pipeline = ReplacementPipeline.compile(self.replacement_rules.values())
+        # Results from the old rules can never be served again
+        self.ruleset_version += 1
+        self.text_cache.clear()
+        self.offloader.set_rules(self.ruleset_version, self.replacement_rules.values())
+        logger.debug(f"Compiled {len(self.replacement_rules)} replacement rules into {self.pipeline.step_count} passes")
+
+    async def start(self):
+        """Load stored rules and start worker processes if the settings ask for them"""
+        self.replacement_rules = dict(await self.config_manager.get_replacement_rules())
+        self.compile_rules()
+        self.regex_time_budget = await self.config_manager.get_setting('regex_time_budget', REGEX_TIME_BUDGET)
+        # Rules stored before the pre-flight check existed never went through it;
+        # patterns that passed before, under the same budget, are not checked again
+        self.preflight_passed = set(await self.config_manager.get_setting('regex_preflight_passed', []))
+        await self._preflight_stored_rules()
+        await self.offloader.start(
+            await self.config_manager.get_setting('text_offload_workers', 0),
+            await self.config_manager.get_setting('text_offload_min_chars', DEFAULT_MIN_CHARS)
+        )
+
+    async def stop(self):
+        """Stop the text processing workers"""
+        await self.offloader.stop()
+
+    async def add_replacement_rule(self, label: str, original: str, replacement: str):
+        """Add a replacement rule"""
+        rule = {
+            'label': label,
+            'original': original,
+            'replacement': replacement,
+            'type': 'simple',
+            'active': True
+        }
+
+        # Detect rule type
+        if label.endswith('_regex'):
+            rule['type'] = 'regex'
+            # Extract regex pattern from parentheses
+            if original.startswith('(') and original.endswith(')'):
+                rule['pattern'] = original[1:-1]
+            else:
+                rule['pattern'] = original
+        elif '[[FULL_TEXT]]' in original:
+            rule['type'] = 'full_text'
+        elif '[[ALL_IN_ONE]]' in original:
+            rule['type'] = 'all_in_one'
+            rule['replacements'] = self._parse_all_in_one(replacement)
+
+        await self._check_patterns(rule)
+        # Raises before a rule that can't be compiled is stored
+        ReplacementPipeline.compile([rule])
+
+        self.replacement_rules[label] = rule
+        self.compile_rules()
+        await self.config_manager.save_replacement_rule(label, rule)
+        await self._save_preflight_results()
+        logger.info(f"Added replacement rule: {label}")
+
+    async def remove_replacement_rule(self, label: str):
+        """Remove a replacement rule"""
+        if label not in self.replacement_rules:
+            raise ValueError(f"Replacement rule '{label}' not found")
+
+        del self.replacement_rules[label]
+        self.compile_rules()
+        await self.config_manager.remove_replacement_rule(label)
+        logger.info(f"Removed replacement rule: {label}")
+
+    async def get_replacement_rules(self):
+        """Get all replacement rules"""
+        return [
+            {
+                'label': rule['label'],
+                'type': rule['type'],
+                'original': rule.get('original', ''),
+                'pattern': rule.get('pattern', ''),
+                'replacement': rule['replacement'],
+                'active': rule['active'],
+                'quarantine_reason': rule.get('quarantine_reason')
+            }
+            for rule in self.replacement_rules.values()
+        ]
+
+    @staticmethod
+    def _rule_patterns(rule: Dict) -> List[str]:
+        """Get the regex patterns a rule uses"""
+        if rule['type'] == 'regex':
+            return [rule['pattern']]
+        elif rule['type'] == 'all_in_one':
+            return [r['pattern'] for r in rule['replacements'] if r['type'] == 'regex']
+        return []
+
+    async def _check_patterns(self, rule: Dict):
+        """Reject a rule whose regex patterns are invalid or too slow"""
+        for pattern in self._rule_patterns(rule):
+            fingerprint = pattern_fingerprint(pattern, self.regex_time_budget)
+            if fingerprint in self.preflight_passed:
+                continue
+            reason = await preflight(pattern, self.regex_time_budget)
+            if reason is not None:
+                raise ValueError(f"Regex '{pattern}' rejected: {reason}")
+            self.preflight_passed.add(fingerprint)
+
+    async def _save_preflight_results(self):
+        """Store the fingerprints of patterns that passed, if they changed"""
+        passed = sorted(self.preflight_passed)
+        if passed != await self.config_manager.get_setting('regex_preflight_passed', []):
+            await self.config_manager.set_setting('regex_preflight_passed', passed)
+
+    async def _preflight_stored_rules(self):
+        """Quarantine active stored rules whose regex patterns fail the pre-flight check"""
+        semaphore = asyncio.Semaphore(PREFLIGHT_CONCURRENCY)
+
+        async def check(rule):
+            async with semaphore:
+                try:
+                    await self._check_patterns(rule)
+                except ValueError as e:
+                    return rule['label'], str(e)
+            return None
+
+        rules = [rule for rule in self.replacement_rules.values() if rule['active'] and self._rule_patterns(rule)]
+        for failure in await asyncio.gather(*(check(rule) for rule in rules)):
+            if failure is not None:
+                await self.quarantine_rule(*failure)
+
+        # Forget patterns no active rule uses any more
+        self.preflight_passed &= {
+            pattern_fingerprint(pattern, self.regex_time_budget)
+            for rule in self.replacement_rules.values() if rule['active']
+            for pattern in self._rule_patterns(rule)
+        }
+        await self._save_preflight_results()
+
+    async def quarantine_rule(self, label: str, reason: str):
+        """Disable a rule that broke the time budget and tell the owner"""
+        rule = self.replacement_rules.get(label)
+        if rule is None or not rule['active']:
+            return
+
+        rule['active'] = False
+        rule['quarantine_reason'] = reason
+        rule['quarantined_at'] = time.time()
+        self.quarantined += 1
+        RULES_QUARANTINED.inc()
+        self.compile_rules()
+        await self.config_manager.save_replacement_rule(label, rule)
+        logger.warning(f"Quarantined replacement rule {label}: {reason}")
+
+        if self.on_quarantine is not None:
+            try:
+                await self.on_quarantine(f"⚠️ Replacement rule {label} was disabled: {reason}")
+            except Exception as e:
+                logger.error(f"Error notifying about quarantined rule {label}: {e}")
+
+    async def clear_replacement_rules(self):
+        """Clear all replacement rules"""
+        self.replacement_rules.clear()
+        self.compile_rules()
+        await self.config_manager.clear_replacement_rules()
+        logger.info("Cleared all replacement rules")
+
+    def _parse_all_in_one(self, replacement_text: str) -> List[Dict]:
+        """Parse ALL_IN_ONE replacement format"""
+        replacements = []
+
+        # Split by comma and parse each replacement
+        parts = replacement_text.split(',')
+        for part in parts:
+            part = part.strip()
+            if '->' in part:
+                original, new = part.split('->', 1)
+                original = original.strip(' "')
+                new = new.strip(' "')
+
+                # Handle special formats
+                if original.startswith('regex:'):
+                    replacements.append({
+                        'type': 'regex',
+                        'pattern': original[6:],
+                        'replacement': new
+                    })
+                elif original.startswith('url:'):
+                    replacements.append({
+                        'type': 'url',
+                        'tag': original[4:],
+                        'replacement': new
+                    })
+                else:
+                    replacements.append({
+                        'type': 'simple',
+                        'original': original,
+                        'replacement': new
+                    })
+
+        return replacements
+
+    async def process_text(self, text: str) -> str:
+        """Process text through all active replacement rules"""
+        if not text:
+            return text
+
+        cached = self.text_cache.get(self.ruleset_version, text)
+        if cached is not None:
+            REPLACEMENT_CACHE_HITS.inc()
+            return cached
+
+        version = self.ruleset_version
+        start = time.perf_counter()
+        processed_text, slow = await self.offloader.apply(self.pipeline, version, text, self.regex_time_budget)
+        REPLACEMENT_SECONDS.observe(time.perf_counter() - start)
+        self.text_cache.put(version, text, processed_text)
+
+        for label, elapsed in slow:
+            await self.quarantine_rule(
+                label, f"took {elapsed:.3f}s on a {len(text)} character message (budget {self.regex_time_budget}s)"
+            )
+
+        return processed_text
+
+    async def process_text_sequential(self, text: str) -> str:
+        """Process text rule by rule, without the compiled pipeline"""
+        if not text:
+            return text
+
+        processed_text = text
+
+        for rule in self.replacement_rules.values():
+            if not rule['active']:
+                continue
+
+            try:
+                processed_text = await self._apply_rule(processed_text, rule)
+            except Exception as e:
+                logger.error(f"Error applying replacement rule {rule['label']}: {e}")
+
+        return processed_text
+
+    async def _apply_rule(self, text: str, rule: Dict) -> str:
+        """Apply a single replacement rule"""
+        rule_type = rule['type']
+
+        if rule_type == 'simple':
+            # Simple string replacement
+            return text.replace(rule['original'], rule['replacement'])
+
+        elif rule_type == 'regex':
+            # Regex replacement
+            pattern = rule['pattern']
+            replacement = rule['replacement']
+            return re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+
+        elif rule_type == 'full_text':
+            # Replace entire text
+            return rule['replacement']
+
+        elif rule_type == 'all_in_one':
+            # Apply multiple replacements
+            result = text
+            for replacement in rule['replacements']:
+                result = await self._apply_single_replacement(result, replacement)
+            return result
+
+        return text
+
+    async def _apply_single_replacement(self, text: str, replacement: Dict) -> str:
+        """Apply a single replacement from ALL_IN_ONE format"""
+        rep_type = replacement['type']
+
+        if rep_type == 'simple':
+            return text.replace(replacement['original'], replacement['replacement'])
+
+        elif rep_type == 'regex':
+            return re.sub(replacement['pattern'], replacement['replacement'], text, flags=re.IGNORECASE)
+
+        elif rep_type == 'url':
+            # Handle URL replacement (custom logic can be added here)
+            return text.replace(replacement['tag'], replacement['replacement'])
 
+        return text
@@ -0,0 +1,264 @@
+"""
+Replacement Pipeline
+Compiles replacement rules into as few passes over the text as possible
+"""
+
+import logging
+import re
+import signal
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[str], str]
+
+# Each substitution joining a group is checked against every pair already
+# in it, so uncapped groups made compiling thousands of rules quadratic
+MAX_GROUP_PAIRS = 100
+
+class StageTimeout(Exception):
+    """Raised inside a timed stage that ran past the time budget"""
+
+_stage_running = False  # whether the timer signal should interrupt what is running
+
+def _interrupt_stage(signum, frame):
+    if _stage_running:
+        raise StageTimeout()
+
+def _can_interrupt() -> bool:
+    """Check whether a timer signal can cut a stage short here (Unix, main thread)"""
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+def _can_overlap(x: str, y: str) -> bool:
+    """Check whether occurrences of x and y could share any characters"""
+    if x in y or y in x:
+        return True
+    for k in range(1, min(len(x), len(y))):
+        if x.endswith(y[:k]) or y.endswith(x[:k]):
+            return True
+    return False
+
+class LiteralGroup:
+    """Plain substitutions that give the same result in any order.
+
+    A substitution only joins the group when its original can't overlap any
+    other original or replacement in the group, and no replacement is empty
+    (deleting text could join new matches together). The group can then be
+    applied as one simultaneous pass.
+    """
+
+    def __init__(self):
+        self.pairs: List[Tuple[str, str]] = []
+
+    def accepts(self, original: str, replacement: str) -> bool:
+        """Check whether a substitution can join this group"""
+        if not original or not replacement or len(self.pairs) >= MAX_GROUP_PAIRS:
+            return False
+        for other_original, other_replacement in self.pairs:
+            if (_can_overlap(other_original, original)
+                    or _can_overlap(other_replacement, original)
+                    or _can_overlap(replacement, other_original)):
+                return False
+        return True
+
+    def build(self) -> Step:
+        """Build the step function for this group"""
+        if len(self.pairs) == 1:
+            # Also the only form an empty original can take
+            return self._build_pass(self.pairs)
+
+        # re only scans quickly when every alternative shares a literal
+        # prefix, so alternate per leading character and fall back to
+        # str.replace for singletons
+        by_first_char: Dict[str, List[Tuple[str, str]]] = {}
+        for original, replacement in self.pairs:
+            by_first_char.setdefault(original[0], []).append((original, replacement))
+
+        passes = [self._build_pass(pairs) for pairs in by_first_char.values()]
+        if len(passes) == 1:
+            return passes[0]
+
+        def apply(text: str) -> str:
+            for run_pass in passes:
+                text = run_pass(text)
+            return text
+        return apply
+
+    @staticmethod
+    def _build_pass(pairs: List[Tuple[str, str]]) -> Step:
+        """Build one pass over the text for some of the group's pairs"""
+        if len(pairs) == 1:
+            original, replacement = pairs[0]
+            return lambda text: text.replace(original, replacement)
+
+        table = dict(pairs)
+        pattern = re.compile('|'.join(re.escape(original) for original, _ in pairs))
+        lookup = lambda match: table[match.group(0)]
+        return lambda text: pattern.sub(lookup, text)
+
+class Stage:
+    """Steps that succeed or fail together, like one rule used to"""
+
+    __slots__ = ('label', 'steps', 'timed')
+
+    def __init__(self, label: str, steps: List[Step], timed: bool = False):
+        self.label = label
+        self.steps = steps
+        self.timed = timed  # regex stages are checked against the time budget
+
+class ReplacementPipeline:
+    """Precompiled form of an ordered set of replacement rules.
+
+    Output matches applying each active rule in turn: merged literal groups
+    are only formed where order can't matter, and a rule containing a regex
+    keeps its own stage so a failure still leaves the text as it was before
+    that rule.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.timed = any(stage.timed for stage in stages)
+
+    @property
+    def step_count(self) -> int:
+        """Number of passes made over the text"""
+        return sum(len(stage.steps) for stage in self.stages)
+
+    @classmethod
+    def compile(cls, rules: Iterable[Dict]) -> 'ReplacementPipeline':
+        """Compile rules, in order, into a pipeline"""
+        stages = []
+        open_labels = []
+        open_ops = []
+
+        def close_open_stage():
+            if open_ops:
+                stages.append(Stage(', '.join(open_labels), cls._build_steps(open_ops)))
+                open_labels.clear()
+                open_ops.clear()
+
+        for rule in rules:
+            if not rule.get('active', True):
+                continue
+
+            try:
+                ops = cls._rule_ops(rule)
+            except Exception as e:
+                # The sequential path would fail on this rule for every message
+                logger.error(f"Error compiling replacement rule {rule.get('label')}: {e}")
+                continue
+
+            if any(op[0] == 'regex' for op in ops):
+                close_open_stage()
+                stages.append(Stage(rule['label'], cls._build_steps(ops), timed=True))
+            else:
+                open_labels.append(rule['label'])
+                open_ops.extend(ops)
+
+        close_open_stage()
+        return cls(stages)
+
+    @staticmethod
+    def _rule_ops(rule: Dict) -> List[Tuple]:
+        """Flatten a rule into ('literal'|'regex'|'constant', ...) operations"""
+        rule_type = rule['type']
+
+        if rule_type == 'simple':
+            return [('literal', rule['original'], rule['replacement'])]
+        elif rule_type == 'regex':
+            return [('regex', re.compile(rule['pattern'], re.IGNORECASE), rule['replacement'])]
+        elif rule_type == 'full_text':
+            return [('constant', rule['replacement'])]
+        elif rule_type == 'all_in_one':
+            ops = []
+            for replacement in rule['replacements']:
+                rep_type = replacement['type']
+                if rep_type == 'simple':
+                    ops.append(('literal', replacement['original'], replacement['replacement']))
+                elif rep_type == 'url':
+                    ops.append(('literal', replacement['tag'], replacement['replacement']))
+                elif rep_type == 'regex':
+                    ops.append(('regex', re.compile(replacement['pattern'], re.IGNORECASE), replacement['replacement']))
+            return ops
+
+        return []
+
+    @staticmethod
+    def _build_steps(ops: List[Tuple]) -> List[Step]:
+        """Turn operations into step functions, merging literal runs"""
+        steps = []
+        group = None
+
+        for op in ops:
+            if op[0] == 'literal':
+                _, original, replacement = op
+                if group is not None and group.accepts(original, replacement):
+                    group.pairs.append((original, replacement))
+                    continue
+                if group is not None:
+                    steps.append(group.build())
+                group = LiteralGroup()
+                group.pairs.append((original, replacement))
+                continue
+
+            if group is not None:
+                steps.append(group.build())
+                group = None
+
+            if op[0] == 'regex':
+                _, pattern, replacement = op
+                steps.append(lambda text, pattern=pattern, replacement=replacement: pattern.sub(replacement, text))
+            elif op[0] == 'constant':
+                steps.append(lambda text, value=op[1]: value)
+
+        if group is not None:
+            steps.append(group.build())
+
+        return steps
+
+    def apply(self, text: str, budget: Optional[float] = None, slow: Optional[List] = None) -> str:
+        """Run text through every stage.
+
+        With a budget, each regex stage is timed and (label, seconds) is
+        appended to slow for every one that took longer. Where a timer signal
+        can be used, a regex stage still running when the budget is up is
+        interrupted (re checks for signals while matching) and leaves the
+        text as it was; elsewhere it is only measured once it finishes.
+        """
+        global _stage_running
+        interrupt = budget is not None and slow is not None and self.timed and _can_interrupt()
+        previous_handler = signal.signal(signal.SIGALRM, _interrupt_stage) if interrupt else None
+        try:
+            for stage in self.stages:
+                timed = budget is not None and stage.timed
+                start = time.perf_counter() if timed else None
+                try:
+                    if timed and interrupt:
+                        # Re-arming replaces the previous stage's timer; a late
+                        # signal outside a timed stage is ignored
+                        signal.setitimer(signal.ITIMER_REAL, budget)
+                        _stage_running = True
+                    try:
+                        result = text
+                        for step in stage.steps:
+                            result = step(result)
+                    finally:
+                        _stage_running = False
+                    text = result
+                except StageTimeout:
+                    logger.error(f"Interrupted replacement rule {stage.label} after {budget}s")
+                except Exception as e:
+                    logger.error(f"Error applying replacement rule {stage.label}: {e}")
+
+                if start is not None:
+                    elapsed = time.perf_counter() - start
+                    if elapsed > budget and slow is not None:
+                        slow.append((stage.label, elapsed))
+        finally:
+            if interrupt:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler)
+
+        return text
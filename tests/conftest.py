@@ -0,0 +1,32 @@
+"""
+Test Fixtures
+Puts the repository modules on the path and builds userbots around the fake client
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot_manager import TelegramUserbot
+from fake_client import FakeTelegramClient
+
+@pytest.fixture
+def make_userbot(tmp_path, monkeypatch):
+    """Factory for started userbots whose stores live in a temporary directory"""
+    monkeypatch.chdir(tmp_path)
+
+    async def make(client=None, **settings):
+        userbot = TelegramUserbot(0, '', client=client or FakeTelegramClient())
+        await userbot.config_manager.set_setting('metrics_port', 0)
+        await userbot.config_manager.set_setting('edit_debounce_window', 0)
+        for key in ('account_rate', 'destination_rate'):
+            await userbot.config_manager.set_setting(key, 1e6)
+        for key, value in settings.items():
+            await userbot.config_manager.set_setting(key, value)
+        await userbot.start()
+        return userbot
+
+    return make
@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+from config_manager import ConfigManager
+from config_oplog import OpLogStore
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def open_config(path):
+    config_manager = ConfigManager(path, storage='oplog')
+    await config_manager.load_config()
+    return config_manager
+
+def test_changes_survive_a_reload(tmp_path):
+    path = str(tmp_path / 'config.json')
+
+    async def scenario():
+        config_manager = await open_config(path)
+        await config_manager.set_setting('a', 1)
+        await config_manager.set_setting('b', 2)
+        await config_manager.set_setting('a', 3)
+        await config_manager.flush()
+        return (await open_config(path)).config['settings']
+
+    assert run(scenario()) == {'a': 3, 'b': 2}
+
+def test_compaction_keeps_records_after_the_snapshot(tmp_path):
+    store = OpLogStore(str(tmp_path / 'config.json'))
+    store.append([
+        OpLogStore.encode(1, 'put', 'settings', 'a', 1),
+        OpLogStore.encode(2, 'put', 'settings', 'b', 2),
+    ])
+    store.compact({'settings': {'a': 1}}, 1)
+
+    with open(store.log_file, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
+    config, seq = store.load()
+    assert config['settings'] == {'a': 1, 'b': 2}
+    assert seq == 2
+
+def test_torn_last_line_is_cut_before_appending(tmp_path):
+    path = str(tmp_path / 'config.json')
+
+    async def scenario():
+        config_manager = await open_config(path)
+        await config_manager.set_setting('a', 1)
+        await config_manager.flush()
+        with open(f"{path}.log", 'a', encoding='utf-8') as f:
+            f.write('{"seq": 2, "op": "put", "sec')
+
+        config_manager = await open_config(path)
+        await config_manager.set_setting('b', 2)
+        await config_manager.flush()
+        return (await open_config(path)).config['settings']
+
+    assert run(scenario()) == {'a': 1, 'b': 2}
+    assert os.path.getsize(f"{path}.log") > 0
@@ -0,0 +1,42 @@
+import time
+from types import SimpleNamespace
+
+from dedup_window import DedupWindow, fingerprint
+
+def message(text='', photo_id=None):
+    photo = SimpleNamespace(id=photo_id) if photo_id is not None else None
+    return SimpleNamespace(text=text, photo=photo, document=None)
+
+def test_fingerprint_ignores_case_and_whitespace():
+    assert fingerprint([message('Big  News\n')]) == fingerprint([message('big news')])
+    assert fingerprint([message('big news')]) != fingerprint([message('other news')])
+
+def test_fingerprint_covers_media_and_album_parts():
+    assert fingerprint([message(photo_id=1)]) != fingerprint([message(photo_id=2)])
+    assert fingerprint([message('a'), message('b')]) != fingerprint([message('a')])
+    assert fingerprint([message()]) is None
+
+def test_reposts_inside_the_window_are_seen():
+    window = DedupWindow(60)
+    assert not window.seen(1)
+    assert window.seen(1)
+    assert not window.seen(2)
+    assert window.suppressed == 1
+
+def test_fingerprints_expire_after_two_windows(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    window = DedupWindow(10)
+    window.seen(1)
+
+    now[0] += 15
+    assert window.seen(1)  # still in the previous generation
+    now[0] += 25
+    assert not window.seen(1)
+
+def test_size_cap_rotates_generations():
+    window = DedupWindow(3600, max_entries=4)
+    for key in range(6):
+        window.seen(key)
+    assert len(window) <= 4
+    assert not window.seen(0)
@@ -0,0 +1,56 @@
+import asyncio
+
+from delivery_queue import DeliveryQueue, MAX_DELIVERY_ATTEMPTS
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_only_unfinished_deliveries_are_loaded(tmp_path):
+    async def scenario():
+        queue = DeliveryQueue(str(tmp_path / 'queue.db'))
+        await queue.open()
+        await queue.put([
+            (-100, 1, '1', 'rule', -200, 0.0),
+            (-100, 1, '1', 'rule', -300, 0.0),
+            (-100, 2, '2,3', 'rule', -200, 0.0),
+        ])
+        queue.complete(-100, 1, 'rule', [-200])
+        queue.fail(-100, 2, 'rule', [-200])
+        await queue.close()
+
+        queue = DeliveryQueue(str(tmp_path / 'queue.db'))
+        await queue.open()
+        pending = await queue.load_pending()
+        await queue.close()
+        return pending
+
+    assert run(scenario()) == [(-100, 1, '1', 'rule', -300, 0.0)]
+
+def test_deliveries_are_given_up_after_max_attempts(tmp_path):
+    async def scenario():
+        queue = DeliveryQueue(str(tmp_path / 'queue.db'))
+        await queue.open()
+        await queue.put([(-100, 1, '1', 'rule', -200, 0.0)])
+        loads = [len(await queue.load_pending()) for _ in range(MAX_DELIVERY_ATTEMPTS + 1)]
+        await queue.close()
+        return loads
+
+    assert run(scenario()) == [1] * MAX_DELIVERY_ATTEMPTS + [0]
+
+def test_source_positions_only_move_forward(tmp_path):
+    async def scenario():
+        queue = DeliveryQueue(str(tmp_path / 'queue.db'))
+        await queue.open()
+        queue.advance(-100, 5)
+        queue.advance(-100, 3)
+        await queue.put([(-100, 5, '5', 'rule', -200, 0.0)])
+        queue.advance(-100, 2)
+        await queue.close()
+
+        queue = DeliveryQueue(str(tmp_path / 'queue.db'))
+        await queue.open()
+        positions = await queue.load_positions()
+        await queue.close()
+        return positions
+
+    assert run(scenario()) == {-100: 5}
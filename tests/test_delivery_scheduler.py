@@ -0,0 +1,100 @@
+import asyncio
+
+from delivery_scheduler import DeliveryScheduler
+
+def run(coro):
+    return asyncio.run(coro)
+
+def make_scheduler():
+    delivered = []
+
+    async def deliver(key, item):
+        delivered.append((key, item))
+
+    return DeliveryScheduler(deliver), delivered
+
+def test_items_are_delivered_in_order_after_their_delay():
+    async def scenario():
+        scheduler, delivered = make_scheduler()
+        scheduler.start()
+        for item in range(3):
+            scheduler.schedule('rule', 0.05, item)
+        await asyncio.sleep(0.01)
+        assert delivered == []
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return delivered
+
+    assert run(scenario()) == [('rule', 0), ('rule', 1), ('rule', 2)]
+
+def test_older_item_goes_before_newer_ones():
+    async def scenario():
+        scheduler, delivered = make_scheduler()
+        scheduler.start()
+        now = asyncio.get_running_loop().time()
+        scheduler.schedule('rule', 0.05, 'new')
+        scheduler.schedule('rule', 0.05, 'replayed', enqueued_at=now - 1)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return delivered
+
+    assert run(scenario()) == [('rule', 'replayed'), ('rule', 'new')]
+
+def test_set_delay_applies_to_waiting_items():
+    async def scenario():
+        scheduler, delivered = make_scheduler()
+        scheduler.start()
+        scheduler.schedule('rule', 60, 'waiting')
+        scheduler.set_delay('rule', 0)
+        await asyncio.sleep(0.02)
+        await scheduler.stop()
+        return delivered
+
+    assert run(scenario()) == [('rule', 'waiting')]
+
+def test_has_pending_until_delivery_starts():
+    async def scenario():
+        scheduler, _ = make_scheduler()
+        scheduler.start()
+        scheduler.schedule('rule', 0.01, 'item')
+        assert scheduler.has_pending('rule')
+        assert not scheduler.has_pending('other')
+        await asyncio.sleep(0.05)
+        assert not scheduler.has_pending('rule')
+        await scheduler.stop()
+
+    run(scenario())
+
+def test_cancel_drops_queued_items():
+    async def scenario():
+        scheduler, delivered = make_scheduler()
+        scheduler.start()
+        scheduler.schedule('rule', 0.01, 'item')
+        assert scheduler.cancel('rule') == 1
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        return delivered, scheduler.pending_count
+
+    assert run(scenario()) == ([], 0)
+
+def test_drain_waits_for_running_deliveries():
+    async def scenario():
+        finished = []
+
+        async def deliver(key, item):
+            await asyncio.sleep(item)
+            finished.append(item)
+
+        scheduler = DeliveryScheduler(deliver)
+        scheduler.start()
+        scheduler.schedule('rule', 0, 0.05)
+        scheduler.schedule('other', 0, 10)
+        await asyncio.sleep(0.01)
+        await scheduler.stop()
+        cancelled = await scheduler.drain(0.2)
+        return finished, cancelled, scheduler.delivery_tasks
+
+    finished, cancelled, tasks = run(scenario())
+    assert finished == [0.05]
+    assert cancelled == 1
+    assert not tasks
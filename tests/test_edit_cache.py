@@ -0,0 +1,52 @@
+import time
+
+from edit_cache import EditCache
+
+def test_each_rule_keeps_its_own_copies_and_send_time():
+    cache = EditCache()
+    cache.add((1, 10), 'fast', 60, [(-100, 5, 'listener')], timestamp=1000.0)
+    cache.add((1, 10), 'slow', 600, [(-200, 7, 'listener')], timestamp=1050.0)
+
+    entry = cache.entries[(1, 10)]
+    assert entry.forwarded == {'fast': [(-100, 5, 'listener')], 'slow': [(-200, 7, 'listener')]}
+    assert entry.timestamps == {'fast': 1000.0, 'slow': 1050.0}
+    assert entry.deadline == 1650.0
+
+    entry.drop_rule('fast')
+    assert list(entry.forwarded) == ['slow']
+
+def test_get_misses_expired_entries():
+    cache = EditCache()
+    cache.add((1, 10), 'rule', 60, [(-100, 5, None)], timestamp=time.time() - 120)
+    cache.add((1, 11), 'rule', 60, [(-100, 6, None)])
+
+    assert cache.get((1, 10)) is None
+    assert cache.get((1, 11)) is not None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_sweep_drops_expired_entries():
+    cache = EditCache()
+    cache.add((1, 10), 'rule', 60, [(-100, 5, None)], timestamp=time.time() - 120)
+    cache.add((1, 11), 'rule', 60, [(-100, 6, None)])
+
+    assert cache.sweep() == 1
+    assert (1, 10) not in cache and (1, 11) in cache
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EditCache(max_entries=2)
+    cache.add((1, 1), 'rule', 60, [])
+    cache.add((1, 2), 'rule', 60, [])
+    cache.get((1, 1))
+    cache.add((1, 3), 'rule', 60, [])
+
+    assert (1, 2) not in cache
+    assert (1, 1) in cache and (1, 3) in cache
+    assert cache.evictions == 1
+
+def test_text_shown_by_copies_is_tracked():
+    cache = EditCache()
+    cache.add((1, 10), 'rule', 60, [(-100, 5, None)], text='hello')
+    entry = cache.get((1, 10))
+
+    assert entry.shows(-100, 5, 'hello')
+    assert not entry.shows(-100, 5, 'hello again')
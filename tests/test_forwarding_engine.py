@@ -0,0 +1,281 @@
+import asyncio
+
+from fake_client import FakeTelegramClient
+
+SOURCE = -1001000000001
+DESTINATION = -1002000000001
+OTHER_DESTINATION = -1002000000002
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def settle(client, seconds=0.05):
+    """Let handlers and the sends they started finish"""
+    await client.wait_idle()
+    await asyncio.sleep(seconds)
+    await client.wait_idle()
+
+def texts_sent(client, chat_id, kind=None):
+    return [
+        record.text for record in client.sent
+        if record.chat_id == chat_id and (kind is None or record.kind == kind) and record.kind != 'edit'
+    ]
+
+def edits_sent(client, since=0):
+    return sorted((record.chat_id, record.text) for record in client.sent[since:] if record.kind == 'edit')
+
+def test_messages_reach_every_destination_in_order(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient(latency=0.002, jitter=0.004)
+        userbot = await make_userbot(client)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION, OTHER_DESTINATION])
+        for n in range(20):
+            client.emit_new_message(SOURCE, f"m{n}")
+        await settle(client, 0.2)
+        await userbot.stop()
+        return client
+
+    client = run(scenario())
+    expected = [f"m{n}" for n in range(20)]
+    assert texts_sent(client, DESTINATION) == expected
+    assert texts_sent(client, OTHER_DESTINATION) == expected
+
+def test_edits_follow_each_rules_own_edit_window(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        engine = userbot.forwarding_engine
+        await engine.add_forwarding_rule('short', [SOURCE], [DESTINATION])
+        await engine.add_forwarding_rule('long', [SOURCE], [OTHER_DESTINATION])
+        await engine.set_max_edit_time('short', 1)
+        message = client.emit_new_message(SOURCE, 'hello')
+        await settle(client)
+
+        await asyncio.sleep(1.1)
+        client.emit_edit(message, 'hello again')
+        await settle(client)
+        await userbot.stop()
+        return client
+
+    assert edits_sent(run(scenario())) == [(OTHER_DESTINATION, 'hello again')]
+
+def test_edits_restored_from_the_store_cover_every_rule(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        engine = userbot.forwarding_engine
+        await engine.add_forwarding_rule('first', [SOURCE], [DESTINATION])
+        await engine.add_forwarding_rule('second', [SOURCE], [OTHER_DESTINATION])
+        message = client.emit_new_message(SOURCE, 'hello')
+        await settle(client)
+
+        engine.message_cache.discard((SOURCE, message.id))
+        client.emit_edit(message, 'hello again')
+        await settle(client)
+        both = edits_sent(client)
+        sent_before = len(client.sent)
+
+        engine.message_cache.discard((SOURCE, message.id))
+        await engine.remove_forwarding_rule('first')
+        client.emit_edit(message, 'hello once more')
+        await settle(client)
+        await userbot.stop()
+        return both, edits_sent(client, sent_before)
+
+    both, after_removal = run(scenario())
+    assert both == sorted([(DESTINATION, 'hello again'), (OTHER_DESTINATION, 'hello again')])
+    assert after_removal == [(OTHER_DESTINATION, 'hello once more')]
+
+def test_messages_stay_in_order_when_the_delay_is_cut_to_zero(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient(latency=0.002)
+        userbot = await make_userbot(client)
+        engine = userbot.forwarding_engine
+        await engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        await engine.set_forwarding_delay('rule', 30)
+        for n in range(3):
+            client.emit_new_message(SOURCE, f"delayed{n}")
+        await settle(client)
+
+        await engine.set_forwarding_delay('rule', 0)
+        for n in range(3):
+            client.emit_new_message(SOURCE, f"live{n}")
+        await settle(client, 0.2)
+        await userbot.stop()
+        return client
+
+    assert texts_sent(run(scenario()), DESTINATION) == ['delayed0', 'delayed1', 'delayed2', 'live0', 'live1', 'live2']
+
+def test_restart_keeps_flood_wait_pauses(make_userbot):
+    async def scenario():
+        userbot = await make_userbot()
+        engine = userbot.forwarding_engine
+        limiter = engine.client_pool.listener.rate_limiter
+        limiter._destination_bucket(DESTINATION).pause(30)
+        await userbot.config_manager.set_setting('destination_rate', 2.0)
+        await engine.restart()
+        kept = engine.client_pool.listener.rate_limiter
+        await userbot.stop()
+        return limiter, kept
+
+    limiter, kept = run(scenario())
+    assert kept is limiter
+    assert limiter.paused_for(DESTINATION) > 29
+    assert limiter.destination_rate == 2.0
+
+async def pending_deliveries(userbot):
+    """Deliveries the queue would replay on the next start"""
+    queue = userbot.forwarding_engine.delivery_queue
+    # Closing writes the done markers nobody waits for
+    await queue.close()
+    await queue.open()
+    return await queue.load_pending()
+
+def test_replayed_album_without_its_first_part_is_settled(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        await userbot.forwarding_engine.set_forwarding_delay('rule', 30)
+        parts = [client.emit_new_message(SOURCE, f"part{n}", grouped_id=77) for n in range(3)]
+        await asyncio.sleep(1.5)
+        await settle(client)
+        await userbot.stop()
+
+        # The first part is deleted while the userbot is down
+        replay_client = FakeTelegramClient()
+        replay_client.messages = dict(client.messages)
+        del replay_client.messages[(SOURCE, parts[0].id)]
+        userbot = await make_userbot(replay_client)
+        await userbot.forwarding_engine.set_forwarding_delay('rule', 0)
+        await settle(replay_client, 0.2)
+        pending = await pending_deliveries(userbot)
+        await userbot.stop()
+        return replay_client, pending
+
+    client, pending = run(scenario())
+    assert texts_sent(client, DESTINATION) == ['part1', 'part2']
+    assert pending == []
+
+def test_shutdown_lets_delayed_sends_settle(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient(latency=0.3)
+        userbot = await make_userbot(client)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        await userbot.forwarding_engine.set_forwarding_delay('rule', 0.05)
+        client.emit_new_message(SOURCE, 'in flight')
+        await settle(client, 0.15)
+        await userbot.stop()
+
+        replay_client = FakeTelegramClient()
+        replay_client.messages = dict(client.messages)
+        userbot = await make_userbot(replay_client)
+        await settle(replay_client, 0.2)
+        await userbot.stop()
+        return client, replay_client
+
+    client, replay_client = run(scenario())
+    assert texts_sent(client, DESTINATION) == ['in flight']
+    assert replay_client.sent == []
+
+def test_failed_sends_are_given_up_and_counted(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        send_message = client.send_message
+
+        async def failing_send(entity, *args, **kwargs):
+            if client._chat_id(entity) == OTHER_DESTINATION:
+                raise ValueError('chat write forbidden')
+            return await send_message(entity, *args, **kwargs)
+
+        client.send_message = failing_send
+        userbot = await make_userbot(client)
+        engine = userbot.forwarding_engine
+        await engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION, OTHER_DESTINATION])
+        failed_before = engine.delivery_queue.get_stats()['failed']
+        client.emit_new_message(SOURCE, 'hello')
+        await settle(client)
+        failed = engine.delivery_queue.get_stats()['failed'] - failed_before
+        pending = await pending_deliveries(userbot)
+        await userbot.stop()
+        return client, failed, pending
+
+    client, failed, pending = run(scenario())
+    assert texts_sent(client, DESTINATION) == ['hello']
+    assert failed == 1
+    assert pending == []
+
+def test_live_messages_wait_for_catch_up(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        client.emit_new_message(SOURCE, 'before')
+        await settle(client)
+        await userbot.stop()
+
+        # Posted while the userbot was down
+        restarted = FakeTelegramClient(latency=0.002)
+        restarted.messages = dict(client.messages)
+        restarted.message_ids = client.message_ids
+        for n in range(150):
+            restarted.new_message(SOURCE, f"missed{n}")
+        userbot = await make_userbot(restarted)
+        restarted.emit_new_message(SOURCE, 'live')
+        engine = userbot.forwarding_engine
+        while not engine.catch_up_task.done():
+            await asyncio.sleep(0.02)
+        await settle(restarted)
+        await userbot.stop()
+        return restarted
+
+    assert texts_sent(run(scenario()), DESTINATION) == [f"missed{n}" for n in range(150)] + ['live']
+
+def test_reposts_are_dropped_within_the_dedup_window(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        await userbot.forwarding_engine.set_dedup_window('rule', 60)
+        for text in ('news', 'other', 'NEWS ', 'news'):
+            client.emit_new_message(SOURCE, text)
+            await settle(client)
+        await userbot.stop()
+        return client
+
+    assert texts_sent(run(scenario()), DESTINATION) == ['news', 'other']
+
+def test_edits_share_the_rate_limit_of_the_marked_destination(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client)
+        # Written without the -100 prefix, as users often do
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [-2000000001])
+        message = client.emit_new_message(SOURCE, 'hello')
+        await settle(client)
+        client.emit_edit(message, 'hello again')
+        await settle(client)
+        await userbot.stop()
+        return client, set(userbot.forwarding_engine.client_pool.listener.rate_limiter.destination_buckets)
+
+    client, buckets = run(scenario())
+    assert edits_sent(client) == [(DESTINATION, 'hello again')]
+    assert buckets == {DESTINATION}
+
+def test_bursts_of_edits_are_coalesced_and_no_op_edits_skipped(make_userbot):
+    async def scenario():
+        client = FakeTelegramClient()
+        userbot = await make_userbot(client, edit_debounce_window=0.1)
+        await userbot.forwarding_engine.add_forwarding_rule('rule', [SOURCE], [DESTINATION])
+        message = client.emit_new_message(SOURCE, 'hello')
+        await settle(client)
+        for n in range(5):
+            client.emit_edit(message, f"hello v{n}")
+            await asyncio.sleep(0.01)
+        await settle(client, 0.3)
+        client.emit_edit(message, 'hello v4')
+        await settle(client, 0.3)
+        await userbot.stop()
+        return client
+
+    assert edits_sent(run(scenario())) == [(DESTINATION, 'hello v4')]
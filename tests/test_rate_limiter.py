@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from telethon.errors import FloodWaitError
+
+from rate_limiter import RateLimiter, TokenBucket
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_bucket_paces_calls_after_the_burst():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two calls ride the burst, the other two wait 1/50s each
+    assert 0.03 <= run(scenario()) < 0.5
+
+def test_flood_wait_pauses_the_destination_and_retries():
+    async def scenario():
+        limiter = RateLimiter(destination_rate=1e6, destination_burst=10, account_rate=1e6, account_burst=10)
+        calls = []
+
+        async def send():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise FloodWaitError(request=None, capture=1)
+            return 'sent'
+
+        result = await limiter.call(-100, send)
+        return result, calls, limiter
+
+    result, calls, limiter = run(scenario())
+    assert result == 'sent'
+    assert calls[1] - calls[0] >= 0.9
+    assert limiter.flood_waits == 1
+    assert limiter.destination_buckets[-100].paused_until > 0
+
+def test_try_call_raises_the_flood_wait():
+    async def scenario():
+        limiter = RateLimiter()
+
+        async def send():
+            raise FloodWaitError(request=None, capture=30)
+
+        try:
+            await limiter.try_call(-100, send)
+        except FloodWaitError:
+            return limiter.paused_for(-100), limiter.paused_for(-200)
+
+    paused, other = run(scenario())
+    assert 29 < paused <= 30
+    assert other == 0.0
+
+def test_update_keeps_flood_wait_pauses():
+    limiter = RateLimiter()
+    limiter._destination_bucket(-100).pause(30)
+    limiter.update(destination_rate=5.0, destination_burst=2, account_rate=10.0, account_burst=3)
+
+    bucket = limiter.destination_buckets[-100]
+    assert limiter.paused_for(-100) > 29
+    assert (bucket.rate, bucket.capacity, bucket.tokens) == (5.0, 2, 2)
+    assert (limiter.account_bucket.rate, limiter.account_bucket.capacity) == (10.0, 3)
+    assert limiter._destination_bucket(-200).rate == 5.0
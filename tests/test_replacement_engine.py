@@ -0,0 +1,59 @@
+import asyncio
+
+import replacement_engine
+from config_manager import ConfigManager
+from replacement_engine import ReplacementEngine
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_stored_patterns_are_checked_once(tmp_path, monkeypatch):
+    checked = []
+    real_preflight = replacement_engine.preflight
+
+    async def counting_preflight(pattern, budget):
+        checked.append(pattern)
+        return await real_preflight(pattern, budget)
+
+    monkeypatch.setattr(replacement_engine, 'preflight', counting_preflight)
+
+    async def scenario():
+        config_manager = ConfigManager(str(tmp_path / 'config.json'))
+        engine = ReplacementEngine(config_manager)
+        await engine.start()
+        await engine.add_replacement_rule('tags_regex', r'#\w+', '')
+        await engine.stop()
+
+        # Restarting with the same pattern and budget checks nothing
+        engine = ReplacementEngine(config_manager)
+        await engine.start()
+        await engine.stop()
+        checked_after_restart = list(checked)
+
+        # A new budget invalidates the earlier result
+        await config_manager.set_setting('regex_time_budget', 0.5)
+        engine = ReplacementEngine(config_manager)
+        await engine.start()
+        processed = await engine.process_text('news #ad')
+        await engine.stop()
+        return checked_after_restart, processed
+
+    checked_after_restart, processed = run(scenario())
+    assert checked_after_restart == [r'#\w+']
+    assert checked == [r'#\w+', r'#\w+']
+    assert processed == 'news '
+
+def test_slow_pattern_is_rejected(tmp_path):
+    async def scenario():
+        engine = ReplacementEngine(ConfigManager(str(tmp_path / 'config.json')))
+        await engine.start()
+        try:
+            await engine.add_replacement_rule('slow_regex', r'(a+)+$', '')
+        except ValueError as e:
+            return str(e), engine.replacement_rules
+        finally:
+            await engine.stop()
+
+    error, rules = run(scenario())
+    assert 'rejected' in error
+    assert rules == {}
@@ -0,0 +1,62 @@
+import asyncio
+import random
+import time
+
+from replacement_engine import ReplacementEngine
+from replacement_pipeline import ReplacementPipeline
+
+def sequential(rules, text):
+    """Apply rules one by one the way the engine did before compiling"""
+    engine = ReplacementEngine(None)
+
+    async def apply():
+        result = text
+        for rule in rules:
+            result = await engine._apply_rule(result, rule)
+        return result
+
+    return asyncio.run(apply())
+
+def simple(label, original, replacement):
+    return {'label': label, 'type': 'simple', 'original': original, 'replacement': replacement, 'active': True}
+
+def test_compiled_rules_match_sequential_replacement():
+    rng = random.Random(7)
+    words = ['@a', '@ab', 'ab', 'b@', 'x', '', 'yz', '@yz']
+    for _ in range(200):
+        rules = [
+            simple(f"r{i}", rng.choice(words), rng.choice(words + ['@new']))
+            for i in range(rng.randint(1, 6))
+        ]
+        if rng.random() < 0.3:
+            rules.insert(rng.randrange(len(rules) + 1), {
+                'label': 'rx', 'type': 'regex', 'pattern': r'@\w+', 'replacement': '@rx', 'active': True
+            })
+        text = ' '.join(rng.choice(words) for _ in range(12))
+        assert ReplacementPipeline.compile(rules).apply(text) == sequential(rules, text), (rules, text)
+
+def test_inactive_and_broken_rules_are_skipped():
+    rules = [
+        simple('on', 'a', 'b'),
+        dict(simple('off', 'b', 'c'), active=False),
+        {'label': 'broken', 'type': 'regex', 'pattern': '(', 'replacement': '', 'active': True},
+    ]
+    assert ReplacementPipeline.compile(rules).apply('aaa') == 'bbb'
+
+def test_compiling_many_literals_stays_fast():
+    rules = [simple(f"r{i}", f"@word{i}", f"@other{i}") for i in range(3000)]
+    start = time.perf_counter()
+    pipeline = ReplacementPipeline.compile(rules)
+    assert time.perf_counter() - start < 5
+    assert pipeline.apply('see @word2999 and @word0') == 'see @other2999 and @other0'
+
+def test_slow_regex_stage_is_reported_and_interrupted():
+    rules = [
+        simple('literal', 'x', 'y'),
+        {'label': 'slow', 'type': 'regex', 'pattern': r'(a+)+$', 'replacement': '', 'active': True},
+    ]
+    slow = []
+    text = 'x' + 'a' * 40 + 'b'
+    result = ReplacementPipeline.compile(rules).apply(text, budget=0.05, slow=slow)
+    assert result == 'y' + 'a' * 40 + 'b'
+    assert [label for label, _ in slow] == ['slow']
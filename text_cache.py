@@ -0,0 +1,70 @@
+"""
+Text Cache
+Memoizes replacement results for texts that are processed more than once
+"""
+
+import logging
+import sys
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+class TextCache:
+    """LRU map of (ruleset_version, text) -> processed text, capped in bytes"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[Tuple[int, str], Tuple[str, int]]' = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, version: int, text: str) -> Optional[str]:
+        """Get the processed text for this ruleset version, if cached"""
+        entry = self.entries.get((version, text))
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end((version, text))
+        return entry[0]
+
+    def put(self, version: int, text: str, result: str):
+        """Cache a processed text, evicting the least recently used"""
+        key = (version, text)
+        size = sys.getsizeof(text) + (sys.getsizeof(result) if result is not text else 0)
+        if size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= old[1]
+
+        self.entries[key] = (result, size)
+        self.size_bytes += size
+
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached result"""
+        self.entries.clear()
+        self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        return {
+            'size': len(self.entries),
+            'size_bytes': self.size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,142 @@
+"""
+Text Offload
+Runs replacement of long texts in worker processes to keep the event loop free
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from replacement_pipeline import ReplacementPipeline
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_CHARS = 4000
+
+# Per worker process: the pipeline compiled from the last snapshot it saw
+_worker_version = None
+_worker_pipeline = None
+
+def _load_rules(version: int, snapshot: bytes):
+    """Compile a ruleset snapshot; also the pool initializer (worker process)"""
+    global _worker_version, _worker_pipeline
+    _worker_pipeline = ReplacementPipeline.compile(pickle.loads(snapshot))
+    _worker_version = version
+
+def _process_in_worker(version: int, text: str, budget: Optional[float] = None,
+                       snapshot: Optional[bytes] = None) -> Optional[Tuple[str, List]]:
+    """Apply the pipeline for version to text; None if this worker needs the snapshot (worker process)"""
+    if version != _worker_version:
+        if snapshot is None:
+            return None
+        _load_rules(version, snapshot)
+    slow = []
+    return _worker_pipeline.apply(text, budget, slow), slow
+
+class TextOffloader:
+    """Chooses between the inline pipeline and a process pool per text.
+
+    Workers start with the current ruleset and keep a compiled pipeline.
+    A job carries only the ruleset version and the text; a worker that
+    still has an older version answers None and the job is sent again
+    with the pickled rules, so each worker receives each snapshot once.
+    Texts shorter than min_chars, and every text while no pool is running,
+    use the caller's pipeline inline.
+    """
+
+    def __init__(self):
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.workers = 0
+        self.min_chars = DEFAULT_MIN_CHARS
+        self.version = 0
+        self.snapshot = pickle.dumps([])
+        self.inline_jobs = 0
+        self.offloaded_jobs = 0
+        self.inline_seconds = 0.0
+        self.offloaded_seconds = 0.0
+        self.fallbacks = 0
+
+    async def start(self, workers: int, min_chars: int = DEFAULT_MIN_CHARS):
+        """Start the worker processes; 0 workers keeps everything inline"""
+        await self.stop()
+        self.workers = workers
+        self.min_chars = min_chars
+        if workers <= 0:
+            return
+
+        # Forking a process that runs an event loop and client threads is unsafe
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_load_rules,
+            initargs=(self.version, self.snapshot)
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _process_in_worker, self.version, '', None, self.snapshot)
+            for _ in range(workers)
+        ))
+        logger.info(f"Started {workers} text processing workers for texts of {min_chars}+ characters")
+
+    async def stop(self):
+        """Shut the worker processes down"""
+        if self.executor is None:
+            return
+        executor, self.executor = self.executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    def set_rules(self, version: int, rules: List[Dict]):
+        """Snapshot the rules workers should use for a ruleset version"""
+        self.version = version
+        self.snapshot = pickle.dumps(list(rules))
+
+    async def apply(self, pipeline: ReplacementPipeline, version: int, text: str,
+                    budget: Optional[float] = None) -> Tuple[str, List]:
+        """Process text inline or in a worker, depending on its length; returns (text, slow stages)"""
+        start = time.perf_counter()
+
+        if self.executor is not None and len(text) >= self.min_chars and version == self.version:
+            executor = self.executor
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(executor, _process_in_worker, version, text, budget)
+                if result is None:
+                    # That worker has older rules; send them along this once
+                    result = await loop.run_in_executor(
+                        executor, _process_in_worker, version, text, budget, self.snapshot
+                    )
+                self.offloaded_jobs += 1
+                self.offloaded_seconds += time.perf_counter() - start
+                return result
+            except BrokenProcessPool:
+                self.fallbacks += 1
+                if self.executor is executor:
+                    logger.error("Text processing workers died, restarting them")
+                    await self.start(self.workers, self.min_chars)
+            except Exception as e:
+                logger.error(f"Offloaded text processing failed, processing inline: {e}")
+                self.fallbacks += 1
+            start = time.perf_counter()
+
+        slow = []
+        result = pipeline.apply(text, budget, slow)
+        self.inline_jobs += 1
+        self.inline_seconds += time.perf_counter() - start
+        return result, slow
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get inline versus offloaded job statistics"""
+        return {
+            'workers': self.workers if self.executor is not None else 0,
+            'min_chars': self.min_chars,
+            'inline_jobs': self.inline_jobs,
+            'offloaded_jobs': self.offloaded_jobs,
+            'inline_seconds': round(self.inline_seconds, 3),
+            'offloaded_seconds': round(self.offloaded_seconds, 3),
+            'fallbacks': self.fallbacks,
+        }
@@ -0,0 +1,144 @@
+"""
+Update Dispatcher
+Classifies each incoming update once and routes it to commands or forwarding
+"""
+
+import logging
+import time
+from typing import Dict
+
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+COMMAND = 'command'
+FORWARDABLE = 'forwardable'
+EDIT = 'edit'
+IGNORED = 'ignored'
+CATEGORIES = (COMMAND, FORWARDABLE, EDIT, IGNORED)
+
+class HandlerLatency:
+    """Running count, total and worst handler time for one category"""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Record one handler run"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get latency statistics in milliseconds"""
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'total_ms': round(self.total * 1000, 3),
+        }
+
+class UpdateDispatcher:
+    """Single entry point for new and edited messages.
+
+    Every new message is classified once:
+    - command: starts with '/' and comes from an authorized peer, i.e. the
+      owner's Saved Messages or a user listed in the authorized_users setting
+    - forwardable: anything else from a chat that an active rule reads
+    - ignored: everything else
+    Messages that are neither possible commands nor from a source chat are
+    rejected by the event builder filter and counted as ignored there.
+    """
+
+    def __init__(self, client, command_handler, forwarding_engine, config_manager):
+        self.client = client
+        self.command_handler = command_handler
+        self.forwarding_engine = forwarding_engine
+        self.config_manager = config_manager
+        self.owner_id = None
+        self.counts = {category: 0 for category in CATEGORIES}
+        self.latency = {category: HandlerLatency() for category in CATEGORIES}
+
+    def register(self, client=None):
+        """Attach the dispatcher to a client"""
+        if client is not None:
+            self.client = client
+            self.owner_id = None
+        self.client.add_event_handler(self.dispatch_message, events.NewMessage(func=self.prefilter))
+        self.client.add_event_handler(self.dispatch_edit, events.MessageEdited(func=self.is_source))
+
+    def is_source(self, event) -> bool:
+        """Event filter: the chat is read by an active rule"""
+        return self.forwarding_engine.is_source_chat(event.chat_id)
+
+    def prefilter(self, event) -> bool:
+        """Event filter: the message could be a command or could be forwarded"""
+        text = event.message.message
+        if (text and text.startswith('/')) or self.forwarding_engine.is_source_chat(event.chat_id):
+            return True
+
+        self.counts[IGNORED] += 1
+        return False
+
+    async def classify(self, event) -> str:
+        """Classify a new message as command, forwardable or ignored"""
+        text = event.message.message
+        if text and text.startswith('/') and await self.is_authorized(event):
+            return COMMAND
+        if self.forwarding_engine.is_source_chat(event.chat_id):
+            return FORWARDABLE
+        return IGNORED
+
+    async def is_authorized(self, event) -> bool:
+        """Check whether a message comes from a peer allowed to send commands"""
+        if self.owner_id is None:
+            me = await self.client.get_me(input_peer=True)
+            self.owner_id = me.user_id
+
+        if event.out and event.chat_id == self.owner_id:
+            return True
+
+        authorized_users = await self.config_manager.get_setting('authorized_users', [])
+        return event.sender_id in authorized_users
+
+    async def dispatch_message(self, event):
+        """Handle a new message"""
+        start = time.perf_counter()
+        category = await self.classify(event)
+        self.counts[category] += 1
+
+        try:
+            if category == COMMAND:
+                await self.command_handler.handle_command(event)
+            elif category == FORWARDABLE:
+                await self.forwarding_engine.process_message(event)
+        except Exception as e:
+            logger.error(f"Error handling {category} message: {e}")
+            if category == COMMAND:
+                await event.reply(f"❌ Error: {e}")
+        finally:
+            self.latency[category].record(time.perf_counter() - start)
+
+    async def dispatch_edit(self, event):
+        """Handle an edited message from a source chat"""
+        start = time.perf_counter()
+        self.counts[EDIT] += 1
+
+        try:
+            await self.forwarding_engine.process_edited_message(event)
+        except Exception as e:
+            logger.error(f"Edited message processing error: {e}")
+        finally:
+            self.latency[EDIT].record(time.perf_counter() - start)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Get per-category counts and handler latency"""
+        return {
+            category: dict(self.latency[category].get_stats(), received=self.counts[category])
+            for category in CATEGORIES
+        }